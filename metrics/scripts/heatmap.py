@@ -2,134 +2,303 @@
 # Copyright (c) 2020 Performance Portability authors
 # SPDX-License-Identifier: MIT
 
-import argparse
-import csv
+import functools
+import math
+from pathlib import Path
+
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.axes_grid1 import make_axes_locatable
-
-# Argument parsing
-parser = argparse.ArgumentParser()
-parser.add_argument("input", help="CSV input file")
-parser.add_argument("output", help="PDF output file")
-parser.add_argument(
-    "--higher-is-better",
-    help="High numbers are better than low number (e.g. when plotting bandwidth)",
-    action="store_true")
-parser.add_argument(
-    "--factorize",
-    help="Divide all input results by this number",
-    action="store",
-    type=float,
-    default=1.0)
-parser.add_argument(
-    "--percent",
-    help="Input is in percent",
-    action="store_true")
-parser.add_argument(
-    "--mean",
-    help="Plot the mean and standard deviation against each column",
-    action="store_true")
-args = parser.parse_args()
-
-# Open the input .csv file
-data = csv.DictReader(open(args.input))
-
-# Get the list of headings from first row
-headings = data.fieldnames[1:]
-
-# Name of the series, what the rows in the CSV actually are
-series_key = data.fieldnames[0]
-
-
-series = []  # a row in the input file
-
-heatmap = []  # empty, to be populated by reading the input file
-labels = []  # labels to display in each heatmap entry
-
-for result in data:
-    def get(name):
-        str = result[name]
-        try:
-            return float(str)
-        except BaseException:
-            return str
-
-    def eff(a, b):
-        if isinstance(a, float) and isinstance(b, float):
-            return float(100.0 * (a / b))
-        elif a is '-' or b is '-':
-            return float(-100.0)
-        else:
-            return float(0.0)
 
-    raw = [get(h) for h in headings]
+import pp_data
+import pp_profile
+
+# matplotlib is imported by the functions that draw, so that -h and loading do not pay for it.
+
+
+# Beyond these sizes, cell labels are left out and tick labels thinned out
+MAX_LABELS = 2500
+MAX_TICKS = 100
+
+
+def load(filename):
+    """Load the results in filename (a csv file or results store reference, see pp_data.read_results) for a heatmap.
+    Returns (series, headings, values): the row and column names, and the results as a float array with NaN where there is none.
+    Rows without any results are dropped."""
+    import pandas
+    df = pp_data.read_results(filename)
+    headings = [str(h) for h in df.columns[1:]]
+    cells = df[df.columns[1:]]
+    values = cells.apply(pandas.to_numeric, errors='coerce').to_numpy(dtype=float)
+    keep = ~np.all(np.isnan(values), axis=1)
+    series = [str(s) for s in df[df.columns[0]][keep]]
+    return series, headings, values[keep]
+
+
+def cell_labels(values, factorize=1.0, percent=False, usetex=False):
+    """Labels of every cell of values: the value divided by factorize, to one decimal place below 100 (or as a percentage), or '-' where there is none."""
+    scaled = values / factorize
+    labels = np.full(values.shape, '-', dtype=object)
+    ok = ~np.isnan(values)
+    if percent:
+        fmt = '%.0f\\%%' if usetex else '%.0f%%'
+        labels[ok] = [fmt % v for v in scaled[ok]]
+    else:
+        labels[ok] = ['%.1f' % v if v < 100.0 else '%.0f' % v for v in scaled[ok]]
+    return labels
+
+
+def _thin(n, limit):
+    # Positions of every k-th of n ticks, so that at most limit are shown
+    step = max(1, math.ceil(n / limit))
+    return np.arange(0, n, step)
+
+
+@functools.lru_cache(maxsize=None)
+def _glyph_path_type():
+    # A Path that remembers its extents under each transform: a label is
+    # stamped with the same glyphs on every tile, and backends take the
+    # extents of every marker they draw, which Path.get_extents finds by
+    # solving for the extrema of every curve.
+    from matplotlib.path import Path
+
+    class GlyphPath(Path):
+        def get_extents(self, transform=None, **kwargs):
+            key = (None if transform is None else transform.get_matrix().tobytes(), tuple(sorted(kwargs.items())))
+            extents = self.__dict__.setdefault('_extents', {})
+            if key not in extents:
+                extents[key] = super().get_extents(transform, **kwargs)
+            return extents[key].frozen()
+
+    return GlyphPath
+
+
+@functools.lru_cache(maxsize=None)
+def _glyphs(label, prop):
+    # Outline of label in points, right-aligned and vertically centred on the
+    # origin. Extents are taken from the vertices, as Path.get_extents solves
+    # for the extrema of every curve, which is slow.
+    from matplotlib.textpath import TextPath
+    from matplotlib.transforms import Affine2D
+
+    digit = TextPath((0, 0), "0", prop=prop).vertices
+    path = TextPath((0, 0), label, prop=prop)
+    right = path.vertices[:, 0].max() if len(path.vertices) else 0.0
+    path = path.transformed(Affine2D().translate(-right, -(digit[:, 1].max() - digit[:, 1].min()) / 2))
+    return _glyph_path_type()(path.vertices, path.codes)
+
+
+def label_markers(ax, labels, fontsize='small', color='#b9c5bf'):
+    """Draw the text of every cell of labels right-aligned in its cell of axes ax, with the glyphs of each distinct label as the marker of one line.
+    One text artist per cell takes minutes for large grids; here each distinct label is laid out once, and backends store its glyphs once
+    and stamp them at every cell that shows it. Returns the lines."""
+    from matplotlib.font_manager import FontProperties
+    from matplotlib.lines import Line2D
+
+    prop = FontProperties(size=FontProperties(size=fontsize).get_size_in_points())
+    rows, cols = labels.shape
+    j, i = np.mgrid[0:rows, 0:cols]
+    offsets = np.column_stack([i.ravel() + 0.9, j.ravel() + 0.5])
+    distinct, which, counts = np.unique(labels.ravel().astype(str), return_inverse=True, return_counts=True)
+    groups = np.split(offsets[np.argsort(which, kind='stable')], np.cumsum(counts)[:-1])
+    lines = []
+    for label, cells in zip(distinct, groups):
+        glyphs = _glyphs(label, prop)
+        if len(glyphs.vertices) == 0:
+            continue
+        # Path markers are scaled to fit a markersize of 1 point, so this size keeps the glyphs in points
+        line = Line2D(cells[:, 0], cells[:, 1], linestyle='none', marker=glyphs,
+                      markersize=2 * np.max(np.abs(glyphs.vertices)), markerfacecolor=color,
+                      markeredgecolor='none', markeredgewidth=0)
+        ax.add_line(line)
+        lines.append(line)
+    return lines
+
+
+def draw(fig, series, headings, values, labels, higher_is_better=False, vmax=None,
+         max_labels=MAX_LABELS, max_ticks=MAX_TICKS):
+    """Draw a heatmap of values (rows series, columns headings) with cell labels on Figure fig, with one pcolormesh.
+    Cells without results are drawn as 0. Colours run from 0 to vmax (default: the largest value)."""
+    import matplotlib.pyplot as plt
 
-    # Skip over applications without any results
-    if not any([isinstance(x, float) for x in raw]):
-        continue
+    ax = fig.subplots()
+    rows, cols = values.shape
+    heat = np.where(np.isnan(values), 0.0, values)
 
-    series.append(result[series_key])
-    heatmap.append([r if isinstance(r, float) else 0.0 for r in raw])
+    # Set color map to match blackbody, growing brighter for higher values
+    colors = "gist_heat"
+    if not higher_is_better:
+        colors = colors + "_r"
+    big = rows * cols > max_labels
+    cmesh = ax.pcolormesh(
+        np.arange(cols + 1),
+        np.arange(rows + 1),
+        heat,
+        cmap=plt.get_cmap(colors),
+        edgecolors='none' if big else 'k',
+        vmin=1.0E-6,
+        vmax=vmax,
+        rasterized=big)
 
-    l = []
-    for i in range(len(raw)):
-        if not isinstance(raw[i], float):
-            l.append('-')
+    yticks = _thin(rows, max_ticks)
+    xticks = _thin(cols, max_ticks)
+    ax.set_yticks(yticks + 0.5, minor=False)
+    ax.set_xticks(xticks + 0.5, minor=False)
+    ax.set_yticklabels([series[i] for i in yticks])
+    names = []
+    for i in xticks:
+        heading = headings[i]
+        if plt.rcParams['text.usetex']:
+            heading = heading.replace('_', r'\_')
         else:
-            if args.percent:
-                if plt.rcParams['text.usetex']:
-                    l.append('%.0f\\%%' % (raw[i] / args.factorize))
-                else:
-                    l.append('%.0f%%' % (raw[i] / args.factorize))
+            heading = heading.replace(r"\%", "%")
+        names.append(heading)
+    ax.set_xticklabels(names, rotation=45, ha="right", rotation_mode="anchor")
+    ax.set_xlim(0, cols)
+    ax.set_ylim(rows, 0)
+
+    # Add colorbar
+    fig.colorbar(cmesh, ax=ax)
+
+    # Add labels
+    if not big:
+        label_markers(ax, labels)
+    return ax
+
+
+def tiles(rows, cols, tile_rows=0, tile_cols=0):
+    """Split a rows x cols grid into tiles of at most tile_rows x tile_cols (0: no limit).
+    Returns a list of (row slice, column slice), in row-major order."""
+    row_starts = range(0, rows, tile_rows) if tile_rows > 0 else [0]
+    col_starts = range(0, cols, tile_cols) if tile_cols > 0 else [0]
+    return [(slice(r, r + tile_rows if tile_rows > 0 else rows), slice(c, c + tile_cols if tile_cols > 0 else cols))
+            for r in row_starts for c in col_starts]
+
+
+# Largest grid drawn at the original 4 x 3 inches, as the tables of the study are
+BASE_ROWS = 12
+BASE_COLS = 6
+
+
+def figure_size(rows, cols, max_ticks=MAX_TICKS):
+    """Size in inches of a heatmap figure of rows x cols cells: 4 x 3 up to BASE_ROWS x BASE_COLS cells, as the usual tables are drawn,
+    growing by 0.55 inches per further column and 0.3 inches per further row up to max_ticks labelled rows and columns."""
+    return (4.0 + 0.55 * max(0, min(cols, max_ticks) - BASE_COLS),
+            3.0 + 0.3 * max(0, min(rows, max_ticks) - BASE_ROWS))
+
+
+def render(series, headings, values, output, labels=None, higher_is_better=False,
+           tile_rows=0, tile_cols=0, **options):
+    """Draw the heatmap of values (rows series, columns headings) to output.
+    With tile_rows or tile_cols, the grid is split into tiles (see tiles), drawn with one colour scale: as pages of output if it is a PDF,
+    otherwise as files named after output with _r<i>_c<j> before the extension. labels default to cell_labels(values); options are passed to draw.
+    Returns the names of the files written."""
+    from matplotlib.figure import Figure
+
+    if labels is None:
+        labels = cell_labels(values)
+    vmax = np.nanmax(values) if np.any(~np.isnan(values)) else None
+    parts = tiles(len(series), len(headings), tile_rows, tile_cols)
+    output = Path(output)
+    pages = None
+    if len(parts) > 1 and output.suffix == '.pdf':
+        from matplotlib.backends.backend_pdf import PdfPages
+        pages = PdfPages(output, metadata={'CreationDate': None})
+
+    written = []
+    for rs, cs in parts:
+        fig = Figure()
+        fig.set_size_inches(*figure_size(len(series[rs]), len(headings[cs]), options.get('max_ticks', MAX_TICKS)))
+        with pp_profile.stage("draw"):
+            draw(fig, series[rs], headings[cs], values[rs, cs], labels[rs, cs], higher_is_better, vmax, **options)
+        with pp_profile.stage(f"savefig {output.suffix.lstrip('.')}"):
+            if pages is not None:
+                pages.savefig(fig, bbox_inches='tight')
             else:
-                if raw[i] / args.factorize < 100.0:
-                    l.append('%.1f' % (raw[i] / args.factorize))
-                else:
-                    l.append('%.0f' % (raw[i] / args.factorize))
-    labels.append(l)
-
-plt.rcParams.update({
-    "font.family": "serif",  # use serif/main font for text elements
-    "text.usetex": False,     # use inline math for ticks
-    "pgf.rcfonts": False,    # don't setup fonts from rc parameters
-})
-fig, ax = plt.subplots()
-fig.set_size_inches(4, 3)
-
-# Set color map to match blackbody, growing brighter for higher values
-colors = "gist_heat"
-if not args.higher_is_better:
-    colors = colors + "_r"
-cmap = plt.cm.get_cmap(colors)
-x = np.arange(7)
-y = np.arange(11)
-cmesh = plt.pcolormesh(
-    x,
-    y,
-    np.array(heatmap),
-    cmap=cmap,
-    edgecolors='k',
-    vmin=1.0E-6)
-ax.set_yticks(np.arange(len(heatmap)) + 0.5, minor=False)
-ax.set_xticks(np.arange(len(heatmap[0])) + 0.5, minor=False)
-
-ax.set_yticklabels(series)
-for i in range(len(headings)):
-    heading = headings[i].replace('_', r'\_')
-    if not plt.rcParams['text.usetex']:
-        heading = heading.replace(r"\%", "%")
-    headings[i] = heading
-ax.set_xticklabels(headings, rotation=45, ha="right", rotation_mode="anchor")
-plt.gca().invert_yaxis()
-
-# Add colorbar
-plt.colorbar(cmesh)
-
-# Add labels
-for i in range(len(headings)):
-    for j in range(len(series)):
-        plt.text(i + 0.9, j + 0.5, labels[j][i],
-                 ha='right', va='center', color='#b9c5bf', fontsize='small')
-
-plt.savefig(args.output, bbox_inches='tight')
+                of = output
+                if len(parts) > 1:
+                    of = output.with_name(f"{output.stem}_r{rs.start}_c{cs.start}{output.suffix}")
+                fig.savefig(of, bbox_inches='tight')
+                written.append(str(of))
+    if pages is not None:
+        with pp_profile.stage(f"savefig {output.suffix.lstrip('.')}"):
+            pages.close()
+        written.append(str(output))
+    return written
+
+
+def main():
+    import os
+    import argparse
+
+    # Argument parsing
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input", help="CSV input file, or results store (results.npz:application[:year])")
+    parser.add_argument("output", help="PDF output file")
+    parser.add_argument(
+        "--higher-is-better",
+        help="High numbers are better than low number (e.g. when plotting bandwidth)",
+        action="store_true")
+    parser.add_argument(
+        "--factorize",
+        help="Divide all input results by this number",
+        action="store",
+        type=float,
+        default=1.0)
+    parser.add_argument(
+        "--percent",
+        help="Input is in percent",
+        action="store_true")
+    parser.add_argument(
+        "--mean",
+        help="Plot the mean and standard deviation against each column",
+        action="store_true")
+    parser.add_argument(
+        "--tile-rows",
+        help="Split the heatmap into tiles of at most this many rows (pages of a PDF output, or numbered files)",
+        action="store",
+        type=int,
+        default=0)
+    parser.add_argument(
+        "--tile-cols",
+        help="Split the heatmap into tiles of at most this many columns",
+        action="store",
+        type=int,
+        default=0)
+    parser.add_argument(
+        "--max-labels",
+        help="Leave out cell labels (and cell edges) of tiles with more cells than this",
+        action="store",
+        type=int,
+        default=MAX_LABELS)
+    parser.add_argument(
+        "--max-ticks",
+        help="Label only every n-th row or column, so that at most this many are labelled",
+        action="store",
+        type=int,
+        default=MAX_TICKS)
+    pp_profile.add_arguments(parser)
+    args = parser.parse_args()
+
+    pp_data.check_input(args.input)
+
+    # Agg, unless MPLBACKEND says otherwise: only files are written
+    os.environ.setdefault("MPLBACKEND", "Agg")
+
+    import matplotlib.pyplot as plt
+
+    plt.rcParams.update({
+        "font.family": "serif",  # use serif/main font for text elements
+        "text.usetex": False,     # use inline math for ticks
+        "pgf.rcfonts": False,    # don't setup fonts from rc parameters
+    })
+
+    with pp_profile.session(args, file=args.input):
+        with pp_profile.stage("read"):
+            series, headings, values = load(args.input)
+        with pp_profile.stage("labels"):
+            labels = cell_labels(values, args.factorize, args.percent, plt.rcParams['text.usetex'])
+        render(series, headings, values, args.output, labels, args.higher_is_better,
+               args.tile_rows, args.tile_cols, max_labels=args.max_labels, max_ticks=args.max_ticks)
+
+
+if __name__ == '__main__':
+    main()
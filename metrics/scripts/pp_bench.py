@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+# Copyright (c) 2020 Performance Portability authors
+# SPDX-License-Identifier: MIT
+
+import atexit
+import contextlib
+import functools
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+import pp_metrics
+import pp_vis
+
+
+# Each benchmark prepares its inputs from a dataset (a metrics csv file)
+# outside the measurement and returns the callable to measure. Wall time
+# is the best and median of several calls; peak memory is measured with
+# tracemalloc in a separate call, since tracing slows allocation down.
+# Benchmarks skip datasets with more cells than their limit, where they
+# would run for minutes. The startup benchmark times whole commands that
+# do little work (-h, and table scripts on a small file) and records which
+# of pandas and the plotting and scipy modules they import.
+
+HERE = Path(__file__).resolve().parent
+DATA = HERE.parent / "data"
+
+# Generated dataset sizes (platforms x implementations) of a default run.
+# 100000x1000 (10^8 cells, a 600 MB csv file) is left to --sizes, as loading it takes several GB.
+SIZES = [(4, 5), (100, 50), (1000, 100), (10000, 1000), (100000, 100)]
+
+# The results of a default run on a reference machine, for --baseline
+BASELINE = HERE / "bench_baseline.json"
+
+
+def _load(filename):
+    # Efficiencies as pp_vis computes them for plots
+    return pp_vis.app_effs(filename, throughput="babelstream" in Path(filename).stem)
+
+
+@functools.lru_cache(maxsize=1)
+def _effs(filename):
+    # _load, shared by the setups of the benchmarks of one dataset
+    return _load(filename)
+
+
+def bench_app_effs(filename):
+    return lambda: _load(filename)
+
+
+def bench_akde(filename):
+    effs = _effs(filename)
+    samples = sorted(effs[effs.columns[1]])
+    return lambda: pp_vis.akde(np.linspace(0, 1, 1000), samples, 0.05).pdf_refine(10)
+
+
+def bench_pp_cdf_raw_effs(filename):
+    effs = _effs(filename)
+    apps = [list(zip(effs[effs.columns[0]], effs[col])) for col in effs.columns[1:]]
+    return lambda: [pp_vis.pp_cdf_raw_effs(app) for app in apps]
+
+
+def bench_estimate_densities(filename):
+    effs = _effs(filename)
+    return lambda: _quiet(pp_vis.estimate_densities, effs, effs.columns[1:])
+
+
+def bench_estimate_densities_binned(filename):
+    effs = _effs(filename)
+    return lambda: _quiet(pp_vis.estimate_densities, effs, effs.columns[1:], method="binned")
+
+
+def bench_pp_cascades(filename):
+    effs = _effs(filename)
+    return lambda: pp_vis.pp_cascades(effs)
+
+
+def bench_cascade_bands(filename):
+    cascades = pp_vis.pp_cascades(_effs(filename))
+    return lambda: pp_vis.cascade_bands(cascades, 1000, seed=0)
+
+
+def bench_bin_counts(filename):
+    effs = _effs(filename)
+    return lambda: pp_vis.bin_counts(effs)
+
+
+def bench_histogram(filename):
+    effs = _effs(filename)
+    data = effs[effs.columns[1:]].to_numpy(dtype=float).ravel()
+    bins = pp_vis.efficiency_bins()
+    return lambda: pp_vis.histogram(bins, data)
+
+
+def bench_harstdev_lam(filename):
+    effs = _effs(filename)
+    matrix = effs[effs.columns[1:]].to_numpy(dtype=float)
+    return lambda: pp_metrics.harstdev_lam(matrix)
+
+
+def bench_pp_vis(filename):
+    outdir = tempfile.mkdtemp(prefix="pp_bench_")
+    atexit.register(shutil.rmtree, outdir, ignore_errors=True)
+    env = dict(os.environ, MPLBACKEND="Agg")
+    command = [sys.executable, str(HERE / "pp_vis.py"), "--no-cache", "-F", "png", "-o", outdir + os.sep]
+    if "babelstream" in Path(filename).stem:
+        command.append("--throughput")
+    command.append(str(filename))
+    return lambda: subprocess.run(command, env=env, check=True, stdout=subprocess.DEVNULL)
+
+
+def _quiet(fn, *args, **kwargs):
+    # fn without the warnings it prints (the AKDE area check fails often on random data)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+
+# Benchmark name -> (setup function, largest dataset in cells it runs on)
+BENCHMARKS = {"app_effs": (bench_app_effs, 10**8),
+              "akde.pdf_refine": (bench_akde, 10**7),
+              "estimate_densities": (bench_estimate_densities, 10**4),
+              "estimate_densities_binned": (bench_estimate_densities_binned, 10**5),
+              "pp_cdf_raw_effs": (bench_pp_cdf_raw_effs, 10**6),
+              "pp_cascades": (bench_pp_cascades, 10**8),
+              "cascade_bands": (bench_cascade_bands, 5 * 10**3),
+              "histogram": (bench_histogram, 10**8),
+              "bin_counts": (bench_bin_counts, 10**8),
+              "harstdev_lam": (bench_harstdev_lam, 10**8),
+              "pp_vis": (bench_pp_vis, 2 * 10**4)}
+
+
+# Benchmarks run once, not per dataset
+STARTUP = "startup"
+
+# Scripts timed with -h by the startup benchmark
+STARTUP_SCRIPTS = ["averages.py", "consistency.py", "pp_subsets.py", "pp_trend.py", "heatmap.py", "pp_vis.py", "pp_bench.py"]
+
+# Modules that dominate startup: only drawing needs matplotlib and scipy, and only loading results needs pandas
+HEAVY_MODULES = ["matplotlib", "scipy", "pandas"]
+
+# Runs a script (argv[1:]) as python would, then reports the HEAVY_MODULES it imported on stderr
+_PROBE = """import os, runpy, sys
+sys.argv = sys.argv[1:]
+if sys.argv:
+    sys.path.insert(0, os.path.dirname(sys.argv[0]))
+    try:
+        runpy.run_path(sys.argv[0], run_name="__main__")
+    except SystemExit:
+        pass
+print(",".join(m for m in %r if m in sys.modules), file=sys.stderr)
+""" % HEAVY_MODULES
+
+
+def startup_commands():
+    """(name, arguments) of the commands timed by the startup benchmark: the interpreter alone (no arguments),
+    every script with -h, and the table scripts on a shipped csv file."""
+    data = str(DATA / "babelstream.csv")
+    cmds = [("python", [])]
+    cmds += [(f"{script} -h", [str(HERE / script), "-h"]) for script in STARTUP_SCRIPTS]
+    for script in ["averages.py", "consistency.py"]:
+        cmds.append((f"{script} babelstream", [str(HERE / script), "--calc-efficiency", "--input-is-throughput", data, os.devnull]))
+    return cmds
+
+
+def loaded_modules(arguments):
+    """The HEAVY_MODULES imported by running python with arguments (a script and its arguments)."""
+    res = subprocess.run([sys.executable, "-c", _PROBE] + arguments, stdout=subprocess.DEVNULL,
+                         stderr=subprocess.PIPE, text=True, env=dict(os.environ, MPLBACKEND="Agg"))
+    lines = res.stderr.strip().splitlines()
+    return [m for m in lines[-1].split(",") if m] if lines else []
+
+
+def startup(repeats=5):
+    """Time the startup_commands, printing progress. Returns a list of result dicts, with the HEAVY_MODULES each command imports."""
+    results = []
+    env = dict(os.environ, MPLBACKEND="Agg")
+    for name, arguments in startup_commands():
+        command = [sys.executable] + (arguments or ["-c", "pass"])
+        best, median, _ = measure(lambda: subprocess.run(command, env=env, check=True, stdout=subprocess.DEVNULL), repeats)
+        modules = loaded_modules(arguments)
+        results.append({"benchmark": STARTUP, "dataset": name, "cells": 0, "repeats": repeats,
+                        "time_min": best, "time_median": median, "peak_memory": None, "modules": modules})
+        print(f"{STARTUP:26s} {name:28s} {best:10.4f}s {median:10.4f}s" + (f" loads {', '.join(modules)}" if modules else ""))
+    return results
+
+
+def generate(filename, platforms, implementations, seed=0, unsupported=0.1):
+    """Write a metrics csv file of random results (1 to 100, to three decimals) for platforms x implementations, a fraction unsupported of them X.
+    Rows are written in blocks of about 10^6 cells, each value looked up in a table of formatted strings, so large datasets take seconds."""
+    table = np.array([f"{k / 1000:.3f}" for k in range(1000, 100001)] + ["X"], dtype=object)
+    block = max(1, 10**6 // implementations)
+    with open(filename, "w") as f:
+        f.write(",".join(["Device"] + [f"Impl {i}" for i in range(implementations)]) + "\n")
+        for b, start in enumerate(range(0, platforms, block)):
+            rng = np.random.default_rng([seed, b])
+            idx = rng.integers(0, len(table) - 1, size=(min(block, platforms - start), implementations))
+            idx[rng.random(idx.shape) < unsupported] = len(table) - 1
+            f.write("".join(f"Platform {start + i}," + ",".join(row) + "\n" for i, row in enumerate(table[idx].tolist())))
+
+
+def datasets(sizes=SIZES, shipped=True, seed=0, directory=None):
+    """List (name, filename, cells) of the datasets to benchmark: the shipped metrics csv files, then generated ones of sizes,
+    written to directory (default: a temporary directory)."""
+    import pandas
+    res = []
+    if shipped:
+        for f in sorted(DATA.glob("*.csv")):
+            if f.name == "spec.csv":
+                continue
+            df = pandas.read_csv(f)
+            res.append((f.stem, str(f), df.shape[0] * (df.shape[1] - 1)))
+    if sizes:
+        directory = Path(directory or tempfile.mkdtemp(prefix="pp_bench_"))
+        for platforms, implementations in sizes:
+            f = directory / f"generated_{platforms}x{implementations}.csv"
+            generate(f, platforms, implementations, seed)
+            res.append((f.stem, str(f), platforms * implementations))
+    return res
+
+
+def measure(fn, repeats=5):
+    """Call fn repeats times and once more under tracemalloc. Returns the best and median wall time and the peak traced memory in bytes."""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return min(times), statistics.median(times), peak
+
+
+def run(names, data, repeats=5, limits=True):
+    """Run benchmarks names on data (from datasets), printing progress. Returns a list of result dicts."""
+    results = []
+    for dataset, filename, cells in data:
+        for name in names:
+            setup, limit = BENCHMARKS[name]
+            if limits and cells > limit:
+                print(f"Skipping {name} on {dataset}: more than {limit} cells.")
+                continue
+            fn = setup(filename)
+            best, median, peak = measure(fn, repeats)
+            r = {"benchmark": name, "dataset": dataset, "cells": cells, "repeats": repeats,
+                 "time_min": best, "time_median": median, "peak_memory": peak}
+            if name == "pp_vis":
+                # The CLI runs in a child process, which tracemalloc does not see
+                r["peak_memory"] = None
+            results.append(r)
+            print(f"{name:26s} {dataset:28s} {best:10.4f}s {median:10.4f}s"
+                  + (f" {peak / 2**20:10.1f}MB" if r["peak_memory"] is not None else ""))
+    return results
+
+
+def environment():
+    """Description of the machine and software the benchmarks ran on."""
+    import matplotlib
+    import pandas
+    import scipy
+
+    try:
+        revision = subprocess.run(["git", "rev-parse", "HEAD"], cwd=HERE, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        revision = ""
+    return {"python": platform.python_version(), "numpy": np.__version__, "pandas": pandas.__version__,
+            "matplotlib": matplotlib.__version__, "scipy": scipy.__version__, "machine": platform.machine(),
+            "system": platform.platform(), "cpus": os.cpu_count(), "revision": revision,
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def compare(results, baseline, tolerance=0.25, time_floor=1e-3):
+    """Compare results with the results of a baseline run. Returns (benchmark, dataset, measure, ratio) of every time or peak memory that grew by more than tolerance (a fraction).
+    Times are compared against at least time_floor seconds, as shorter ones vary by more than any useful tolerance from run to run."""
+    old = {(r["benchmark"], r["dataset"]): r for r in baseline}
+    regressions = []
+    for r in results:
+        b = old.get((r["benchmark"], r["dataset"]))
+        if b is None:
+            continue
+        for measure in ("time_min", "peak_memory"):
+            if r.get(measure) is None or not b.get(measure):
+                continue
+            ratio = r[measure] / (max(b[measure], time_floor) if measure == "time_min" else b[measure])
+            if ratio > 1.0 + tolerance:
+                regressions.append((r["benchmark"], r["dataset"], measure, ratio))
+    return regressions
+
+
+def parse_sizes(text):
+    """Parse "4x5,100x50" into [(4, 5), (100, 50)]."""
+    return [tuple(int(n) for n in s.split("x")) for s in text.split(",") if s]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    desc = "Benchmark the metrics and visualization hot paths"
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument("-o",
+                        "--output",
+                        dest='output',
+                        action='store',
+                        default="bench.json",
+                        help='Write the results to this json file.')
+    parser.add_argument("-b",
+                        "--baseline",
+                        dest='baseline',
+                        action='store',
+                        nargs='?',
+                        const=str(BASELINE),
+                        default=None,
+                        help=f'Compare against the results in this json file, written by an earlier run (default: {BASELINE.name}); exit with status 1 on regressions.')
+    parser.add_argument("--tolerance",
+                        dest='tolerance',
+                        action='store',
+                        type=float,
+                        default=0.25,
+                        help='Fraction by which a time or peak memory may exceed the baseline before it is a regression.')
+    parser.add_argument("--time-floor",
+                        dest='time_floor',
+                        action='store',
+                        type=float,
+                        default=1e-3,
+                        help='Compare times against at least this many seconds, so that the noise of shorter ones is not reported.')
+    parser.add_argument("-B",
+                        "--benchmarks",
+                        dest='benchmarks',
+                        action='store',
+                        default=",".join(list(BENCHMARKS) + [STARTUP]),
+                        help=f'Benchmarks to run, of {",".join(list(BENCHMARKS) + [STARTUP])}.')
+    parser.add_argument("-s",
+                        "--sizes",
+                        dest='sizes',
+                        action='store',
+                        default=",".join(f"{p}x{i}" for p, i in SIZES),
+                        help='Generated datasets to run on, as platforms x implementations, e.g. 4x5,100000x1000.')
+    parser.add_argument("--no-shipped",
+                        dest='shipped',
+                        action='store_false',
+                        default=True,
+                        help='Do not run on the csv files in ../data.')
+    parser.add_argument("--no-limits",
+                        dest='limits',
+                        action='store_false',
+                        default=True,
+                        help='Run every benchmark on every dataset, however large.')
+    parser.add_argument("-r",
+                        "--repeats",
+                        dest='repeats',
+                        action='store',
+                        type=int,
+                        default=5,
+                        help='Time each benchmark this many times.')
+    parser.add_argument("--seed",
+                        dest='seed',
+                        action='store',
+                        type=int,
+                        default=0,
+                        help='Random seed of the generated datasets.')
+
+    args = parser.parse_args()
+
+    names = [n for n in args.benchmarks.split(",") if n]
+    unknown = [n for n in names if n not in BENCHMARKS and n != STARTUP]
+    if unknown:
+        print(f"Unknown benchmarks: {', '.join(unknown)}")
+        sys.exit(1)
+
+    with tempfile.TemporaryDirectory(prefix="pp_bench_") as tmp:
+        data = datasets(parse_sizes(args.sizes), args.shipped, args.seed, tmp)
+        results = run([n for n in names if n in BENCHMARKS], data, args.repeats, args.limits)
+    if STARTUP in names:
+        results += startup(args.repeats)
+
+    with open(args.output, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=1)
+    print(f"Wrote {args.output}.")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance, args.time_floor)
+        for benchmark, dataset, measure, ratio in regressions:
+            print(f"Regression: {benchmark} on {dataset}: {measure} is {ratio:.2f}x the baseline")
+        if regressions:
+            sys.exit(1)
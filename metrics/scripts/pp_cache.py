@@ -0,0 +1,122 @@
+# Copyright (c) 2020 Performance Portability authors
+# SPDX-License-Identifier: MIT
+
+import hashlib
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+
+def default_cache_dir():
+    """Return the default cache directory, following XDG_CACHE_HOME."""
+    base = os.environ.get("XDG_CACHE_HOME", os.path.join(Path.home(), ".cache"))
+    return os.path.join(base, "pp_vis")
+
+
+def digest(*parts):
+    """Return a hex SHA-256 digest of parts, which may be bytes or anything with a stable repr."""
+    h = hashlib.sha256()
+    for p in parts:
+        if not isinstance(p, bytes):
+            p = repr(p).encode()
+        h.update(len(p).to_bytes(8, 'little'))
+        h.update(p)
+    return h.hexdigest()
+
+
+def file_digest(filename):
+    """Return a hex SHA-256 digest of the contents of filename."""
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def sources_digest(*filenames):
+    """Return a digest of the source files filenames, used as a version for cached results."""
+    return digest(*[Path(f).read_bytes() for f in filenames])
+
+
+class Cache:
+    """A content-addressed on-disk cache with size-bounded LRU eviction.
+    Entries are files named by their key under root; reading an entry refreshes its modification time, which orders eviction.
+    Writes are atomic, so several processes may share a cache."""
+
+    def __init__(self, root, max_bytes):
+        """Use directory root (created if needed) and evict down to max_bytes."""
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        """Location of the entry for key."""
+        return self.root / key[:2] / key
+
+    def get(self, key):
+        """Return the bytes stored for key, or None."""
+        p = self.path(key)
+        try:
+            data = p.read_bytes()
+        except OSError:
+            return None
+        try:
+            os.utime(p)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key, data):
+        """Store bytes data for key."""
+        p = self.path(key)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=p.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, p)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def get_object(self, key):
+        """Return the object pickled for key, or None."""
+        data = self.get(key)
+        if data is None:
+            return None
+        try:
+            return pickle.loads(data)
+        except Exception:
+            return None
+
+    def put_object(self, key, obj):
+        """Pickle obj and store it for key."""
+        self.put(key, pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def evict(self):
+        """Delete least recently used entries until the cache holds at most max_bytes. Return the number of entries deleted."""
+        if not self.root.is_dir():
+            return 0
+        entries = []
+        total = 0
+        for p in self.root.glob("*/*"):
+            if p.name.startswith(".tmp-"):
+                continue
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+            total += st.st_size
+        entries.sort()
+        removed = 0
+        for mtime, size, p in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                p.unlink()
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
@@ -0,0 +1,131 @@
+# Copyright (c) 2020 Performance Portability authors
+# SPDX-License-Identifier: MIT
+
+import numpy as np
+from pathlib import Path
+import sys
+
+import pp_cache
+import pp_store
+
+
+def read_results(filename):
+    """Load a csv file of results. Assumes comma separation, and that first column is list of platforms.
+    Whitespace around names and values is ignored, and 'x' or 'X' entries (platform did not run) become NaN.
+    Uses the C parser; only columns it could not read as numbers (e.g. an 'X' with trailing spaces) are cleaned up afterwards.
+    Columns that are genuinely textual are kept as stripped strings.
+    filename may also refer to a results store, as "results.npz[:application[:year]]" (see pp_store); it is read without any text parsing."""
+    import pandas
+    from pandas.api.types import is_numeric_dtype
+    if pp_store.is_store(filename):
+        return pp_store.read_table(filename)
+    df = pandas.read_csv(filename,
+                         na_values=['x', 'X'],
+                         skipinitialspace=True)
+    df.columns = [str(c).strip() for c in df.columns]
+    if not is_numeric_dtype(df[df.columns[0]]):
+        df[df.columns[0]] = df[df.columns[0]].str.strip()
+    for col in df.columns[1:]:
+        if not is_numeric_dtype(df[col]):
+            vals = df[col].str.strip()
+            try:
+                df[col] = pandas.to_numeric(vals.mask(vals.isin(['x', 'X'])))
+            except ValueError:
+                df[col] = vals
+    return df
+
+
+def check_input(filename):
+    """Exit with status 1, printing why, if filename is a results store reference that does not select the results
+    of one application and year (e.g. results.npz:babelstream for a store of several years)."""
+    if not pp_store.is_store(filename):
+        return
+    try:
+        pp_store.resolve(filename)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+
+
+def results_name(filename):
+    """Short name of the results in filename, for naming outputs: the file name without extension, or application[_year] for a store reference."""
+    if pp_store.is_store(filename):
+        path, application, year = pp_store.split_spec(filename)
+        if application is None:
+            return Path(path).stem
+        return f"{application}_{year}" if year else application
+    return Path(filename).stem
+
+
+def input_digest(filename):
+    """Digest of the contents of the results in filename, which may be a store reference."""
+    path, application, year = pp_store.split_spec(filename) if pp_store.is_store(filename) else (filename, None, None)
+    digest = pp_cache.file_digest(path)
+    if application is None and year is None:
+        return digest
+    return pp_cache.digest(digest, application, year)
+
+
+def app_efficiencies(df, throughput=False):
+    """Compute application efficiencies from results dataframe df, as returned by read_results.
+    Each value is divided into the best value in its row (platform): the minimum for times, the maximum for throughput.
+    Missing entries stay NaN. Returns a new dataframe."""
+    vals = df[df.columns[1:]].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if throughput:
+            effs = vals / np.fmax.reduce(vals, axis=1)[:, np.newaxis]
+        else:
+            effs = np.fmin.reduce(vals, axis=1)[:, np.newaxis] / vals
+    res = df.copy()
+    res[df.columns[1:]] = effs
+    return res
+
+
+# Default hardware specification for architectural efficiencies, and the
+# names used there for platforms that results tables call differently
+DEFAULT_SPEC = Path(__file__).resolve().parent.parent / "data" / "spec.csv"
+SPEC_ALIASES = {"knights landing": "knl"}
+
+# Peaks of the architectural efficiency modes
+ARCH_PEAKS = ["bandwidth", "flops", "roofline"]
+
+
+def read_spec(filename=DEFAULT_SPEC):
+    """Load a hardware specification csv file, such as ../data/spec.csv: one row per architecture, with DP FLOPs (TFLOP/s), Mem BW (GB/s) and Balance (FLOPs per 8-byte word) columns.
+    Returns a dataframe indexed by the lower-case architecture names."""
+    spec = read_results(filename)
+    return spec.set_index(spec[spec.columns[0]].astype(str).str.lower())
+
+
+def platform_peaks(platforms, spec, peak="bandwidth", intensity=None):
+    """Peak of each of platforms from spec (as returned by read_spec), matched by name regardless of case; NaN for platforms spec does not list.
+    peak is "bandwidth" (GB/s), "flops" (TFLOP/s) or "roofline": the attainable TFLOP/s of a code of arithmetic intensity FLOPs per byte,
+    the FLOP peak scaled down by the fraction of the machine balance that intensity reaches."""
+    names = [SPEC_ALIASES.get(str(p).strip().lower(), str(p).strip().lower()) for p in platforms]
+    rows = spec.reindex(names)
+    if peak == "bandwidth":
+        return rows["Mem BW"].to_numpy(dtype=float)
+    flops = rows["DP FLOPs"].to_numpy(dtype=float)
+    if peak == "flops":
+        return flops
+    if peak == "roofline":
+        if intensity is None:
+            raise ValueError("Roofline peaks need an arithmetic intensity")
+        return flops * np.minimum(1.0, 8.0 * intensity / rows["Balance"].to_numpy(dtype=float))
+    raise ValueError(f"Unknown peak {peak!r}; choose one of {', '.join(ARCH_PEAKS)}")
+
+
+def unknown_platforms(df, spec):
+    """The platforms of results dataframe df that spec does not list."""
+    peaks = platform_peaks(df[df.columns[0]], spec)
+    return [p for p, v in zip(df[df.columns[0]], peaks) if np.isnan(v)]
+
+
+def arch_efficiencies(df, spec, peak="bandwidth", scale=1.0, intensity=None):
+    """Compute architectural efficiencies from results dataframe df: each value, multiplied by scale to the units of the peak (e.g. 1e-3 for MB/s against GB/s), divided by the peak of its platform (see platform_peaks).
+    The results must be throughput (higher is better). Missing entries, and platforms spec does not list, are NaN. Returns a new dataframe."""
+    peaks = platform_peaks(df[df.columns[0]], spec, peak, intensity)
+    vals = df[df.columns[1:]].to_numpy(dtype=float)
+    res = df.copy()
+    res[df.columns[1:]] = vals * scale / peaks[:, np.newaxis]
+    return res
@@ -0,0 +1,552 @@
+# Copyright (c) 2020 Performance Portability authors
+# SPDX-License-Identifier: MIT
+
+import json
+import os
+import re
+from pathlib import Path
+
+
+import pp_cache
+import pp_store
+
+
+# Each parser reads a log one line at a time and returns the figure of merit
+# of the best run in it, or None if no run completed. Logs are never read
+# into memory whole: CloverLeaf logs report every step and run to many MB.
+
+
+def parse_babelstream(lines):
+    # Triad MBytes/sec, as in babelstream.csv
+    best = None
+    for line in lines:
+        if line.startswith("Triad"):
+            fields = line.split()
+            try:
+                val = float(fields[1])
+            except (IndexError, ValueError):
+                continue
+            if best is None or val > best:
+                best = val
+    return best
+
+
+_wallclock_re = re.compile(r"\s*Wall ?clock:?\s+([0-9.eE+-]+)")
+
+
+def parse_wallclock(lines):
+    # CloverLeaf and TeaLeaf print a running " Wall clock" (TeaLeaf's C
+    # version "Wallclock:") after every step and again in the summary; the
+    # last one of a run is its total. A value lower than the previous one
+    # means a new run started in the same log.
+    best = None
+    last = None
+    for line in lines:
+        m = _wallclock_re.match(line)
+        if m:
+            val = float(m.group(1))
+            if last is not None and val < last:
+                best = last if best is None else min(best, last)
+            last = val
+    if last is not None:
+        best = last if best is None else min(best, last)
+    return best
+
+
+def _min_of_matches(lines, pattern):
+    best = None
+    for line in lines:
+        m = pattern.match(line)
+        if m:
+            val = float(m.group(1))
+            if best is None or val < best:
+                best = val
+    return best
+
+
+_neutral_re = re.compile(r"\s*Final Wallclock\s+([0-9.eE+-]+)s")
+_minifmm_re = re.compile(r"\s*solve time\s*=\s*([0-9.eE+-]+)s")
+
+
+def parse_neutral(lines):
+    # "Final Wallclock 7.960116333s"
+    return _min_of_matches(lines, _neutral_re)
+
+
+def parse_minifmm(lines):
+    # "solve time = 8.733598s", once per run
+    return _min_of_matches(lines, _minifmm_re)
+
+
+# Application name -> (parser, whether higher is better)
+PARSERS = {"babelstream": (parse_babelstream, True),
+           "cloverleaf": (parse_wallclock, False),
+           "tealeaf": (parse_wallclock, False),
+           "neutral": (parse_neutral, False),
+           "minifmm": (parse_minifmm, False)}
+
+# Short platform names used in file and directory names, in the row order of the metrics csv files
+DEVICES = {"skl": "Skylake",
+           "knl": "KNL",
+           "power9": "Power 9",
+           "pwr9": "Power 9",
+           "naples": "Naples",
+           "tx2": "ThunderX2",
+           "ampere": "Ampere",
+           "aurora": "NEC Aurora",
+           "k20": "K20",
+           "k20x": "K20X",
+           "p100": "P100",
+           "v100": "V100",
+           "gtx2080ti": "Turing",
+           "radeonvii": "Radeon VII",
+           "bdw": "Broadwell",
+           "cxl": "Cascade Lake",
+           "rome": "Rome",
+           "a64fx": "A64FX",
+           "graviton2": "Graviton 2",
+           "irispro580": "IrisPro Gen9",
+           "mi50": "MI50",
+           "a100": "A100"}
+
+# Programming model names used in file names, in the column order of the metrics csv files.
+# OpenMP target offload shares the OpenMP column.
+MODELS = {"omp": "OpenMP",
+          "omp3": "OpenMP",
+          "openmp": "OpenMP",
+          "omp-target": "OpenMP",
+          "omptarget": "OpenMP",
+          "kokkos": "Kokkos",
+          "cuda": "CUDA",
+          "acc": "OpenACC",
+          "oacc": "OpenACC",
+          "openacc": "OpenACC",
+          "ocl": "OpenCL",
+          "opencl": "OpenCL",
+          "sycl": "SYCL",
+          "mpi": "MPI"}
+
+# Logs that do not name a model come from the OpenMP version of the application
+DEFAULT_MODEL = "OpenMP"
+
+COMPILERS = ["armclang", "arm", "cce", "clang", "computecpp", "cray", "dpcpp", "fujitsu", "gcc",
+             "hipsycl", "intel", "llvm", "nvcc", "oneapi", "pgi", "xl"]
+
+_sep = r"(?:^|(?<=[_.-]))"
+_end = r"(?=$|[_.-])"
+_model_re = re.compile(_sep + "(" + "|".join(sorted(map(re.escape, MODELS), key=len, reverse=True)) + ")" + _end)
+_compiler_re = re.compile(_sep + "(" + "|".join(sorted(COMPILERS, key=len, reverse=True)) + r")(?:-([0-9][0-9a-z.]*|trunk))?" + _end)
+_prefix_re = re.compile(r"^(?:babelstream|cloverleaf|tealeaf|neutral|minifmm|stream)-", re.IGNORECASE)
+
+
+def describe(filename):
+    """Derive (device, compiler, model, large) from the name of log filename, e.g. BabelStream-skl_gcc-7.3_omp.out.
+    The device comes from the platform directory holding the results directory (e.g. skl-swan), or else from the first part of the file name.
+    large is true for runs of the large problem size (BabelStream-large-skl_...)."""
+    path = Path(filename)
+    stem = _prefix_re.sub("", path.stem.lower())
+    large = stem.startswith("large-")
+    if large:
+        stem = stem[len("large-"):]
+
+    # Some logs were copied between platform directories under their old
+    # names, so the directory wins when it names a known platform
+    platform = path.parent.parent.name if path.parent.name == "results" else path.parent.name
+    short = platform.lower().split("-")[0]
+    first = stem.split("_")[0]
+    rest = stem[len(first):] if first in DEVICES else stem
+    if short in DEVICES:
+        device = DEVICES[short]
+    elif first in DEVICES:
+        device = DEVICES[first]
+    else:
+        device = first
+
+    m = _model_re.search(rest)
+    model = MODELS[m.group(1)] if m else DEFAULT_MODEL
+
+    m = _compiler_re.search(rest)
+    compiler = "-".join(g for g in m.groups() if g) if m else ""
+    return device, compiler, model, large
+
+
+def application_of(filename):
+    """Guess the application of log filename from its name or its directories; None if unknown."""
+    for part in reversed(Path(filename).parts):
+        name = part.lower()
+        for app in PARSERS:
+            if name == app or name.startswith(app + "-"):
+                return app
+    return None
+
+
+def year_of(filename):
+    """The year of the benchmarking campaign log filename belongs to (e.g. 2020), from its directories; "" if unknown."""
+    for part in reversed(Path(filename).parts[:-1]):
+        if re.fullmatch(r"(19|20)[0-9]{2}", part):
+            return part
+    return ""
+
+
+def find_logs(paths):
+    """Expand paths into log files: directories are searched for results/*.out (not older results kept in subdirectories)."""
+    logs = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            logs.extend(sorted(f for f in p.rglob("*.out") if f.parent.name == "results"))
+        else:
+            logs.append(p)
+    return logs
+
+
+def ingest(filename, app=None):
+    """Parse log filename (of application app, guessed from the path if None).
+    Returns a dict with the file name, application, year, device, compiler, model, large flag and value (None if no run completed)."""
+    if app is None:
+        app = application_of(filename)
+    if app not in PARSERS:
+        raise ValueError(f"Unknown application for {filename}")
+    parser, _ = PARSERS[app]
+    device, compiler, model, large = describe(filename)
+    with open(filename, errors="replace") as f:
+        value = parser(f)
+    return {"file": str(filename),
+            "application": app,
+            "year": year_of(filename),
+            "device": device,
+            "compiler": compiler,
+            "model": model,
+            "large": large,
+            "value": value}
+
+
+def ingest_all(filenames, app=None, jobs=1):
+    """Parse every log in filenames, in jobs worker processes. Returns the records in input order."""
+    if jobs > 1 and len(filenames) > 1:
+        import concurrent.futures
+        import functools
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            return list(pool.map(functools.partial(ingest, app=app), filenames,
+                                 chunksize=max(1, len(filenames) // (4 * jobs))))
+    return [ingest(f, app) for f in filenames]
+
+
+def _rank(name, order):
+    # Sort key placing name as in list order, and unknown names after it
+    return (order.index(name) if name in order else len(order), name)
+
+
+def results_table(records, throughput):
+    """Collate records (from ingest) into a Device x model dataframe of the best value per cell, in the layout read by pp_data.read_results.
+    Rows and columns follow the order of DEVICES and MODELS; cells without a completed run are NaN."""
+    import pandas
+    df = pandas.DataFrame(records, columns=["device", "model", "value"]).astype({"value": float})
+    if throughput:
+        table = df.groupby(["device", "model"])["value"].max().unstack()
+    else:
+        table = df.groupby(["device", "model"])["value"].min().unstack()
+    order = list(dict.fromkeys(DEVICES.values()))
+    rows = sorted(table.index, key=lambda d: _rank(d, order))
+    order = list(dict.fromkeys(MODELS.values()))
+    cols = sorted(table.columns, key=lambda m: _rank(m, order))
+    table = table.reindex(index=rows, columns=cols)
+    table.index.name = "Device"
+    table.columns.name = None
+    return table
+
+
+def write_table(table, filename, float_format=None):
+    """Write table as a metrics csv file, with X for unsupported platforms.
+    An existing file with the same contents is left untouched, so that its outputs stay valid; returns whether filename was written."""
+    text = table.to_csv(na_rep="X", float_format=float_format)
+    try:
+        if Path(filename).read_text() == text:
+            return False
+    except OSError:
+        pass
+    Path(filename).write_text(text)
+    return True
+
+
+def table_name(app, year, large):
+    """Name of the metrics csv file for one application, year and problem size, e.g. babelstream_2020.csv."""
+    name = app
+    if year:
+        name += f"_{year}"
+    if large:
+        name += "_large"
+    return name + ".csv"
+
+
+def table_key(record):
+    """The (application, year, large) group a record is collated into."""
+    return (record["application"], record["year"], record["large"])
+
+
+def table_key_of(filename, app=None):
+    """The group the record of log filename will be collated into, without parsing it."""
+    return (app or application_of(filename), year_of(filename), describe(filename)[3])
+
+
+def write_tables(records, prefix, float_format=None, keys=None):
+    """Write a metrics csv file for every application, year and problem size among records, named by table_name with prefix.
+    If keys is given, only the files of those groups, and files that do not exist yet, are written.
+    Returns the file names written; files whose contents did not change are not rewritten or returned."""
+    groups = {}
+    for r in records:
+        groups.setdefault(table_key(r), []).append(r)
+    written = []
+    for key, recs in sorted(groups.items()):
+        of = f"{prefix}{table_name(*key)}"
+        if keys is not None and key not in keys and os.path.exists(of):
+            continue
+        if write_table(results_table(recs, PARSERS[key[0]][1]), of, float_format):
+            written.append(of)
+    return written
+
+
+def store_frame(records):
+    """One row per log of records, as taken by pp_store.from_frame, in the row and column order of results_table.
+    Devices and models without a completed run are added as unsupported rows.
+    Runs of the large problem size are stored under application name_large."""
+    import pandas
+    df = pandas.DataFrame(records, columns=["application", "year", "device", "compiler", "model", "large", "value"])
+    frames = []
+    for (app, year, large), group in df.groupby(["application", "year", "large"], sort=False):
+        order = list(dict.fromkeys(DEVICES.values()))
+        devices = sorted(group["device"].unique(), key=lambda d: _rank(d, order))
+        order = list(dict.fromkeys(MODELS.values()))
+        models = sorted(group["model"].unique(), key=lambda m: _rank(m, order))
+        grid = pandas.MultiIndex.from_product([devices, models], names=["device", "model"]).to_frame(index=False)
+        full = grid.merge(group[["device", "model", "compiler", "value"]], on=["device", "model"], how="left")
+        full["application"] = f"{app}_large" if large else app
+        full["year"] = year
+        full["throughput"] = PARSERS[app][1]
+        frames.append(full)
+    return pandas.concat(frames, ignore_index=True).rename(columns={"device": "platform"})
+
+
+def _under(path, roots):
+    # Whether absolute path is one of absolute paths roots or inside one of them
+    return any(path == r or path.startswith(r.rstrip(os.sep) + os.sep) for r in roots)
+
+
+# Bump when records of unchanged logs must be re-parsed for a reason that
+# parser_digest does not see, such as a new field in every record.
+INDEX_VERSION = 1
+
+
+def parser_digest():
+    """Digest of INDEX_VERSION and of the code and tables that turn a log into a record, the version of an Index.
+    Other changes to this file, such as to table writing or help text, keep the index."""
+    import inspect
+    functions = [parse_babelstream, parse_wallclock, _min_of_matches, parse_neutral, parse_minifmm,
+                 describe, application_of, year_of, ingest]
+    patterns = [_wallclock_re, _neutral_re, _minifmm_re, _model_re, _compiler_re, _prefix_re]
+    return pp_cache.digest(INDEX_VERSION,
+                           [inspect.getsource(f) for f in functions],
+                           [p.pattern for p in patterns],
+                           [(app, parser.__name__, higher) for app, (parser, higher) in PARSERS.items()],
+                           DEVICES, MODELS, DEFAULT_MODEL)
+
+
+class Index:
+    """A persistent index of parsed logs, so that re-ingesting a tree only parses new or changed logs.
+    Each log is recorded by absolute path with its size, modification time, content digest and parsed record, in a json file.
+    A log whose size and modification time are unchanged is not read; otherwise it is re-parsed only if its digest changed.
+    The index is discarded whole when the parsers change (see parser_digest)."""
+
+    def __init__(self, filename):
+        """Load the index from filename; a missing or outdated file gives an empty index."""
+        self.filename = filename
+        self.version = parser_digest()
+        self.entries = {}
+        try:
+            with open(filename) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == self.version:
+            self.entries = data["entries"]
+
+    def save(self):
+        """Write the index back to its file, atomically."""
+        tmp = f"{self.filename}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"version": self.version, "entries": self.entries}, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.filename)
+
+    def update(self, filenames, app=None, jobs=1, dry_run=False, roots=None):
+        """Bring the index up to date with logs filenames, found under paths roots (default: filenames themselves),
+        re-parsing (in jobs processes) only new or changed ones. Logs in the index under roots that no longer exist are dropped;
+        those outside roots are kept as they are, so a subtree can be re-ingested alone. With dry_run, nothing is parsed or changed.
+        Returns a dict of lists of paths: "added", "modified", "removed" and "unchanged",
+        and under "tables" the set of (application, year, large) groups whose csv files the changes invalidate."""
+        changes = {"added": [], "modified": [], "removed": [], "unchanged": []}
+        stats = {}
+        stale = []
+        for f in filenames:
+            key = os.path.abspath(f)
+            st = os.stat(f)
+            stats[key] = (f, st.st_size, st.st_mtime_ns)
+            entry = self.entries.get(key)
+            if entry is None:
+                changes["added"].append(key)
+                stale.append(key)
+            elif entry["size"] == st.st_size and entry["mtime"] == st.st_mtime_ns:
+                changes["unchanged"].append(key)
+            else:
+                stale.append(key)
+        roots = [os.path.abspath(r) for r in (filenames if roots is None else roots)]
+        changes["removed"] = sorted(key for key in set(self.entries) - set(stats)
+                                    if _under(key, roots) and not os.path.exists(key))
+
+        digests = {key: pp_cache.file_digest(stats[key][0]) for key in stale}
+        reparse = []
+        for key in stale:
+            entry = self.entries.get(key)
+            if entry is None:
+                reparse.append(key)
+            elif entry["digest"] == digests[key]:
+                # Touched but not changed
+                changes["unchanged"].append(key)
+            else:
+                changes["modified"].append(key)
+                reparse.append(key)
+
+        tables = set(table_key_of(stats[key][0], app) for key in changes["added"] + changes["modified"])
+        tables.update(table_key(self.entries[key]["record"]) for key in changes["modified"] + changes["removed"])
+        changes["tables"] = tables
+
+        if dry_run:
+            return changes
+
+        records = ingest_all([stats[key][0] for key in reparse], app, jobs)
+        for key, record in zip(reparse, records):
+            self.entries[key] = {"record": record}
+        for key in stale:
+            _, size, mtime = stats[key]
+            self.entries[key].update(size=size, mtime=mtime, digest=digests[key])
+        for key in changes["removed"]:
+            del self.entries[key]
+        return changes
+
+    def records(self, filenames=None):
+        """The parsed records of logs filenames (default: every log in the index)."""
+        if filenames is None:
+            return [e["record"] for _, e in sorted(self.entries.items())]
+        return [self.entries[os.path.abspath(f)]["record"] for f in filenames]
+
+
+if __name__ == '__main__':
+    import sys
+    import argparse
+
+    desc = "Collate benchmark logs into metrics csv files"
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument("-a",
+                        "--application",
+                        dest='application',
+                        choices=sorted(PARSERS),
+                        action='store',
+                        default=None,
+                        help='Application all the logs belong to (default: guessed from each path).')
+    parser.add_argument("-o",
+                        "--output-prefix",
+                        dest='oprefix',
+                        action='store',
+                        default="./",
+                        help='Write output files with a specific prefix')
+    parser.add_argument("--records",
+                        dest='records',
+                        action='store',
+                        default=None,
+                        help='Also write one csv row per log (device, compiler, model, value) here.')
+    parser.add_argument("--store",
+                        dest='store',
+                        action='store',
+                        default=None,
+                        help='Also write every record to this results store (.npz, see pp_store.py).')
+    parser.add_argument("-F",
+                        "--float-format",
+                        dest='float_format',
+                        action='store',
+                        default="%.1f",
+                        help='printf-style format of values in the csv files.')
+    parser.add_argument("-j",
+                        "--jobs",
+                        dest='jobs',
+                        action='store',
+                        type=int,
+                        default=os.cpu_count() or 1,
+                        help='Parse logs in this many worker processes.')
+    parser.add_argument("--index",
+                        dest='index',
+                        action='store',
+                        default=None,
+                        help='Keep parsed logs in this index file and only parse logs that are new or changed since the last run.')
+    parser.add_argument("--changes",
+                        dest='changes',
+                        action='store_true',
+                        default=False,
+                        help='With --index, only report the logs and csv files changed since the last run.')
+    parser.add_argument('paths',
+                        metavar='<LOG-FILE-OR-DIR>+',
+                        nargs=argparse.REMAINDER)
+
+    args = parser.parse_args()
+
+    if len(args.paths) == 0:
+        print("No input files specified.")
+        sys.exit(1)
+
+    if args.changes and not args.index:
+        print("--changes needs an --index.")
+        sys.exit(1)
+
+    logs = find_logs(args.paths)
+    if args.application is None:
+        unknown = [f for f in logs if application_of(f) is None]
+        if unknown:
+            print(f"Could not tell the application of {unknown[0]}; use --application.")
+            sys.exit(1)
+
+    keys = None
+    if args.index:
+        index = Index(args.index)
+        changes = index.update(logs, args.application, args.jobs, dry_run=args.changes, roots=args.paths)
+        for what in ["added", "modified", "removed"]:
+            for f in changes[what]:
+                print(f"{what.capitalize()}: {os.path.relpath(f)}")
+        print(f"{len(changes['added'])} added, {len(changes['modified'])} modified, "
+              f"{len(changes['removed'])} removed, {len(changes['unchanged'])} unchanged.")
+        for key in sorted(changes["tables"]):
+            print(f"Invalidated {args.oprefix}{table_name(*key)}.")
+        if args.changes:
+            sys.exit(0)
+        index.save()
+        # Tables are collated from every log in the index, not only those under paths
+        records = index.records()
+        fresh = set(changes["added"] + changes["modified"])
+        keys = changes["tables"]
+    else:
+        records = ingest_all(logs, args.application, args.jobs)
+        fresh = None
+
+    for r in records:
+        if r["value"] is None and (fresh is None or os.path.abspath(r["file"]) in fresh):
+            print(f"Warning: no completed run in {r['file']}")
+
+    if args.records:
+        import pandas
+
+        pandas.DataFrame(records).to_csv(args.records, index=False)
+        print(f"Wrote {args.records}.")
+
+    if args.store:
+        pp_store.from_frame(store_frame(records)).save(args.store)
+        print(f"Wrote {args.store}.")
+
+    for of in write_tables(records, args.oprefix, args.float_format, keys):
+        print(f"Wrote {of}.")
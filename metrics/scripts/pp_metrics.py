@@ -0,0 +1,333 @@
+# Copyright (c) 2020 Performance Portability authors
+# SPDX-License-Identifier: MIT
+
+import numpy as np
+
+import argparse
+
+import pp_data
+import pp_profile
+
+
+# Every measure reduces along axis 0, so it accepts a single column of
+# efficiencies or a whole matrix (one column per implementation) at once.
+# Efficiencies of unsupported platforms are 0.
+
+
+def _result(r):
+    # Unwrap 0-d results for single columns
+    return r[()] if np.ndim(r) == 0 else r
+
+
+def _as_floats(n):
+    return np.asarray(n, dtype=float)
+
+
+def minimum(n):
+    return _result(np.min(_as_floats(n), axis=0))
+
+
+def mean(n):
+    return _result(np.mean(_as_floats(n), axis=0))
+
+
+def median(n):
+    return _result(np.median(_as_floats(n), axis=0))
+
+
+def geomean(n):
+    # Computed in log space to avoid overflow in the product; a 0 gives 0
+    with np.errstate(divide='ignore'):
+        return _result(np.exp(np.mean(np.log(_as_floats(n)), axis=0)))
+
+
+def _harmonic_mean(n):
+    # Harmonic mean, ignoring the special case of 0
+    with np.errstate(divide='ignore'):
+        return n.shape[0] / np.sum(1.0 / n, axis=0)
+
+
+def harmean(n):
+    # Python harmonic_mean returns 0 if there is a 0 in the input
+    # Return NaN instead to distinguish from pp
+    n = _as_floats(n)
+    return _result(np.where(np.any(n == 0, axis=0), np.nan, _harmonic_mean(n)))
+
+
+def pp(n):
+    n = _as_floats(n)
+    return _result(np.where(np.any(n == 0, axis=0), 0.0, _harmonic_mean(n)))
+
+
+def stdev(n):
+    # Sample standard deviation
+    return _result(np.std(_as_floats(n), axis=0, ddof=1))
+
+
+def harstdev_martinez(n):
+    # Harmonic standard deviation as calculated in the following papers:
+    # - C. Bertoni et al., "Performance Portability Evaluation of OpenCL Benchmarks across Intel and NVIDIA Platforms", IPDPSW 2020
+    # - M. Martinez and M. Bartholomew, "What does it "Mean"? A Review of Interpreting and Calculating Different Types of Means and Standard Deviations",
+    #   Pharmaceutics, vol. 9, no. 2, pp. 14, 2017
+    n = _as_floats(n)
+    h = harmean(n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return _result(h**2 * np.sqrt(np.sum((1.0 / n - 1.0 / h)**2, axis=0) / float(n.shape[0] - 1)))
+
+
+def hbar(x, i):
+    # Harmonic standard deviation as calculated in:
+    # F.C. Lam et al., "Estimation of Variance for Harmonic Mean Half-Lives",
+    # Journal of Pharmaceutical Sciences, vol. 74, no. 2, pp. 229-231, 1985
+    # hbar is the harmonic mean of x with sample i left out
+    recips = 1.0 / _as_floats(x)
+    return (len(recips) - 1) / (np.sum(recips, axis=0) - recips[i])
+
+
+def harvar(x):
+    # Jackknife variance of the harmonic mean. Every leave-one-out
+    # reciprocal sum is the total minus one term, so all hbar values come
+    # from a single reciprocal total instead of re-summing per sample
+    recips = 1.0 / _as_floats(x)
+    n = recips.shape[0]
+    hbararr = (n - 1) / (np.sum(recips, axis=0) - recips)
+    hbarbar = np.sum(hbararr, axis=0) / n
+    return (n - 1) * np.sum((hbararr - hbarbar)**2.0, axis=0)
+
+
+def harstdev_lam(n):
+    n = _as_floats(n)
+    zeros = np.any(n == 0, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return _result(np.where(zeros, np.nan, harvar(n)**0.5))
+
+
+def mad(n):
+    # median absolute deviation
+    n = _as_floats(n)
+    return _result(np.median(np.fabs(n - np.median(n, axis=0)), axis=0))
+
+
+def data_range(n):
+    # Distance between min and max values
+    return _result(np.ptp(_as_floats(n), axis=0))
+
+
+# "Averages" of efficiencies, as reported by averages.py
+AVERAGES = {"Minimum": minimum,
+            "Arithmetic Mean": mean,
+            "Geometric Mean": geomean,
+            "Harmonic Mean": harmean,
+            "Median": median,
+            "Performance Portability": pp}
+
+# "Consistency" measures of efficiencies, as reported by consistency.py
+CONSISTENCY = {"Standard Deviation": stdev,
+               "Harmonic Standard Deviation (Martinez)": harstdev_martinez,
+               "Harmonic Standard Deviation (Lam)": harstdev_lam,
+               "Median Absolute Deviation": mad,
+               "Range": data_range}
+
+
+# Bootstrap resamples are drawn in blocks of this many, each from its own
+# child of the seed, so results do not depend on how blocks are shared out
+# between worker processes.
+BOOTSTRAP_BLOCK = 256
+
+
+def _bootstrap_block(n, measure, count, seed_seq):
+    # measure of count resamples (with replacement) of the rows of n, as
+    # one array operation: the resamples are stacked along axis 1
+    rng = np.random.default_rng(seed_seq)
+    idx = rng.integers(0, n.shape[0], size=(n.shape[0], count))
+    return measure(n[idx])
+
+
+def bootstrap(n, measure=None, resamples=1000, seed=None, jobs=1):
+    """Evaluate measure (default: pp) on resamples bootstrap resamples of the rows (platforms) of n, a column or matrix of efficiencies.
+    Returns an array with one row per resample. seed makes the result reproducible, independently of jobs, the number of worker processes."""
+    if measure is None:
+        measure = pp
+    n = _as_floats(n)
+    counts = [BOOTSTRAP_BLOCK] * (resamples // BOOTSTRAP_BLOCK)
+    if resamples % BOOTSTRAP_BLOCK:
+        counts.append(resamples % BOOTSTRAP_BLOCK)
+    seeds = np.random.SeedSequence(seed).spawn(len(counts))
+    if jobs > 1 and len(counts) > 1:
+        import concurrent.futures
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            blocks = list(pool.map(_bootstrap_block, [n] * len(counts), [measure] * len(counts), counts, seeds))
+    else:
+        blocks = [_bootstrap_block(n, measure, c, s) for c, s in zip(counts, seeds)]
+    return np.concatenate(blocks, axis=0)
+
+
+def confidence_interval(n, measure=None, resamples=1000, confidence=0.95, seed=None, jobs=1):
+    """Percentile bootstrap confidence interval of measure (default: pp) for every column of n; see bootstrap.
+    Returns the arrays (low, high)."""
+    samples = bootstrap(n, measure, resamples, seed, jobs)
+    alpha = (1.0 - confidence) / 2.0
+    low, high = np.quantile(samples, [alpha, 1.0 - alpha], axis=0)
+    return _result(low), _result(high)
+
+
+def efficiencies(data, calc_efficiency=False, input_is_throughput=False, arch=None, spec=None, arch_scale=1.0, intensity=None):
+    """Return the efficiency dataframe (in percent) for results dataframe data, as read by pp_data.read_results.
+    Unsupported platforms are 0. If arch is one of pp_data.ARCH_PEAKS, these are architectural efficiencies against the peaks in spec (see pp_data.arch_efficiencies);
+    otherwise, if calc_efficiency is false, the input is assumed to already be efficiencies."""
+    if arch is not None:
+        effs = pp_data.arch_efficiencies(data, pp_data.read_spec() if spec is None else spec, arch, arch_scale, intensity)
+        effs[effs.columns[1:]] = effs[effs.columns[1:]] * 100.0
+        return effs.replace([np.inf, -np.inf, np.nan], 0.0)
+    if not calc_efficiency:
+        effs = data.fillna(float(0.0))
+        effs[effs.columns[1:]] = effs[effs.columns[1:]].astype(float)
+        return effs
+    effs = pp_data.app_efficiencies(data, throughput=input_is_throughput)
+    effs[effs.columns[1:]] = effs[effs.columns[1:]] * 100.0
+    return effs.replace([np.inf, -np.inf, np.nan], 0.0)
+
+
+def metrics_table(effs, measures=None):
+    """Compute measures (a dict of name to column-wise reduction; by default all averages and consistency measures) for every column of efficiency dataframe effs, which has no platform column.
+    Each measure is evaluated once over the whole efficiency matrix.
+    Returns a dataframe with one row per measure and one column per implementation."""
+    import pandas as pd
+    if measures is None:
+        measures = {**AVERAGES, **CONSISTENCY}
+    matrix = effs.to_numpy(dtype=float)
+    return pd.DataFrame([f(matrix) for f in measures.values()],
+                        index=list(measures.keys()),
+                        columns=effs.columns)
+
+
+def averages_table(effs):
+    """Table of AVERAGES for efficiency dataframe effs (no platform column)."""
+    return metrics_table(effs, AVERAGES)
+
+
+def consistency_table(effs):
+    """Table of CONSISTENCY measures for efficiency dataframe effs (no platform column)."""
+    return metrics_table(effs, CONSISTENCY)
+
+
+def confidence_table(effs, resamples=1000, confidence=0.95, seed=None, jobs=1, measures=None):
+    """Bootstrap confidence intervals of measures (a dict as for metrics_table; default: performance portability) for every column of efficiency dataframe effs (no platform column).
+    Returns a dataframe with a low and a high row per measure."""
+    import pandas as pd
+    if measures is None:
+        measures = {"Performance Portability": pp}
+    matrix = effs.to_numpy(dtype=float)
+    rows = {}
+    for name, f in measures.items():
+        low, high = confidence_interval(matrix, f, resamples, confidence, seed, jobs)
+        rows[f"{name} ({100 * confidence:g}% CI low)"] = np.atleast_1d(low)
+        rows[f"{name} ({100 * confidence:g}% CI high)"] = np.atleast_1d(high)
+    return pd.DataFrame(list(rows.values()), index=list(rows.keys()), columns=effs.columns)
+
+
+def sort_by_pp(results, effs):
+    """Reorder the columns of results by the performance portability of the same columns in effs."""
+    import pandas as pd
+    # sort_index is not supported by old Pandas
+    measure = pd.Series(pp(effs.to_numpy(dtype=float)), index=effs.columns)
+    order = sorted([col for col in results.columns],
+                   key=lambda col: measure[col])
+    return results.reindex(order, axis=1)
+
+
+def argument_parser(description):
+    """Return the argument parser shared by the metric table scripts."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        'input_file',
+        help="CSV file containing performance data")
+    parser.add_argument(
+        'output_file',
+        help="Output TeX file")
+    parser.add_argument(
+        '--calc-efficiency',
+        action="store_true",
+        help="Calculate application efficiency")
+    parser.add_argument(
+        '--input-is-throughput',
+        action="store_true",
+        help="If calculating application efficiency, then treat the data as throughput (higher is better)")
+    parser.add_argument(
+        '--sort',
+        action="store_true",
+        help="Sort columns according to performance portability")
+    parser.add_argument(
+        '--arch-efficiency',
+        choices=pp_data.ARCH_PEAKS,
+        default=None,
+        help="Calculate architectural efficiency: the data (throughput) as a fraction of the peak memory bandwidth, FLOP rate or roofline bound of each platform")
+    parser.add_argument(
+        '--spec',
+        default=str(pp_data.DEFAULT_SPEC),
+        help="Hardware specification CSV file with the peaks for architectural efficiency")
+    parser.add_argument(
+        '--arch-scale',
+        type=float,
+        default=1.0,
+        help="Multiply the data by this to convert it to the units of the peaks (GB/s or TFLOP/s), e.g. 1e-3 for MB/s")
+    parser.add_argument(
+        '--intensity',
+        type=float,
+        default=None,
+        help="Arithmetic intensity (FLOPs per byte) of the application, for roofline architectural efficiency")
+    pp_profile.add_arguments(parser)
+    return parser
+
+
+def load(args):
+    """Read args.input_file and compute its efficiencies as requested by args, reporting progress as the table scripts do.
+    Returns the efficiency dataframe without its platform column."""
+    print('Performance portability metrics')
+    print()
+    print('Input file: {}'.format(args.input_file))
+    print()
+
+    pp_data.check_input(args.input_file)
+    with pp_profile.stage("read"):
+        data = pp_data.read_results(args.input_file)
+    print(data)
+
+    spec = None
+    if args.arch_efficiency:
+        print(f"Calculating architectural efficiency against {args.arch_efficiency} peaks...")
+        spec = pp_data.read_spec(args.spec)
+        unknown = pp_data.unknown_platforms(data, spec)
+        if unknown:
+            print(f"Warning: no peaks for {', '.join(unknown)}; treating as unsupported")
+    elif args.calc_efficiency:
+        print("Calculating application efficiency...")
+    else:
+        print("Warning: using input data as efficiencies")
+    with pp_profile.stage("efficiencies"):
+        data_nona = efficiencies(data, args.calc_efficiency, args.input_is_throughput,
+                                 args.arch_efficiency, spec, args.arch_scale, args.intensity)
+
+    # Display data information
+    print('Number of data items:')
+    print(data.count())
+    print()
+
+    print(data_nona)
+
+    # Discard non-numeric data
+    return data_nona.drop(data_nona.columns[0], axis=1)
+
+
+def write_table(results, args):
+    """Print results and write them as a LaTeX table to args.output_file."""
+    print()
+    print(results)
+
+    with pp_profile.stage("write"):
+        results.to_latex(args.output_file, float_format="%.2f")
+
+    print(80 * '-')
+    print()
+    print()
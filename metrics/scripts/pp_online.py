@@ -0,0 +1,192 @@
+# Copyright (c) 2020 Performance Portability authors
+# SPDX-License-Identifier: MIT
+
+import math
+
+import numpy as np
+
+
+# The efficiency of a result is the best result on its platform divided by
+# it (or the reverse for throughput), and PP is the harmonic mean of the
+# efficiencies of a column, i.e. n / (sum of reciprocal efficiencies), or 0
+# if the column is missing a platform. A new result only changes its own
+# cell, unless it changes the best result of its platform, in which case it
+# changes the cells of that platform's row; the running state below is
+# updated for exactly those cells, in O(1) time per cell. Cascades need the
+# cells of a column in order of efficiency, which is only sorted (in
+# O(n log n)) when a cascade of a changed column is asked for.
+
+
+class OnlinePP:
+    """Application efficiencies, performance portability and efficiency cascades of a platform x model results table,
+    kept up to date as results arrive one at a time.
+    Snapshots give the same results as computing them from scratch with pp_data.app_efficiencies and pp_metrics.pp."""
+
+    def __init__(self, throughput=False, label="Device", resync=1024):
+        """throughput: results are higher-is-better. label names the platform column of snapshots.
+        Reciprocal sums are updated by adding and subtracting terms; after resync updates of a column its sum is recomputed exactly, so rounding errors do not build up."""
+        self.throughput = throughput
+        self.label = label
+        self.resync = resync
+        self.platforms = []
+        self.models = []
+        self._platform_index = {}
+        self._model_index = {}
+        # Per platform: {model index: value}, {model index: efficiency} and the best value
+        self._values = []
+        self._effs = []
+        self._best = []
+        # Per model: sum of reciprocal efficiencies, {platform index: efficiency}, updates since the last exact sum,
+        # and the cascade order as a sorted list of (-efficiency, platform index), or None until it is next needed
+        self._recip_sums = []
+        self._columns = []
+        self._drift = []
+        self._order = []
+
+    @classmethod
+    def from_results(cls, df, throughput=False, **options):
+        """Start from results dataframe df, as returned by pp_data.read_results."""
+        acc = cls(throughput, label=df.columns[0], **options)
+        for model in df.columns[1:]:
+            acc._model(model)
+        for platform, row in zip(df[df.columns[0]], df[df.columns[1:]].to_numpy(dtype=float)):
+            acc._platform(platform)
+            for model, value in zip(df.columns[1:], row):
+                acc.set(platform, model, value)
+        return acc
+
+    def _platform(self, name):
+        # Index of platform name, added if new
+        if name not in self._platform_index:
+            self._platform_index[name] = len(self.platforms)
+            self.platforms.append(name)
+            self._values.append({})
+            self._effs.append({})
+            self._best.append(math.nan)
+        return self._platform_index[name]
+
+    def _model(self, name):
+        # Index of model name, added if new
+        if name not in self._model_index:
+            self._model_index[name] = len(self.models)
+            self.models.append(name)
+            self._recip_sums.append(0.0)
+            self._columns.append({})
+            self._drift.append(0)
+            self._order.append([])
+        return self._model_index[name]
+
+    def _better(self, a, b):
+        # Whether value a beats value b
+        return a > b if self.throughput else a < b
+
+    def _efficiency(self, value, best):
+        return value / best if self.throughput else best / value
+
+    def _insert(self, p, m, eff):
+        self._effs[p][m] = eff
+        self._recip_sums[m] += 1.0 / eff
+        self._columns[m][p] = eff
+        self._touch(m)
+
+    def _remove(self, p, m):
+        eff = self._effs[p].pop(m)
+        self._recip_sums[m] -= 1.0 / eff
+        del self._columns[m][p]
+        self._touch(m)
+
+    def _touch(self, m):
+        self._order[m] = None
+        self._drift[m] += 1
+        if self._drift[m] >= self.resync:
+            self._recip_sums[m] = math.fsum(1.0 / e for e in self._columns[m].values())
+            self._drift[m] = 0
+
+    def set(self, platform, model, value):
+        """Set the result of model on platform to value, replacing any previous result; None or NaN removes it.
+        Only the cell is updated, or the row of the platform if its best result changes."""
+        p = self._platform(platform)
+        m = self._model(model)
+        row = self._values[p]
+        if value is not None and math.isnan(value):
+            value = None
+        if row.get(m) == value:
+            return
+        if value is None:
+            row.pop(m, None)
+        else:
+            row[m] = value
+
+        best = self._best[p]
+        if value is not None and (math.isnan(best) or self._better(value, best)):
+            new_best = value
+        elif best not in row.values():
+            # The old best result was replaced or removed
+            new_best = (max if self.throughput else min)(row.values(), default=math.nan)
+        else:
+            new_best = best
+
+        if new_best == best or (math.isnan(new_best) and math.isnan(best)):
+            if m in self._effs[p]:
+                self._remove(p, m)
+            if value is not None:
+                self._insert(p, m, self._efficiency(value, best))
+            return
+        self._best[p] = new_best
+        for other in list(self._effs[p]):
+            self._remove(p, other)
+        for other, v in row.items():
+            self._insert(p, other, self._efficiency(v, new_best))
+
+    def add(self, platform, model, value):
+        """Account for a new result of model on platform, keeping the better of it and any previous result."""
+        m = self._model_index.get(model)
+        p = self._platform_index.get(platform)
+        old = None if m is None or p is None else self._values[p].get(m)
+        if old is None or self._better(value, old):
+            self.set(platform, model, value)
+
+    def pp(self):
+        """Performance portability of every model, as a Series."""
+        import pandas
+        n = len(self.platforms)
+        return pandas.Series([n / s if len(c) == n and n > 0 else 0.0 for s, c in zip(self._recip_sums, self._columns)],
+                             index=list(self.models), dtype=float)
+
+    def cascade(self, model):
+        """Efficiency cascade of model, as the (effs, pps, plats) arrays of pp_vis.pp_cascades.
+        The order of the cascade is kept until the column next changes, so only the first cascade after a change sorts it."""
+        m = self._model_index[model]
+        if self._order[m] is None:
+            self._order[m] = sorted((-e, p) for p, e in self._columns[m].items())
+        order = self._order[m]
+        effs = np.array([-e for e, _ in order], dtype=float)
+        pps = np.arange(1, len(effs) + 1) / np.cumsum(1.0 / effs)
+        plats = np.array([self.platforms[p] for _, p in order], dtype=object)
+        return effs, pps, plats
+
+    def cascades(self):
+        """Efficiency cascades of every model, as returned by pp_vis.pp_cascades."""
+        return {model: self.cascade(model) for model in self.models}
+
+    def results(self):
+        """Snapshot of the results, in the layout of pp_data.read_results; missing results are NaN."""
+        vals = np.full((len(self.platforms), len(self.models)), np.nan)
+        for p, row in enumerate(self._values):
+            for m, v in row.items():
+                vals[p, m] = v
+        return self._frame(vals)
+
+    def efficiencies(self):
+        """Snapshot of the application efficiencies (as fractions), as pp_data.app_efficiencies of results(); missing results are NaN."""
+        effs = np.full((len(self.platforms), len(self.models)), np.nan)
+        for p, row in enumerate(self._effs):
+            for m, e in row.items():
+                effs[p, m] = e
+        return self._frame(effs)
+
+    def _frame(self, vals):
+        import pandas
+        df = pandas.DataFrame(vals, columns=list(self.models))
+        df.insert(0, self.label, list(self.platforms))
+        return df
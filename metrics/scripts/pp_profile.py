@@ -0,0 +1,244 @@
+# Copyright (c) 2020 Performance Portability authors
+# SPDX-License-Identifier: MIT
+
+import contextlib
+import functools
+import json
+import os
+import time
+
+
+# Scripts mark the stages of a run with "with pp_profile.stage(name):"
+# blocks. While profiling is off, stage returns one shared do-nothing
+# context manager, so instrumented code pays a global lookup and a call per
+# stage. While it is on, each stage records its wall time, the labels of
+# the enclosing contexts (the file and visualization type), and with
+# memory profiling the peak memory allocated during it (tracemalloc).
+# Stages nest; a nested stage is named by its path, e.g. "render/savefig pdf".
+
+_NULL = contextlib.nullcontext()
+_profiler = None
+
+
+class Profiler:
+    """The records of the stages of a run: dicts of stage path, labels, start (perf_counter seconds), time,
+    process id and, with memory profiling, peak and net allocation in bytes."""
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.records = []
+        self.labels = {}
+        self._stack = []
+        self._tracing = False
+        if memory:
+            import tracemalloc
+            self._tracing = not tracemalloc.is_tracing()
+            if self._tracing:
+                tracemalloc.start()
+
+    def close(self):
+        if self._tracing:
+            import tracemalloc
+            tracemalloc.stop()
+            self._tracing = False
+
+
+class _Stage:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        p = self.profiler
+        if p.memory:
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            # Keep the peak seen so far by the enclosing stage before restarting the count for this one
+            if p._stack:
+                p._stack[-1].seen = max(p._stack[-1].seen, peak)
+            if hasattr(tracemalloc, "reset_peak"):
+                # Python 3.9 or later; before, peaks are those since tracing started
+                tracemalloc.reset_peak()
+            self.base = current
+            self.seen = 0
+        p._stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        p = self.profiler
+        p._stack.pop()
+        record = {"stage": "/".join([s.name for s in p._stack] + [self.name]),
+                  **p.labels,
+                  "start": self.start,
+                  "time": end - self.start,
+                  "pid": os.getpid()}
+        if p.memory:
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(self.seen, peak)
+            record["peak"] = peak - self.base
+            record["allocated"] = current - self.base
+            if p._stack:
+                p._stack[-1].seen = max(p._stack[-1].seen, peak)
+        p.records.append(record)
+        return False
+
+
+@contextlib.contextmanager
+def _labelled(profiler, labels):
+    old = profiler.labels
+    profiler.labels = dict(old, **labels)
+    try:
+        yield
+    finally:
+        profiler.labels = old
+
+
+def enable(memory=False):
+    """Start profiling stages, with peak allocations if memory is true. Returns the Profiler."""
+    global _profiler
+    _profiler = Profiler(memory)
+    return _profiler
+
+
+def disable():
+    """Stop profiling stages. Returns the Profiler, or None if profiling was off."""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is not None:
+        profiler.close()
+    return profiler
+
+
+def stage(name):
+    """Context manager recording the enclosed block as stage name, if profiling is on."""
+    if _profiler is None:
+        return _NULL
+    return _Stage(_profiler, name)
+
+
+def timed(name):
+    """Decorator recording every call of the decorated function as stage name, if profiling is on."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return fn(*args, **kwargs)
+            with _Stage(_profiler, name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def context(**labels):
+    """Context manager adding labels (e.g. file=..., vis=...) to the stages recorded in the enclosed block, if profiling is on."""
+    if _profiler is None:
+        return _NULL
+    return _labelled(_profiler, labels)
+
+
+def summary(records):
+    """Aggregate records by file, visualization type and stage. Returns a dict of (file, vis) to a dict of stage path to
+    (calls, total time, largest peak allocation or None), in order of first appearance; a stage starts before the stages nested in it."""
+    groups = {}
+    starts = {}
+    for r in records:
+        key = (r.get("file", ""), r.get("vis", ""))
+        stages = groups.setdefault(key, {})
+        calls, total, peak = stages.get(r["stage"], (0, 0.0, None))
+        if "peak" in r:
+            peak = r["peak"] if peak is None else max(peak, r["peak"])
+        stages[r["stage"]] = (calls + 1, total + r["time"], peak)
+        starts[key, r["stage"]] = min(starts.get((key, r["stage"]), r["start"]), r["start"])
+    order = sorted(groups, key=lambda k: min(starts[k, s] for s in groups[k]))
+    return {k: dict(sorted(groups[k].items(), key=lambda item: starts[k, item[0]])) for k in order}
+
+
+def report(records):
+    """Print the breakdown of records by file, visualization type and stage, nested stages indented under their parents."""
+    groups = summary(records)
+    if not groups:
+        return
+    print()
+    print("Profile")
+    for (filename, vis), stages in groups.items():
+        title = ", ".join(str(x) for x in (filename, vis) if x)
+        print()
+        print(title or "(run)")
+        print(f"  {'stage':36s} {'calls':>7s} {'total s':>10s} {'mean s':>10s} {'peak MB':>9s}")
+        for path, (calls, total, peak) in stages.items():
+            depth = path.count("/")
+            name = "  " * depth + path.rsplit("/", 1)[-1]
+            memory = f"{peak / 2**20:9.1f}" if peak is not None else ""
+            print(f"  {name:36s} {calls:7d} {total:10.4f} {total / calls:10.4f} {memory}")
+
+
+def trace(records):
+    """records as a JSON trace in the Chrome trace event format, viewable in chrome://tracing or Perfetto."""
+    events = []
+    for r in records:
+        args = {k: v for k, v in r.items() if k not in ("stage", "start", "time", "pid")}
+        events.append({"name": r["stage"].rsplit("/", 1)[-1], "cat": r.get("vis", ""), "ph": "X",
+                       "ts": r["start"] * 1e6, "dur": r["time"] * 1e6, "pid": r["pid"], "tid": 0, "args": args})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def add_arguments(parser):
+    """Add the profiling options to argument parser parser."""
+    parser.add_argument("--profile",
+                        dest='profile',
+                        action='store_true',
+                        default=False,
+                        help='Time the stages of the run and print a breakdown per input file (and visualization).')
+    parser.add_argument("--profile-memory",
+                        dest='profile_memory',
+                        action='store_true',
+                        default=False,
+                        help='Also record the peak memory allocated in each stage, with tracemalloc; this slows the run down.')
+    parser.add_argument("--profile-json",
+                        dest='profile_json',
+                        action='store',
+                        default=None,
+                        help='Write the profiled stages to this file as a JSON trace (Chrome trace event format).')
+    parser.add_argument("--profile-stats",
+                        dest='profile_stats',
+                        action='store',
+                        default=None,
+                        help='Also run cProfile over the main process and write its stats to this file, for pstats.')
+
+
+def requested(args):
+    """Whether the options of add_arguments in args ask for profiling."""
+    return bool(args.profile or args.profile_memory or args.profile_json or args.profile_stats)
+
+
+@contextlib.contextmanager
+def session(args, **labels):
+    """Profile the enclosed block as the options of add_arguments in args request, then report and write the results.
+    labels (e.g. file=...) are added to every stage. Yields the Profiler, or None if profiling was not requested."""
+    if not requested(args):
+        yield None
+        return
+    profiler = enable(args.profile_memory)
+    profiler.labels = dict(labels)
+    stats = None
+    if args.profile_stats:
+        import cProfile
+        stats = cProfile.Profile()
+        stats.enable()
+    try:
+        yield profiler
+    finally:
+        if stats is not None:
+            stats.disable()
+        disable()
+        report(profiler.records)
+        if stats is not None:
+            stats.dump_stats(args.profile_stats)
+            print(f"Wrote {args.profile_stats}.")
+        if args.profile_json:
+            with open(args.profile_json, "w") as f:
+                json.dump(trace(profiler.records), f)
+            print(f"Wrote {args.profile_json}.")
@@ -0,0 +1,271 @@
+# Copyright (c) 2020 Performance Portability authors
+# SPDX-License-Identifier: MIT
+
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+
+# A results store holds one row per result, in columns: the keys are
+# integer codes into per-key vocabularies of names, the value is a float,
+# and "supported" marks the platforms an implementation ran on (instead of
+# X entries). It is saved as an uncompressed .npz, so that every column
+# can be memory-mapped straight from the file when it is loaded.
+
+KEYS = ["application", "platform", "model", "compiler", "year"]
+
+
+class Store:
+    """Performance results in columnar form, keyed by application, platform, model, compiler and year."""
+
+    def __init__(self, codes, vocab, value, supported, throughput):
+        """codes and vocab map each of KEYS to an int array of codes and an array of the names they index;
+        value and supported are the float results and the unsupported-platform mask;
+        throughput is the set of applications whose results are higher-is-better."""
+        self.codes = codes
+        self.vocab = vocab
+        self.value = value
+        self.supported = supported
+        self.throughput = set(throughput)
+
+    def __len__(self):
+        return len(self.value)
+
+    def names(self, key):
+        """The names of key (one of KEYS) in the order of their codes."""
+        return [str(n) for n in self.vocab[key]]
+
+    def column(self, key):
+        """Names of key for every row, as a numpy array of strings."""
+        return np.asarray(self.vocab[key])[self.codes[key]]
+
+    def select(self, **keys):
+        """Boolean mask of the rows matching keys, e.g. select(application="babelstream", year="2020")."""
+        mask = np.ones(len(self), dtype=bool)
+        for key, name in keys.items():
+            if name is None:
+                continue
+            names = self.names(key)
+            if name not in names:
+                return np.zeros(len(self), dtype=bool)
+            mask &= self.codes[key] == names.index(name)
+        return mask
+
+    def _only(self, key, mask):
+        # The single name of key among rows mask
+        codes = np.unique(self.codes[key][mask])
+        if len(codes) != 1:
+            names = ", ".join(repr(self.names(key)[c]) for c in codes)
+            raise ValueError(f"Results store holds several values of {key}; choose one of {names}")
+        return self.names(key)[codes[0]]
+
+    def resolve(self, application=None, year=None):
+        """The (application, year) of the results selected by application and year, filling in the only ones if None.
+        Raises ValueError, naming the choices, if they do not select the results of exactly one application and year."""
+        if application is not None and application not in self.names("application"):
+            names = ", ".join(repr(n) for n in self.names("application"))
+            raise ValueError(f"Results store holds no application {application!r}; choose one of {names}")
+        if application is None:
+            application = self._only("application", self.select())
+        if year is not None and not self.select(application=application, year=year).any():
+            names = ", ".join(repr(str(n)) for n in np.unique(self.column("year")[self.select(application=application)]))
+            raise ValueError(f"Results store holds no {application} results of year {year!r}; choose one of {names}")
+        if year is None:
+            year = self._only("year", self.select(application=application))
+        return application, year
+
+    def table(self, application=None, year=None, compiler=None):
+        """Return the platform x model results dataframe of application and year (the only ones, if None), in the layout of pp_data.read_results.
+        Where several compilers match, each cell holds the best result; cells with no supported result are NaN."""
+        import pandas
+        application, year = self.resolve(application, year)
+        rows = np.flatnonzero(self.select(application=application, year=year, compiler=compiler))
+
+        # Platforms and models in order of first appearance
+        plats, plat_first, plat_idx = np.unique(self.codes["platform"][rows], return_index=True, return_inverse=True)
+        models, model_first, model_idx = np.unique(self.codes["model"][rows], return_index=True, return_inverse=True)
+        plat_order = np.argsort(plat_first)
+        model_order = np.argsort(model_first)
+
+        vals = np.full((len(plats), len(models)), np.nan)
+        best = np.fmax if application in self.throughput else np.fmin
+        ok = self.supported[rows]
+        best.at(vals, (np.argsort(plat_order)[plat_idx[ok]], np.argsort(model_order)[model_idx[ok]]), self.value[rows][ok])
+
+        df = pandas.DataFrame(vals, columns=[str(m) for m in np.asarray(self.vocab["model"])[models[model_order]]])
+        df.insert(0, "Device", [str(p) for p in np.asarray(self.vocab["platform"])[plats[plat_order]]])
+        return df
+
+    def save(self, filename):
+        """Write the store to filename as an uncompressed .npz."""
+        arrays = {"value": np.asarray(self.value, dtype=float),
+                  "supported": np.asarray(self.supported, dtype=bool),
+                  "throughput": np.array(sorted(self.throughput), dtype=str)}
+        for key in KEYS:
+            arrays[f"{key}_code"] = np.asarray(self.codes[key], dtype=np.int32)
+            arrays[f"{key}_names"] = np.array(self.names(key), dtype=str)
+        with open(filename, "wb") as f:
+            np.savez(f, **arrays)
+
+
+def _npz_memmaps(filename):
+    # Map each array stored uncompressed in the .npz at its offset in the
+    # file; compressed members (or anything unusual) are read normally.
+    arrays = {}
+    with zipfile.ZipFile(filename) as zf, open(filename, "rb") as f:
+        for info in zf.infolist():
+            name = info.filename[:-len(".npy")]
+            if info.compress_type != zipfile.ZIP_STORED:
+                continue
+            # Local file header: 30 fixed bytes, then the name and extra field
+            f.seek(info.header_offset + 26)
+            name_len, extra_len = [int(n) for n in np.frombuffer(f.read(4), dtype="<u2")]
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+            elif version == (2, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+            else:
+                continue
+            if dtype.hasobject:
+                continue
+            if np.prod(shape) == 0:
+                arrays[name] = np.empty(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(filename, dtype=dtype, mode="r", offset=f.tell(),
+                                         shape=shape, order="F" if fortran else "C")
+    return arrays
+
+
+def load(filename, mmap=True):
+    """Load a store saved by Store.save, memory-mapping its columns unless mmap is false."""
+    arrays = _npz_memmaps(filename) if mmap else {}
+    missing = None
+    with np.load(filename) as npz:
+        missing = {k: npz[k] for k in npz.files if k not in arrays}
+    arrays.update(missing)
+    return Store({key: arrays[f"{key}_code"] for key in KEYS},
+                 {key: arrays[f"{key}_names"] for key in KEYS},
+                 arrays["value"],
+                 arrays["supported"],
+                 [str(t) for t in arrays["throughput"]])
+
+
+def from_frame(df):
+    """Build a store from a dataframe with one row per result: the KEYS columns, "value", and optionally "supported" (default: value is not NaN) and "throughput" (bool, per application).
+    Tables list platforms and models in the order they first appear in df."""
+    import pandas
+    codes = {}
+    vocab = {}
+    for key in KEYS:
+        col = df[key].fillna("").astype(str) if key in df else pandas.Series([""] * len(df))
+        codes[key], uniques = pandas.factorize(col, sort=False)
+        codes[key] = codes[key].astype(np.int32)
+        vocab[key] = np.array([str(u) for u in uniques], dtype=str)
+    value = df["value"].to_numpy(dtype=float)
+    if "supported" in df:
+        supported = df["supported"].to_numpy(dtype=bool) & ~np.isnan(value)
+    else:
+        supported = ~np.isnan(value)
+    throughput = set()
+    if "throughput" in df:
+        throughput = set(df.loc[df["throughput"].astype(bool), "application"].astype(str))
+    return Store(codes, vocab, np.where(supported, value, 0.0), supported, throughput)
+
+
+def frame_from_results(df, application, year="", compiler="", throughput=False):
+    """One row per result for a results dataframe df (as read by pp_data.read_results) of application.
+    X entries become unsupported rows."""
+    import pandas
+    long = df.melt(id_vars=df.columns[0], var_name="model", value_name="value")
+    long = long.rename(columns={df.columns[0]: "platform"})
+    long["application"] = application
+    long["compiler"] = compiler
+    long["year"] = year
+    long["throughput"] = throughput
+    long["value"] = pandas.to_numeric(long["value"], errors="coerce")
+    return long
+
+
+def merge(*frames):
+    """Concatenate frames of rows (as taken by from_frame) into one store."""
+    import pandas
+    return from_frame(pandas.concat(frames, ignore_index=True))
+
+
+def split_spec(spec):
+    """Split a store reference "results.npz[:application[:year]]" into (filename, application, year); missing parts are None.
+    An empty year ("results.npz:babelstream:") selects results without a year."""
+    parts = str(spec).split(":")
+    filename = parts[0]
+    application = parts[1] if len(parts) > 1 and parts[1] else None
+    year = parts[2] if len(parts) > 2 else None
+    return filename, application, year
+
+
+def is_store(spec):
+    """Whether spec refers to a store rather than a csv file."""
+    return split_spec(spec)[0].endswith(".npz")
+
+
+def read_table(spec):
+    """Read the results dataframe of store reference spec (see split_spec)."""
+    filename, application, year = split_spec(spec)
+    return load(filename).table(application, year)
+
+
+def resolve(spec):
+    """(filename, application, year) of store reference spec, with omitted parts filled in; see Store.resolve."""
+    filename, application, year = split_spec(spec)
+    return (filename,) + load(filename).resolve(application, year)
+
+
+def describe_csv(filename):
+    """Application and year of a metrics csv file from its name, e.g. babelstream_2020.csv gives ("babelstream", "2020")."""
+    stem = Path(filename).stem
+    parts = stem.split("_")
+    if len(parts) > 1 and parts[-1].isdigit():
+        return "_".join(parts[:-1]), parts[-1]
+    return stem, ""
+
+
+if __name__ == '__main__':
+    import sys
+    import argparse
+
+    import pp_data
+
+    desc = "Convert metrics csv files into a columnar results store"
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument("-o",
+                        "--output",
+                        dest='output',
+                        action='store',
+                        required=True,
+                        help='Write the store to this .npz file.')
+    parser.add_argument("-t",
+                        "--throughput",
+                        dest='throughput',
+                        action='append',
+                        default=[],
+                        help='Application whose results are throughput (higher is better); may be repeated.')
+    parser.add_argument('csvfiles',
+                        metavar='<CSV-FILE>+',
+                        nargs=argparse.REMAINDER)
+
+    args = parser.parse_args()
+
+    if len(args.csvfiles) == 0:
+        print("No input files specified.")
+        sys.exit(1)
+
+    frames = []
+    for filename in args.csvfiles:
+        application, year = describe_csv(filename)
+        frames.append(frame_from_results(pp_data.read_results(filename), application, year,
+                                         throughput=application in args.throughput))
+    store = merge(*frames)
+    store.save(args.output)
+    print(f"Wrote {args.output}.")
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# Copyright (c) 2020 Performance Portability authors
+# SPDX-License-Identifier: MIT
+
+import heapq
+import sys
+from math import comb
+
+import numpy as np
+
+import pp_data
+import pp_metrics
+import pp_profile
+
+
+# PP over a platform set H is |H| / sum(1/e_i), or 0 if H holds a platform
+# without support. Subsets with unsupported platforms are pruned up front,
+# and the 2^s subsets of the s supported platforms are enumerated in
+# Gray-code order, so each one differs from the last by one platform and
+# its reciprocal sum is one addition away. The low platforms are
+# enumerated once into a table; every step of the (Gray-code) walk over
+# the high platforms then evaluates a whole table of subsets at once.
+
+
+def gray_subsets(recips):
+    """All subsets of platforms with reciprocal efficiencies recips, in Gray-code order.
+    Returns the arrays (masks, sums, sizes): bitmasks of the subsets, their reciprocal sums and their sizes."""
+    n = len(recips)
+    i = np.arange(1, 2**n, dtype=np.int64)
+    # Step i flips the lowest set bit of i
+    bit = np.log2(i & -i).astype(np.int64)
+    masks = i ^ (i >> 1)
+    sign = np.where((masks >> bit) & 1, 1, -1)
+    sums = np.concatenate(([0.0], np.cumsum(sign * np.asarray(recips, dtype=float)[bit])))
+    sizes = np.concatenate(([0], np.cumsum(sign)))
+    return np.concatenate(([0], masks)), sums, sizes
+
+
+def mask_names(mask, names):
+    """The names of the platforms in bitmask mask."""
+    return [name for b, name in enumerate(names) if (mask >> b) & 1]
+
+
+def subset_pp(effs, names, top=10, sizes=None, low_bits=16):
+    """Evaluate PP (in the units of effs) over every subset of the platforms names, with efficiencies effs (0 if unsupported).
+    If sizes is given, only subsets of those sizes are considered.
+    Returns the top subsets, as a list of (pp, names) with the best first, and a summary dataframe with a row per subset size."""
+    import pandas
+    effs = np.asarray(effs, dtype=float)
+    supported = np.flatnonzero(effs > 0)
+    s = len(supported)
+    n = len(effs)
+    recips = 1.0 / effs[supported]
+    names = [names[i] for i in supported]
+    size_ok = np.ones(s + 1, dtype=bool) if sizes is None else np.isin(np.arange(s + 1), list(sizes))
+    size_ok[0] = False
+
+    low = min(s, low_bits)
+    low_masks, low_sums, low_sizes = gray_subsets(recips[:low])
+    # Group the low table by size, so that per-size reductions are reduceat calls
+    order = np.argsort(low_sizes, kind='stable')
+    low_masks, low_sums, low_sizes = low_masks[order], low_sums[order], low_sizes[order]
+    starts = np.searchsorted(low_sizes, np.arange(low + 1))
+
+    best = np.full(s + 1, -np.inf)
+    best_mask = np.zeros(s + 1, dtype=np.int64)
+    worst = np.full(s + 1, np.inf)
+    total = np.zeros(s + 1)
+    heap = []
+
+    high_masks, high_sums, high_sizes = gray_subsets(recips[low:])
+    for hmask, hsum, hsize in zip(high_masks, high_sums, high_sizes):
+        k = low_sizes + hsize
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pps = k / (low_sums + hsum)
+        ks = np.arange(low + 1) + hsize
+        pps = np.where(size_ok[k], pps, np.nan)
+
+        seg_max = np.fmax.reduceat(pps, starts)
+        seg_min = np.fmin.reduceat(pps, starts)
+        seg_sum = np.add.reduceat(np.nan_to_num(pps), starts)
+        better = seg_max > best[ks]
+        for j in np.flatnonzero(better):
+            end = starts[j + 1] if j + 1 < len(starts) else len(pps)
+            best[ks[j]] = seg_max[j]
+            best_mask[ks[j]] = (int(hmask) << low) | int(low_masks[starts[j] + np.nanargmax(pps[starts[j]:end])])
+        worst[ks] = np.fmin(worst[ks], seg_min)
+        total[ks] += seg_sum
+
+        # Only subsets that beat the current N-th best can enter the top N
+        threshold = heap[0][0] if len(heap) >= top else -np.inf
+        cand = np.flatnonzero(pps > threshold)
+        if len(cand) > top:
+            cand = cand[np.argpartition(-pps[cand], top - 1)[:top]]
+        for c in cand:
+            item = (float(pps[c]), (int(hmask) << low) | int(low_masks[c]))
+            if len(heap) < top:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+
+    top_list = [(pp, mask_names(mask, names)) for pp, mask in sorted(heap, reverse=True)]
+
+    rows = []
+    for k in range(1, n + 1):
+        if sizes is not None and k not in sizes:
+            continue
+        supported_k = comb(s, k)
+        row = {"Size": k,
+               "Subsets": comb(n, k),
+               "Supported subsets": supported_k,
+               "Best PP": best[k] if k <= s and supported_k else 0.0,
+               "Best platforms": ", ".join(mask_names(int(best_mask[k]), names)) if k <= s and supported_k else "",
+               "Mean PP": (total[k] if k <= s else 0.0) / comb(n, k),
+               "Worst supported PP": worst[k] if k <= s and supported_k else np.nan}
+        rows.append(row)
+    # Explicit columns, as there are no rows if no requested size is at most the number of platforms
+    columns = ["Size", "Subsets", "Supported subsets", "Best PP", "Best platforms", "Mean PP", "Worst supported PP"]
+    return top_list, pandas.DataFrame(rows, columns=columns).set_index("Size")
+
+
+def top_table(results):
+    """Combine the top subsets of several implementations, a dict of name to the list returned by subset_pp, into one dataframe."""
+    import pandas
+    rows = []
+    for name, top in results.items():
+        for rank, (pp, plats) in enumerate(top, 1):
+            rows.append({"Implementation": name, "Rank": rank, "PP": pp, "Size": len(plats), "Platforms": ", ".join(plats)})
+    return pandas.DataFrame(rows, columns=["Implementation", "Rank", "PP", "Size", "Platforms"])
+
+
+def main():
+    parser = pp_metrics.argument_parser(
+        "Produce table of performance portability over subsets of the platforms")
+    parser.add_argument(
+        '--top',
+        type=int,
+        default=10,
+        help="Number of best subsets to report per implementation")
+    parser.add_argument(
+        '--top-file',
+        default=None,
+        help="Also write the best subsets of every implementation to this CSV file")
+    parser.add_argument(
+        '--size',
+        type=int,
+        action='append',
+        default=None,
+        help="Only consider subsets of this many platforms; may be repeated")
+    parser.add_argument(
+        '--max-platforms',
+        type=int,
+        default=30,
+        help="Skip implementations supported on more platforms than this, as there are 2^n subsets")
+    args = parser.parse_args()
+
+    if args.top < 1:
+        print("--top must be at least 1")
+        sys.exit(1)
+    if args.size is not None and min(args.size) < 1:
+        print("--size must be at least 1")
+        sys.exit(1)
+
+    pp_data.check_input(args.input_file)
+
+    with pp_profile.session(args, file=args.input_file):
+        with pp_profile.stage("read"):
+            data = pp_data.read_results(args.input_file)
+        spec = pp_data.read_spec(args.spec) if args.arch_efficiency else None
+        with pp_profile.stage("efficiencies"):
+            effs = pp_metrics.efficiencies(data, args.calc_efficiency, args.input_is_throughput,
+                                           args.arch_efficiency, spec, args.arch_scale, args.intensity)
+        platforms = [str(p) for p in effs[effs.columns[0]]]
+
+        tops = {}
+        summaries = []
+        for col in effs.columns[1:]:
+            e = effs[col].to_numpy(dtype=float)
+            if np.count_nonzero(e > 0) > args.max_platforms:
+                print(f"Skipping {col}: supported on more than {args.max_platforms} platforms")
+                continue
+            with pp_profile.stage("subsets"):
+                tops[col], summary = subset_pp(e, platforms, args.top, args.size)
+            summary.insert(0, "Implementation", col)
+            summaries.append(summary)
+            print(f"{col}:")
+            for rank, (value, plats) in enumerate(tops[col], 1):
+                print(f"  {rank:3d}. PP {value:6.2f} over {len(plats)}: {', '.join(plats)}")
+
+        if not summaries:
+            print("No implementations to analyse")
+            return
+
+        import pandas
+
+        results = pandas.concat(summaries).set_index("Implementation", append=True).swaplevel()
+        pp_metrics.write_table(results, args)
+
+        if args.top_file:
+            top_table(tops).to_csv(args.top_file, index=False, float_format="%.2f")
+            print(f"Wrote {args.top_file}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# Copyright (c) 2020 Performance Portability authors
+# SPDX-License-Identifier: MIT
+
+import math
+import re
+import zipfile
+
+import numpy as np
+
+
+# The archetypes of ../data/metrics_data_synthetic.csv, as efficiencies in
+# percent, generalized to any number of platforms. Each application
+# (column) follows one archetype, drawn from a weighted mix. Rows are
+# generated in blocks of BLOCK platforms, each from its own seeded random
+# stream, so that output is the same however it is written and a block
+# never has to hold more than BLOCK rows.
+
+BLOCK = 4096
+
+# Archetype name -> description
+ARCHETYPES = {"unportable": "100 on one platform, unsupported (0) on the rest",
+              "single": "100 on one platform, 10 on the rest (Single Target)",
+              "multi": "100 on a random half of the platforms, 10 on the rest (Multi Target)",
+              "consistent-N": "N on every platform, e.g. consistent-70 (Consistent-70)",
+              "inconsistent": "spread evenly from 10 to 100 across the platforms (Inconsistent)"}
+
+DEFAULT_MIX = "unportable=1,single=1,consistent-70=1,consistent-30=1,multi=1,inconsistent=1"
+
+# Column name prefixes, as in metrics_data_synthetic.csv
+_titles = {"unportable": "Unportable", "single": "Single Target", "multi": "Multi Target",
+           "consistent": "Consistent", "inconsistent": "Inconsistent"}
+_kinds = ["unportable", "single", "multi", "consistent", "inconsistent"]
+
+
+def parse_mix(text):
+    """Parse a mix such as "single=2,consistent-70=1" into a dict of archetype to weight."""
+    mix = {}
+    for part in text.split(","):
+        if not part:
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip().lower()
+        kind = name.split("-")[0]
+        if kind not in _kinds or (kind == "consistent") != ("-" in name):
+            raise ValueError(f"Unknown archetype {name!r}; choose from {', '.join(ARCHETYPES)}")
+        if kind == "consistent" and not 0.0 < float(name.split("-")[1]) <= 100.0:
+            raise ValueError(f"Efficiency of {name!r} must be in (0, 100]")
+        mix[name] = float(weight) if weight else 1.0
+    return mix
+
+
+class Generator:
+    """Synthetic efficiencies (in percent) of applications following archetypes, on any number of platforms."""
+
+    def __init__(self, platforms, applications, mix=DEFAULT_MIX, unsupported=0.0, noise=0.0, seed=0):
+        """mix is a dict or string (see parse_mix) of archetype weights; a fraction unsupported of all results are unsupported (X),
+        and supported efficiencies get normal noise of standard deviation noise (percentage points), clipped to (0, 100]."""
+        if isinstance(mix, str):
+            mix = parse_mix(mix)
+        self.platforms = platforms
+        self.applications = applications
+        self.unsupported = unsupported
+        self.noise = noise
+        self.seed = seed
+        rng = np.random.default_rng([seed, 0])
+        names = list(mix)
+        weights = np.array([mix[n] for n in names], dtype=float)
+        chosen = rng.choice(len(names), size=applications, p=weights / weights.sum())
+        self.archetypes = [names[c] for c in chosen]
+        self.kind = np.array([_kinds.index(a.split("-")[0]) for a in self.archetypes])
+        self.level = np.array([float(a.split("-")[1]) if "-" in a else 0.0 for a in self.archetypes])
+        self.target = rng.integers(0, platforms, size=applications)
+
+    def columns(self):
+        """Application (column) names, numbered within each archetype."""
+        counts = {}
+        names = []
+        for a in self.archetypes:
+            kind, _, level = a.partition("-")
+            title = f"{_titles[kind]}-{level}" if level else _titles[kind]
+            counts[title] = counts.get(title, 0) + 1
+            names.append(f"{title} {counts[title]}")
+        return names
+
+    def platform_names(self, start=0, stop=None):
+        """Names of platforms start to stop."""
+        return [f"Platform {i}" for i in range(start, self.platforms if stop is None else stop)]
+
+    def block(self, b):
+        """Efficiencies of block b of platforms, as a (rows, applications) array with NaN where unsupported."""
+        start = b * BLOCK
+        stop = min(start + BLOCK, self.platforms)
+        rng = np.random.default_rng([self.seed, 1, b])
+        rows = np.arange(start, stop)[:, np.newaxis]
+        kind = self.kind[np.newaxis, :]
+        spread = 10.0 + 90.0 * rows / max(self.platforms - 1, 1)
+        on_target = rows == self.target[np.newaxis, :]
+        vals = np.select([kind == 0, kind == 1, kind == 2, kind == 3],
+                         [np.where(on_target, 100.0, 0.0),
+                          np.where(on_target, 100.0, 10.0),
+                          np.where(rng.random((len(rows), self.applications)) < 0.5, 100.0, 10.0),
+                          np.broadcast_to(self.level, (len(rows), self.applications))],
+                         np.broadcast_to(spread, (len(rows), self.applications)))
+        if self.noise > 0:
+            noisy = vals + rng.normal(0.0, self.noise, size=vals.shape)
+            vals = np.where(vals > 0, np.clip(noisy, 0.01, 100.0), 0.0)
+        if self.unsupported > 0:
+            vals[rng.random(vals.shape) < self.unsupported] = np.nan
+        return vals
+
+    def blocks(self):
+        """Yield (platform names, efficiencies) of every block of platforms in order."""
+        for b in range(math.ceil(self.platforms / BLOCK)):
+            vals = self.block(b)
+            start = b * BLOCK
+            yield self.platform_names(start, start + len(vals)), vals
+
+    def frame(self):
+        """All efficiencies as a dataframe in the layout of pp_data.read_results. Only for sizes that fit in memory."""
+        import pandas
+        df = pandas.DataFrame(np.concatenate([v for _, v in self.blocks()]), columns=self.columns())
+        df.insert(0, "Device", self.platform_names())
+        return df
+
+    def write_csv(self, f, float_format="%.2f"):
+        """Write a metrics csv file to file object f, one block of rows at a time, with X for unsupported results."""
+        f.write(",".join(["Device"] + self.columns()) + "\n")
+        fixed = re.fullmatch(r"%\.([0-4])f", float_format)
+        if fixed:
+            # Efficiencies are in [0, 100], so every value to a fixed number of decimals
+            # can be looked up in a table of its formatted strings, much faster than formatting each
+            scale = 10 ** int(fixed.group(1))
+            table = np.array([float_format % (k / scale) for k in range(100 * scale + 1)] + ["X"], dtype=object)
+        for names, vals in self.blocks():
+            if fixed:
+                idx = np.full(vals.shape, len(table) - 1)
+                ok = ~np.isnan(vals)
+                idx[ok] = np.rint(vals[ok] * scale)
+                f.write("".join(name + "," + ",".join(row) + "\n" for name, row in zip(names, table[idx].tolist())))
+            else:
+                import pandas
+
+                df = pandas.DataFrame(vals, columns=self.columns())
+                df.insert(0, "Device", names)
+                df.to_csv(f, index=False, header=False, na_rep="X", float_format=float_format)
+
+    def write_store(self, filename, application="synthetic"):
+        """Write a results store (see pp_store) to filename, streaming each column one block at a time."""
+        n = self.platforms * self.applications
+        a = self.applications
+
+        def values():
+            for _, vals in self.blocks():
+                yield np.where(np.isnan(vals), 0.0, vals).ravel()
+
+        def supported():
+            for _, vals in self.blocks():
+                yield ~np.isnan(vals).ravel()
+
+        def platform_codes():
+            for b in range(math.ceil(self.platforms / BLOCK)):
+                rows = np.arange(b * BLOCK, min((b + 1) * BLOCK, self.platforms), dtype=np.int32)
+                yield np.repeat(rows, a)
+
+        def model_codes():
+            for b in range(math.ceil(self.platforms / BLOCK)):
+                yield np.tile(np.arange(a, dtype=np.int32), min(BLOCK, self.platforms - b * BLOCK))
+
+        def zeros():
+            for b in range(math.ceil(self.platforms / BLOCK)):
+                yield np.zeros(min(BLOCK, self.platforms - b * BLOCK) * a, dtype=np.int32)
+
+        with zipfile.ZipFile(filename, "w", zipfile.ZIP_STORED, allowZip64=True) as zf:
+            _write_array(zf, "throughput", np.array([], dtype=str))
+            _write_array(zf, "application_names", np.array([application], dtype=str))
+            _write_array(zf, "platform_names", np.array(self.platform_names(), dtype=str))
+            _write_array(zf, "model_names", np.array(self.columns(), dtype=str))
+            _write_array(zf, "compiler_names", np.array([""], dtype=str))
+            _write_array(zf, "year_names", np.array([""], dtype=str))
+            _write_stream(zf, "value", np.float64, n, values())
+            _write_stream(zf, "supported", np.bool_, n, supported())
+            _write_stream(zf, "platform_code", np.int32, n, platform_codes())
+            _write_stream(zf, "model_code", np.int32, n, model_codes())
+            for key in ["application", "compiler", "year"]:
+                _write_stream(zf, f"{key}_code", np.int32, n, zeros())
+
+
+def _write_array(zf, name, array):
+    # A small array as member name.npy of zip file zf
+    with zf.open(f"{name}.npy", "w", force_zip64=True) as f:
+        np.lib.format.write_array(f, array, allow_pickle=False)
+
+
+def _write_stream(zf, name, dtype, count, chunks):
+    # A 1D array of count elements of dtype as member name.npy of zip file zf,
+    # written from the arrays yielded by chunks
+    with zf.open(f"{name}.npy", "w", force_zip64=True) as f:
+        np.lib.format.write_array_header_1_0(f, {"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                                                 "fortran_order": False,
+                                                 "shape": (count,)})
+        for chunk in chunks:
+            f.write(np.ascontiguousarray(chunk, dtype=dtype).tobytes())
+
+
+if __name__ == '__main__':
+    import sys
+    import argparse
+
+    desc = "Generate synthetic efficiencies of archetypal applications on many platforms"
+    epilog = "Archetypes: " + "; ".join(f"{k}: {v}" for k, v in ARCHETYPES.items())
+    parser = argparse.ArgumentParser(description=desc, epilog=epilog)
+    parser.add_argument("-p",
+                        "--platforms",
+                        dest='platforms',
+                        action='store',
+                        type=int,
+                        default=10,
+                        help='Number of platforms (rows).')
+    parser.add_argument("-a",
+                        "--applications",
+                        dest='applications',
+                        action='store',
+                        type=int,
+                        default=6,
+                        help='Number of applications (columns).')
+    parser.add_argument("-m",
+                        "--mix",
+                        dest='mix',
+                        action='store',
+                        default=DEFAULT_MIX,
+                        help='Weights of the archetypes the applications are drawn from, e.g. "single=2,consistent-70=1".')
+    parser.add_argument("-x",
+                        "--unsupported",
+                        dest='unsupported',
+                        action='store',
+                        type=float,
+                        default=0.0,
+                        help='Fraction of results that are unsupported (X).')
+    parser.add_argument("--noise",
+                        dest='noise',
+                        action='store',
+                        type=float,
+                        default=0.0,
+                        help='Standard deviation of normal noise added to supported efficiencies, in percentage points.')
+    parser.add_argument("--seed",
+                        dest='seed',
+                        action='store',
+                        type=int,
+                        default=0,
+                        help='Random seed.')
+    parser.add_argument("-F",
+                        "--float-format",
+                        dest='float_format',
+                        action='store',
+                        default="%.2f",
+                        help='printf-style format of values in csv output.')
+    parser.add_argument("-n",
+                        "--name",
+                        dest='name',
+                        action='store',
+                        default="synthetic",
+                        help='Application name of the results in a store.')
+    parser.add_argument('output',
+                        metavar='<OUTPUT>',
+                        help='Output file: a .npz results store, a csv file, or - for csv on standard output.')
+
+    args = parser.parse_args()
+
+    try:
+        gen = Generator(args.platforms, args.applications, args.mix, args.unsupported, args.noise, args.seed)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+
+    if args.output == "-":
+        gen.write_csv(sys.stdout, args.float_format)
+    elif args.output.endswith(".npz"):
+        gen.write_store(args.output, args.name)
+        print(f"Wrote {args.output}.")
+    else:
+        with open(args.output, "w", newline="") as f:
+            gen.write_csv(f, args.float_format)
+        print(f"Wrote {args.output}.")
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# Copyright (c) 2020 Performance Portability authors
+# SPDX-License-Identifier: MIT
+
+import numpy as np
+
+import pp_data
+import pp_store
+
+
+# Trends are computed on one long frame with a row per (application,
+# platform, model, year) result, as held by a results store. Efficiencies,
+# PP and deltas are groupby and pivot operations over the whole frame, so
+# each additional year adds rows, not passes.
+
+# Platforms named differently across the study years, and their names in the metrics csv files of pp_ingest
+PLATFORM_ALIASES = {"Knights Landing": "KNL"}
+
+
+def long_frame(store, undated_year=None, aliases=None):
+    """One row per result of store: application, platform, model, year, value (NaN if unsupported) and throughput.
+    Results without a year get undated_year; platforms are renamed by aliases (default PLATFORM_ALIASES)."""
+    import pandas
+    aliases = PLATFORM_ALIASES if aliases is None else aliases
+    df = pandas.DataFrame({key: store.column(key) for key in ["application", "platform", "model", "year"]})
+    df["value"] = np.where(store.supported, store.value, np.nan)
+    df["throughput"] = df["application"].isin(store.throughput)
+    df["platform"] = df["platform"].replace(aliases)
+    if undated_year is not None:
+        df["year"] = df["year"].replace("", str(undated_year))
+    return df
+
+
+def load(inputs, throughput=(), undated_year=None, aliases=None):
+    """Read csv files (application and year from their names, see pp_store.describe_csv) and results stores into one long_frame.
+    throughput lists the applications of the csv files whose results are higher-is-better."""
+    import pandas
+    frames = []
+    stores = []
+    for filename in inputs:
+        if pp_store.is_store(filename):
+            stores.append(pp_store.load(pp_store.split_spec(filename)[0]))
+        else:
+            application, year = pp_store.describe_csv(filename)
+            frames.append(pp_store.frame_from_results(pp_data.read_results(filename), application, year,
+                                                      throughput=application in throughput))
+    if frames:
+        stores.append(pp_store.merge(*frames))
+    return pandas.concat([long_frame(s, undated_year, aliases) for s in stores], ignore_index=True)
+
+
+def efficiencies(df):
+    """Application efficiencies (in percent) of long frame df: the best result of every (application, platform, model, year), over compilers and inputs,
+    divided into the best result of its platform in that year (the reverse for throughput). Unsupported results are NaN."""
+    # Negate throughput so that lower is better throughout
+    signed = np.where(df["throughput"], -df["value"], df["value"])
+    keys = ["application", "platform", "model", "year"]
+    best = df.assign(signed=signed).groupby(keys, sort=False).agg(signed=("signed", "min"), throughput=("throughput", "first")).reset_index()
+    row_best = best.groupby(["application", "platform", "year"], sort=False)["signed"].transform("min")
+    best["efficiency"] = 100.0 * np.where(best["throughput"], best["signed"] / row_best, row_best / best["signed"])
+    return best[keys + ["efficiency"]]
+
+
+def common_platforms(effs):
+    """Restrict efficiencies effs to the platforms that every year of their application has results for."""
+    years = effs.groupby("application")["year"].transform("nunique")
+    plat_years = effs.groupby(["application", "platform"])["year"].transform("nunique")
+    return effs[plat_years == years]
+
+
+def uncommon_platforms(effs):
+    """The platforms of each application of efficiencies effs that some year of the application has no results for, as a dict of application to sorted names.
+    Applications whose years cover the same platforms are left out."""
+    years = effs.groupby("application")["year"].transform("nunique")
+    plat_years = effs.groupby(["application", "platform"])["year"].transform("nunique")
+    missing = effs[plat_years < years]
+    return {application: sorted(group["platform"].unique()) for application, group in missing.groupby("application", sort=False)}
+
+
+def pp_table(effs):
+    """Performance portability of every application and model in each year of efficiencies effs, as a dataframe indexed by (application, model) with a column per year.
+    A model not supported on every platform of its application in a year has PP 0; application-years a model has no results in are NaN."""
+    import pandas
+    n = effs.groupby(["application", "year"])["platform"].nunique()
+    ok = effs.dropna(subset=["efficiency"])
+    sums = (100.0 / ok["efficiency"]).groupby([ok["application"], ok["model"], ok["year"]]).agg(["sum", "count"])
+    models = effs.groupby(["application", "model", "year"]).size().index
+    sums = sums.reindex(models, fill_value=0)
+    total = n.reindex(sums.index.droplevel("model")).to_numpy()
+    with np.errstate(divide='ignore'):
+        pp = np.where(sums["count"].to_numpy() == total, 100.0 * total / sums["sum"].to_numpy(), 0.0)
+    order = pandas.MultiIndex.from_frame(effs[["application", "model"]].drop_duplicates())
+    return pandas.Series(pp, index=sums.index).unstack("year").reindex(order).sort_index(axis=1)
+
+
+def cell_deltas(effs):
+    """Efficiency of every (application, platform, model) in each year of effs, and the changes between consecutive years (see changes)."""
+    wide = effs.pivot_table(index=["application", "platform", "model"], columns="year", values="efficiency", dropna=False)
+    wide.columns = [str(c) for c in wide.columns]
+    return changes(wide).dropna(how="all")
+
+
+def changes(table):
+    """Add a "<y1> to <y2>" column of differences between consecutive year columns of table."""
+    years = sorted(table.columns)
+    out = table[years].copy()
+    for y1, y2 in zip(years, years[1:]):
+        out[f"{y1} to {y2}"] = table[y2] - table[y1]
+    return out
+
+
+def regressions(table, threshold):
+    """The rows of table (from changes or cell_deltas) with a drop of more than threshold (percentage points) between two years, and the largest drop."""
+    deltas = table[[c for c in table.columns if " to " in c]]
+    worst = deltas.min(axis=1)
+    return table.assign(**{"Largest drop": -worst})[worst < -threshold]
+
+
+def report_table(pps, application):
+    """The PP trend of application (from changes(pp_table(...))) in the layout of the averages.py tables: one row per year or change and one column per model."""
+    t = pps.loc[application].T
+    t.index = [f"Performance Portability ({c})" if " to " not in c else f"Performance Portability change ({c})" for c in t.index]
+    t.columns.name = None
+    return t
+
+
+if __name__ == '__main__':
+    import sys
+    import argparse
+
+    desc = "Relate the metrics of several study years: efficiency and PP changes, and regressions"
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument("-o",
+                        "--output-prefix",
+                        dest='oprefix',
+                        action='store',
+                        default="./",
+                        help='Write output files with a specific prefix')
+    parser.add_argument("-t",
+                        "--throughput",
+                        dest='throughput',
+                        action='append',
+                        default=[],
+                        help='Application whose csv results are throughput (higher is better); may be repeated.')
+    parser.add_argument("--undated-year",
+                        dest='undated_year',
+                        action='store',
+                        default="2019",
+                        help='Year of results without one, such as the 2019 study csv files (e.g. babelstream.csv).')
+    parser.add_argument("--alias",
+                        dest='aliases',
+                        action='append',
+                        default=[],
+                        metavar='NAME=PLATFORM',
+                        help='Treat platform NAME as PLATFORM in every year; may be repeated.')
+    parser.add_argument("--all-platforms",
+                        dest='common',
+                        action='store_false',
+                        default=True,
+                        help='Compute PP over all platforms of each year, rather than only those that every year has results for.')
+    parser.add_argument("--threshold",
+                        dest='threshold',
+                        action='store',
+                        type=float,
+                        default=5.0,
+                        help='Report efficiency and PP drops of more than this many percentage points.')
+    parser.add_argument("-F",
+                        "--formats",
+                        dest='formats',
+                        action='store',
+                        default="csv,tex",
+                        help='Output formats of the PP tables: csv, tex or both.')
+    parser.add_argument('inputs',
+                        metavar='<CSV-FILE-OR-STORE>+',
+                        nargs=argparse.REMAINDER)
+
+    args = parser.parse_args()
+
+    if len(args.inputs) == 0:
+        print("No input files specified.")
+        sys.exit(1)
+
+    aliases = dict(PLATFORM_ALIASES)
+    aliases.update(a.split("=", 1) for a in args.aliases)
+    df = load(args.inputs, args.throughput, args.undated_year, aliases)
+    effs = efficiencies(df)
+    for application, platforms in uncommon_platforms(effs).items():
+        if args.common:
+            print(f"{application}: leaving out platforms without results in every year: {', '.join(platforms)}")
+        else:
+            print(f"Warning: {application}: PP is compared over different platforms, as not every year has results for {', '.join(platforms)}")
+    if args.common:
+        effs = common_platforms(effs)
+
+    cells = cell_deltas(effs)
+    pps = changes(pp_table(effs))
+
+    for application in pps.index.get_level_values("application").unique():
+        table = report_table(pps, application)
+        print(application)
+        print(table)
+        print()
+        for fmt in args.formats.split(","):
+            of = f"{args.oprefix}{application}_trend.{fmt}"
+            if fmt == "tex":
+                table.to_latex(of, float_format="%.2f")
+            else:
+                table.to_csv(of, float_format="%.2f")
+            print(f"Wrote {of}.")
+
+    of = f"{args.oprefix}trend_cells.csv"
+    cells.to_csv(of, float_format="%.2f")
+    print(f"Wrote {of}.")
+
+    for (application, model), r in regressions(pps, args.threshold).iterrows():
+        print(f"Regression: {application} {model} PP dropped by {r['Largest drop']:.2f}")
+    for (application, platform, model), r in regressions(cells, args.threshold).iterrows():
+        print(f"Regression: {application} {model} on {platform} efficiency dropped by {r['Largest drop']:.2f}")
@@ -0,0 +1,336 @@
+# Copyright (c) 2020 Performance Portability authors
+# SPDX-License-Identifier: MIT
+
+import bisect
+import math
+import re
+
+import numpy as np
+
+import pp_ingest
+
+
+class RunningStats:
+    """One-pass mean and variance (Welford's algorithm)."""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        """Account for sample x."""
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    def variance(self):
+        """Sample variance (ddof=1); NaN for fewer than two samples."""
+        return self.m2 / (self.n - 1) if self.n > 1 else math.nan
+
+    def stdev(self):
+        """Sample standard deviation."""
+        return math.sqrt(self.variance())
+
+
+class P2Quantile:
+    """Streaming estimate of quantile p with five markers and no stored samples.
+    R. Jain and I. Chlamtac, "The P2 algorithm for dynamic calculation of quantiles and histograms without storing observations",
+    Communications of the ACM, vol. 28, no. 10, pp. 1076-1085, 1985"""
+
+    def __init__(self, p):
+        self.p = p
+        self.count = 0
+        self.heights = []
+        self.pos = [1, 2, 3, 4, 5]
+        # Desired marker positions after the first five samples, and their increments per sample
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.incr = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        """Account for sample x."""
+        q = self.heights
+        self.count += 1
+        if self.count <= 5:
+            bisect.insort(q, x)
+            return
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = bisect.bisect_right(q, x) - 1
+        n = self.pos
+        for i in range(k + 1, 5):
+            n[i] += 1
+        extra = self.count - 5
+        for i in (1, 2, 3):
+            d = self.desired[i] + extra * self.incr[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                # Piecewise-parabolic prediction, falling back to linear
+                qp = q[i] + d / (n[i + 1] - n[i - 1]) * ((n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                                                        + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if not q[i - 1] < qp < q[i + 1]:
+                    qp = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = qp
+                n[i] += d
+
+    def value(self):
+        """Current estimate; exact while fewer than five samples have been seen."""
+        q = self.heights
+        if len(q) == 0:
+            return math.nan
+        if len(q) < 5:
+            return float(np.quantile(q, self.p))
+        return q[2]
+
+
+# Quantiles of step times reported for every run
+QUANTILES = [0.05, 0.5, 0.95]
+
+
+class StepTimes:
+    """Distribution of the per-step times of one run, accumulated one step at a time.
+    The first warmup_window steps are held back; when the run ends, leading steps among them that are
+    more than warmup_tolerance slower than the median of the run are counted as warm-up and left out."""
+
+    def __init__(self, warmup_window=10, warmup_tolerance=0.2):
+        self.warmup_window = warmup_window
+        self.warmup_tolerance = warmup_tolerance
+        self.head = []
+        self.stats = RunningStats()
+        self.quantiles = [P2Quantile(p) for p in QUANTILES]
+        self.total = 0.0
+        self.normalised = False
+
+    def add(self, t, elapsed=None):
+        """Account for a step that took time t (or elapsed, if t is normalised, e.g. per iteration)."""
+        self.total += t if elapsed is None else elapsed
+        if len(self.head) < self.warmup_window:
+            self.head.append(t)
+            return
+        self._add(t)
+
+    def _add(self, t):
+        self.stats.add(t)
+        for q in self.quantiles:
+            q.add(t)
+
+    def finish(self):
+        """Decide on warm-up steps and return the summary of the run as a dict, or None if it has no steps."""
+        if self.stats.n > 0:
+            median = self.quantiles[QUANTILES.index(0.5)].value()
+        else:
+            median = float(np.median(self.head)) if self.head else math.nan
+        warmup = 0
+        while warmup < len(self.head) - 1 and self.head[warmup] > (1 + self.warmup_tolerance) * median:
+            warmup += 1
+        for t in self.head[warmup:]:
+            self._add(t)
+        self.head = []
+        s = self.stats
+        if s.n == 0:
+            return None
+        summary = {"per_iteration": self.normalised,
+                   "steps": s.n + warmup,
+                   "warmup": warmup,
+                   "total": self.total,
+                   "mean": s.mean if s.n else math.nan,
+                   "stdev": s.stdev(),
+                   "cv": 100.0 * s.stdev() / s.mean if s.n > 1 and s.mean > 0 else math.nan,
+                   "min": s.min if s.n else math.nan,
+                   "max": s.max if s.n else math.nan}
+        for p, q in zip(QUANTILES, self.quantiles):
+            summary[f"p{int(round(100 * p)):02d}"] = q.value()
+        return summary
+
+
+_prefixes = ("Step ", "Timestep", "Wall", "Iteration count", "CG:")
+_step_re = re.compile(r"(?:Step|Timestep)\s+([0-9]+)(?:\s|$)")
+_wallclock_re = re.compile(r"Wall ?clock:?\s+([0-9.eE+-]+)")
+_iterations_re = re.compile(r"(?:Iteration count\s+([0-9]+)|CG:\s+([0-9]+) iterations)")
+
+
+def analyse(lines, per_iteration=True, **options):
+    """Read a CloverLeaf or TeaLeaf log one line at a time and return a summary (see StepTimes.finish) of every run in it.
+    Step times are the differences between successive cumulative wall clock readings of the steps.
+    With per_iteration, TeaLeaf step times are divided by the step's solver iteration count, which otherwise dominates their variation.
+    options are passed to StepTimes."""
+    runs = []
+    current = None
+    last_step = None
+    last_clock = 0.0
+    stepped = False
+    iterations = None
+    for line in lines:
+        # Cheap prefix tests first: most lines of a log match none of these
+        s = line.lstrip()
+        if not s.startswith(_prefixes):
+            continue
+        m = _step_re.match(s)
+        if m:
+            step = int(m.group(1))
+            if last_step is None or step <= last_step:
+                # First step of a new run
+                if current is not None:
+                    runs.append(current.finish())
+                    runs = [r for r in runs if r is not None]
+                current = StepTimes(**options)
+                last_clock = 0.0
+            last_step = step
+            stepped = True
+            continue
+        m = _iterations_re.match(s)
+        if m:
+            iterations = int(m.group(1) or m.group(2))
+            continue
+        m = _wallclock_re.match(s)
+        if m and current is not None:
+            clock = float(m.group(1))
+            # Only the first reading after a step marker; the rest are summaries
+            if stepped:
+                t = clock - last_clock
+                if per_iteration and iterations:
+                    current.normalised = True
+                    current.add(t / iterations, t)
+                else:
+                    current.add(t)
+                last_clock = clock
+            stepped = False
+            iterations = None
+    if current is not None:
+        runs.append(current.finish())
+    return [r for r in runs if r is not None]
+
+
+def analyse_log(filename, per_iteration=True, **options):
+    """Summaries of the runs in log filename, each with the device, compiler and model it was run with (see pp_ingest.describe)."""
+    app = pp_ingest.application_of(filename)
+    device, compiler, model, large = pp_ingest.describe(filename)
+    with open(filename, errors="replace") as f:
+        runs = analyse(f, per_iteration, **options)
+    return [dict(file=str(filename), application=app, year=pp_ingest.year_of(filename), device=device,
+                 compiler=compiler, model=model, large=large, run=i, **run)
+            for i, run in enumerate(runs)]
+
+
+def analyse_all(filenames, jobs=1, per_iteration=True, **options):
+    """analyse_log every file in filenames, in jobs worker processes. Returns a dataframe with one row per run."""
+    import functools
+    import pandas
+
+    work = functools.partial(analyse_log, per_iteration=per_iteration, **options)
+    if jobs > 1 and len(filenames) > 1:
+        import concurrent.futures
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(work, filenames, chunksize=max(1, len(filenames) // (4 * jobs))))
+    else:
+        results = [work(f) for f in filenames]
+    return pandas.DataFrame([run for runs in results for run in runs])
+
+
+def variability_table(runs):
+    """Device x model table of the best (shortest) run of every cell, with a "<model> CV%" column after each model giving the coefficient of variation of its step times.
+    Rows and columns are ordered as in the tables of pp_ingest."""
+    import pandas
+    best = runs.loc[runs.groupby(["device", "model"])["total"].idxmin()]
+    values = pp_ingest.results_table(best.rename(columns={"total": "value"}).to_dict("records"), False)
+    cvs = best.pivot(index="device", columns="model", values="cv").reindex(index=values.index, columns=values.columns)
+    table = pandas.DataFrame(index=values.index)
+    for model in values.columns:
+        table[model] = values[model]
+        table[f"{model} CV%"] = cvs[model]
+    return table
+
+
+def noisy(runs, threshold):
+    """The runs whose step times vary by more than threshold percent (coefficient of variation)."""
+    return runs[runs["cv"] > threshold]
+
+
+if __name__ == '__main__':
+    import os
+    import sys
+    import argparse
+
+    desc = "Step time variability of CloverLeaf and TeaLeaf runs"
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument("-o",
+                        "--output-prefix",
+                        dest='oprefix',
+                        action='store',
+                        default="./",
+                        help='Write output files with a specific prefix')
+    parser.add_argument("--runs",
+                        dest='runs',
+                        action='store',
+                        default=None,
+                        help='Also write the summary of every run (steps, warm-up, mean, stdev, quantiles) here.')
+    parser.add_argument("--warmup-window",
+                        dest='warmup_window',
+                        action='store',
+                        type=int,
+                        default=10,
+                        help='Number of leading steps of each run that may be warm-up.')
+    parser.add_argument("--warmup-tolerance",
+                        dest='warmup_tolerance',
+                        action='store',
+                        type=float,
+                        default=0.2,
+                        help='Leading steps slower than the median by more than this fraction are warm-up.')
+    parser.add_argument("--per-step",
+                        dest='per_iteration',
+                        action='store_false',
+                        default=True,
+                        help='Do not divide TeaLeaf step times by their solver iteration counts.')
+    parser.add_argument("--flag",
+                        dest='flag',
+                        action='store',
+                        type=float,
+                        default=5.0,
+                        help='Report runs whose coefficient of variation exceeds this percentage.')
+    parser.add_argument("-j",
+                        "--jobs",
+                        dest='jobs',
+                        action='store',
+                        type=int,
+                        default=os.cpu_count() or 1,
+                        help='Analyse logs in this many worker processes.')
+    parser.add_argument('paths',
+                        metavar='<LOG-FILE-OR-DIR>+',
+                        nargs=argparse.REMAINDER)
+
+    args = parser.parse_args()
+
+    if len(args.paths) == 0:
+        print("No input files specified.")
+        sys.exit(1)
+
+    logs = [f for f in pp_ingest.find_logs(args.paths) if pp_ingest.application_of(f) in ("cloverleaf", "tealeaf")]
+    runs = analyse_all(logs, args.jobs, args.per_iteration,
+                       warmup_window=args.warmup_window,
+                       warmup_tolerance=args.warmup_tolerance)
+    if len(runs) == 0:
+        print("No CloverLeaf or TeaLeaf runs found.")
+        sys.exit(1)
+
+    if args.runs:
+        runs.to_csv(args.runs, index=False)
+        print(f"Wrote {args.runs}.")
+
+    for _, r in noisy(runs, args.flag).iterrows():
+        print(f"Noisy: {r['file']} run {r['run']} ({r['device']}, {r['model']}): CV {r['cv']:.1f}%")
+
+    for (app, year, large), group in runs.groupby(["application", "year", "large"]):
+        of = f"{args.oprefix}{pp_ingest.table_name(app, year, large)[:-len('.csv')]}_variability.csv"
+        variability_table(group).to_csv(of, na_rep="X", float_format="%.2f")
+        print(f"Wrote {of}.")
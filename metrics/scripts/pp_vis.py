@@ -2,15 +2,18 @@
 # Copyright (c) 2020 Performance Portability authors
 # SPDX-License-Identifier: MIT
 
-from matplotlib import pylab as plt
-from scipy.special import erf
-import matplotlib.patches as mpatches
-import matplotlib.gridspec as gridspec
-from scipy.integrate import simps
 import numpy as np
 from pathlib import Path
+import functools
 
-import pandas
+import pp_cache
+import pp_data
+import pp_metrics
+import pp_profile
+
+# pandas, matplotlib and scipy are imported by the functions that use them,
+# so that -h does not pay for importing them, and loading efficiencies only
+# for pandas.
 
 
 def count_zeros(col):
@@ -21,30 +24,30 @@ def count_zeros(col):
         return 0
 
 
+@pp_profile.timed("load")
 def app_effs(filename,
              raw_effs=False,
              raw_effs_scaling=1 / 100.0,
-             throughput=False):
+             throughput=False,
+             arch=None,
+             spec=None,
+             arch_scale=1.0,
+             intensity=None):
     """Load a csv file. Assumes comma separation, and that first column is list of platforms.
     Can interpret values as raw efficiencies, which are scaled from percentages by default.
+    With arch (one of pp_data.ARCH_PEAKS), computes architectural efficiencies against the peaks of hardware spec (see pp_data.arch_efficiencies).
     Otherwise, computes application efficiencies, possibly intepreting as throughtput.
     Sorts dataframe columns by harmonic mean of efficiencies (major) and by # of unsupported platforms (minor)."""
-
-    df = pandas.read_csv(filename,
-                         sep=r"\s*[,]\s*",
-                         na_values=[r'x', r'X'],
-                         skipinitialspace=True,
-                         engine='python')
-    if not raw_effs:
-        if throughput:
-            df[df.columns[1:]] = df[df.columns[1:]].apply(
-                lambda r: r / r.max(), axis=1)
-        else:
-            df[df.columns[1:]] = df[df.columns[1:]].apply(
-                lambda r: r.min() / r, axis=1)
+    import pandas
+
+    with pp_profile.stage("read"):
+        df = pp_data.read_results(filename)
+    if arch is not None:
+        df = pp_data.arch_efficiencies(df, pp_data.read_spec() if spec is None else spec, arch, arch_scale, intensity)
+    elif not raw_effs:
+        df = pp_data.app_efficiencies(df, throughput=throughput)
     else:
-        df[df.columns[1:]] = df[df.columns[1:]].applymap(
-            lambda x: x * raw_effs_scaling)
+        df[df.columns[1:]] = df[df.columns[1:]] * raw_effs_scaling
     df = df.fillna(0)
     harmean_vals = df[df.columns[1:]].apply(harmean, axis=0)
     zeros = df[df.columns[1:]].apply(count_zeros, axis=0)
@@ -56,11 +59,7 @@ def app_effs(filename,
 
 def harmean(vals):
     """Compute the harmonic mean of list-like vals. Special case for presence of 0: return 0."""
-    try:
-        s = sum((1.0 / x for x in vals))
-    except ZeroDivisionError:
-        return 0.0
-    return len(vals) / s
+    return pp_metrics.pp(np.asarray(vals, dtype=float))
 
 
 def gaussian(x):
@@ -70,11 +69,13 @@ def gaussian(x):
 
 def gaussian_cdf(x):
     """Cumulative distribution function of Gaussian."""
+    from scipy.special import erf
     return 0.5 * (1.0 + erf(x * 2**-0.5))
 
 
 def gaussian_scaling(a, b):
     """Factor needed to scale a unit Gaussian centered at 0 that is truncated into [a,b] back to unity."""
+    from scipy.special import erf
     return -2.0 / (erf(a * 2**-0.5) + erf(-b * 2**-0.5))
 
 
@@ -88,6 +89,16 @@ class gaussian_family:
         self.cdf_func = gaussian_cdf
 
 
+def simpson(y, x):
+    """Integrate y (along its last axis) over grid x with Simpson's rule."""
+    try:
+        from scipy.integrate import simpson as rule
+    except ImportError:
+        # SciPy before 1.6 only has simps, which SciPy 1.14 removed
+        from scipy.integrate import simps as rule
+    return rule(y, x=x)
+
+
 def bw_estimate(samples):
     """Computes Abraham's bandwidth heuristic."""
     sigma = np.std(samples)
@@ -142,7 +153,7 @@ class akde:
             pdf += 1.0 / loc_h * scaling * kernel_func((self.x - s) / loc_h)
         pdf = pdf / len(self.samples)
         self.last_pdf = pdf
-        area = simps(pdf, self.x)
+        area = simpson(pdf, self.x)
         if self.clip and np.fabs(area - 1.0) > 1e-3:
             print(f"Warning: area under PDF is {area}; it should be very close to 1.0. This is likely sampling error.")
         return pdf, area
@@ -159,38 +170,315 @@ class akde:
     def pdf_refine(self, num):
         """Compute num iterations of the kernel density estimation process, storing only the final one."""
         self.last_pdf = None
+        for i in range(num):
+            with pp_profile.stage("akde iteration"):
+                pdf, area = self.pdf()
+        return pdf
+
+
+# Samples per set that akde_batch evaluates against the grid at once by default
+AKDE_CHUNK = 256
+
+
+class akde_batch:
+    """Implements iterative 1D Adaptive Kernel Density Estimation for several sample sets at once.
+    Each iteration evaluates every sample of every set against the grid with array operations, rather than one sample at a time as akde does."""
+
+    def __init__(self, x, sample_sets, bw_fac, chunk_size=AKDE_CHUNK):
+        """reconstruct on grid x, sample_sets is a list-like of list-like sample sets (which may differ in length), bw_fac is scaling factor for reconstruction bandwidth.
+        chunk_size bounds the number of samples per set that are evaluated against the grid at once, so memory use is O(sets * chunk_size * len(x)); None (or 0) evaluates all samples at once."""
+        self.clip = True
+        self.kernel_family = gaussian_family()
+        self.bw_fac = bw_fac
+        self.x = np.asarray(x, dtype=float)
+        self.chunk_size = chunk_size
+        sample_sets = [np.asarray(s, dtype=float) for s in sample_sets]
+        self.sample_sets = sample_sets
+        width = max([len(s) for s in sample_sets], default=0)
+        # Pad ragged sets with the left grid point; padding carries zero weight.
+        self.samples = np.full((len(sample_sets), width), self.x[0])
+        self.weights = np.zeros((len(sample_sets), width))
+        for i, s in enumerate(sample_sets):
+            self.samples[i, :len(s)] = s
+            if len(s) > 0:
+                self.weights[i, :len(s)] = 1.0 / len(s)
+        self.last_pdf = None
+        self.bw0 = np.array([bw_estimate(s) if len(s) > 0 else 1.0 for s in sample_sets])
+
+    def bw_estimate(self):
+        """Choose reconstruction bandwidth for every sample. Use constant, initial input per set if no steps have been taken; otherwise use density estimation from last iterate."""
+        if self.last_pdf is None:
+            return np.broadcast_to(self.bw0[:, np.newaxis], self.samples.shape)
+
+        # Padding gets a finite bandwidth however low the density at its grid point, so that its zero weight keeps it out of the PDF.
+        density = np.where(self.weights > 0, self.density_estimate(self.samples), 1.0)
+        return self.bw_fac * (density**-0.5)
+
+    def density_estimate(self, lx):
+        """Estimate density at points lx (one row per set) based on last iterate."""
+        assert self.last_pdf is not None
+
+        loc = np.minimum(np.searchsorted(self.x, lx), len(self.x) - 1)
+        return np.take_along_axis(self.last_pdf, loc, axis=1)
+
+    def evaluate(self):
+        """Sum the kernels of all samples on the grid, using bandwidths from the last iterate. Return PDFs (one row per set)."""
+        scaling_func = self.kernel_family.scaling_func
+        kernel_func = self.kernel_family.kernel_func
+        loc_h = self.bw_estimate()
+        if self.clip:
+            assert np.all((self.samples >= self.x[0]) & (self.samples <= self.x[-1]))
+            scaling = scaling_func((self.x[0] - self.samples) / loc_h, (self.x[-1] - self.samples) / loc_h)
+        else:
+            scaling = 1.0
+        coeffs = self.weights * scaling / loc_h
+        pdf = np.zeros((self.samples.shape[0], len(self.x)))
+        step = self.chunk_size or max(self.samples.shape[1], 1)
+        for lo in range(0, self.samples.shape[1], step):
+            chunk = slice(lo, lo + step)
+            u = (self.x - self.samples[:, chunk, np.newaxis]) / loc_h[:, chunk, np.newaxis]
+            pdf += np.einsum('ij,ijk->ik', coeffs[:, chunk], kernel_func(u))
+        return pdf
+
+    def pdf(self):
+        """Compute a single step of adaptive density estimation for all sets. Return PDFs (one row per set) and area estimates."""
+        pdf = self.evaluate()
+        self.last_pdf = pdf
+        area = simpson(pdf, self.x)
+        if self.clip:
+            for a in area[np.fabs(area - 1.0) > 1e-3]:
+                print(f"Warning: area under PDF is {a}; it should be very close to 1.0. This is likely sampling error.")
+        return pdf, area
+
+    def pdf_series(self, num):
+        """Compute num iterations of the kernel density estimation process, storing each intermediate."""
+        self.last_pdf = None
+        res = []
         for i in range(num):
             pdf, area = self.pdf()
+            res.append(pdf)
+        return res
+
+    def pdf_refine(self, num):
+        """Compute num iterations of the kernel density estimation process, storing only the final one."""
+        self.last_pdf = None
+        for i in range(num):
+            with pp_profile.stage("akde iteration"):
+                pdf, area = self.pdf()
         return pdf
 
 
+class akde_binned(akde_batch):
+    """Approximate variant of akde_batch for large sample sets.
+    Samples are linearly binned onto the (uniform) grid and kernels are applied by FFT convolution, so each iteration costs O(sets * levels * len(x) log len(x)) regardless of the number of samples.
+    Per-bin bandwidths are interpolated between a geometric ladder of levels bandwidths, one convolution per level."""
+
+    def __init__(self, x, sample_sets, bw_fac, levels=32):
+        """Arguments as for akde_batch; x must be uniformly spaced. levels is the number of bandwidths that per-bin bandwidths are interpolated between."""
+        super().__init__(x, sample_sets, bw_fac)
+        dx = np.diff(self.x)
+        assert len(self.x) > 1 and np.allclose(dx, dx[0]), "akde_binned requires a uniform grid"
+        self.levels = levels
+        self.counts = self.bin_samples()
+
+    def bin_samples(self):
+        """Linearly distribute the weight of each sample onto its two neighbouring grid points. Return weights per set and grid point."""
+        n = len(self.x)
+        pos = (self.samples - self.x[0]) / (self.x[1] - self.x[0])
+        left = np.clip(np.floor(pos), 0, n - 2).astype(int)
+        frac = pos - left
+        offsets = np.arange(self.samples.shape[0])[:, np.newaxis] * n
+        counts = np.bincount((offsets + left).ravel(),
+                             weights=(self.weights * (1.0 - frac)).ravel(),
+                             minlength=self.samples.shape[0] * n)
+        counts += np.bincount((offsets + left + 1).ravel(),
+                              weights=(self.weights * frac).ravel(),
+                              minlength=self.samples.shape[0] * n)
+        return counts.reshape(self.samples.shape[0], n)
+
+    def evaluate(self):
+        """Convolve the binned weights with kernels of per-bin bandwidth, using bandwidths from the last iterate. Return PDFs (one row per set)."""
+        scaling_func = self.kernel_family.scaling_func
+        kernel_func = self.kernel_family.kernel_func
+        n = len(self.x)
+        nsets = self.counts.shape[0]
+        occupied = self.counts > 0
+        if self.last_pdf is None:
+            loc_h = np.broadcast_to(self.bw0[:, np.newaxis], self.counts.shape)
+        else:
+            # Empty bins contribute nothing; give them a harmless bandwidth.
+            loc_h = self.bw_fac * (np.where(occupied, self.last_pdf, 1.0)**-0.5)
+        if self.clip:
+            scaling = scaling_func((self.x[0] - self.x) / loc_h, (self.x[-1] - self.x) / loc_h)
+        else:
+            scaling = 1.0
+        coeffs = np.where(occupied, self.counts * scaling / loc_h, 0.0)
+
+        # Geometric ladder of bandwidths spanning those of the occupied bins of each set.
+        h_lo = np.where(occupied, loc_h, np.inf).min(axis=1, initial=np.inf)
+        h_hi = np.where(occupied, loc_h, 0.0).max(axis=1, initial=0.0)
+        h_lo = np.where(np.isfinite(h_lo), h_lo, 1.0)
+        h_hi = np.maximum(h_hi, h_lo)
+        ratio = np.log(h_hi / h_lo)
+        t = np.zeros(self.counts.shape)
+        spread = ratio > 0
+        t[spread] = (np.log(loc_h[spread] / h_lo[spread, np.newaxis]) / ratio[spread, np.newaxis]) * (self.levels - 1)
+        t = np.clip(np.where(occupied, t, 0.0), 0, self.levels - 1)
+        lower = np.minimum(np.floor(t).astype(int), self.levels - 2) if self.levels > 1 else np.zeros(t.shape, dtype=int)
+        frac = t - lower
+        ladder = h_lo[:, np.newaxis] * np.exp(np.outer(ratio, np.arange(self.levels)) / max(self.levels - 1, 1))
+
+        # Split each bin's coefficient between its two neighbouring levels.
+        level_coeffs = np.zeros((nsets, self.levels, n))
+        sets = np.arange(nsets)[:, np.newaxis]
+        cols = np.arange(n)[np.newaxis, :]
+        np.add.at(level_coeffs, (sets, lower, cols), coeffs * (1.0 - frac))
+        if self.levels > 1:
+            np.add.at(level_coeffs, (sets, lower + 1, cols), coeffs * frac)
+
+        offsets = (np.arange(2 * n - 1) - (n - 1)) * (self.x[1] - self.x[0])
+        kernels = kernel_func(offsets / ladder[:, :, np.newaxis])
+        size = 1 << int(np.ceil(np.log2(3 * n - 2)))
+        full = np.fft.irfft(np.fft.rfft(level_coeffs, size) * np.fft.rfft(kernels, size), size)
+        return full[:, :, n - 1:2 * n - 1].sum(axis=1)
+
+    def deviation(self, num):
+        """Return the maximum absolute difference, per set, between num binned iterations and num exact iterations of akde_batch."""
+        exact = akde_batch(self.x, self.sample_sets, self.bw_fac)
+        exact.clip = self.clip
+        exact.kernel_family = self.kernel_family
+        return np.max(np.fabs(self.pdf_refine(num) - exact.pdf_refine(num)), axis=1)
+
+
 def pp_cdf_raw_effs(theapp):
     """Returns sorted subsequences and harmonic means of same."""
     valid_effs = [x for x in theapp if x[1] > 0 and x[1] != float("inf")]
     sorted_effs = sorted(valid_effs, key=lambda x: x[1], reverse=True)
     res = []
+    recip_sum = 0.0
     for i in range(len(sorted_effs)):
-        res.append((sorted_effs[i][1], harmean([x[1] for x in sorted_effs[:i+1]]), sorted_effs[i][0]))
+        recip_sum += 1.0 / sorted_effs[i][1]
+        res.append((sorted_effs[i][1], (i + 1) / recip_sum, sorted_effs[i][0]))
+    return res
+
+
+@pp_profile.timed("cascades")
+def pp_cascades(app_eff_df):
+    """Compute the efficiency cascades of every column of dataframe app_eff_df (first column is platform names) at once.
+    Returns a dict of column name to (effs, pps, plats) arrays, with the same contents as the tuples returned by pp_cdf_raw_effs.
+    Runs in O(n log n) per column by sorting once and taking running sums of reciprocal efficiencies."""
+    plats = app_eff_df[app_eff_df.columns[0]].to_numpy()
+    effs = app_eff_df[app_eff_df.columns[1:]].to_numpy(dtype=float)
+    valid = (effs > 0) & (effs != np.inf)
+    # Stable sort on descending efficiency, with invalid entries last; this matches sorted(..., reverse=True).
+    order = np.argsort(np.where(valid, -effs, np.inf), axis=0, kind='stable')
+    sorted_effs = np.take_along_axis(effs, order, axis=0)
+    sorted_valid = np.take_along_axis(valid, order, axis=0)
+    recip_sums = np.cumsum(np.where(sorted_valid, 1.0 / np.where(sorted_valid, sorted_effs, 1.0), 0.0), axis=0)
+    # Columns without a valid entry divide by a zero sum; none of their rows are kept below.
+    with np.errstate(divide='ignore'):
+        pps = np.arange(1, effs.shape[0] + 1)[:, np.newaxis] / recip_sums
+    counts = valid.sum(axis=0)
+    res = {}
+    for i, name in enumerate(app_eff_df.columns[1:]):
+        n = counts[i]
+        res[name] = (sorted_effs[:n, i], pps[:n, i], plats[order[:n, i]])
+    return res
+
+
+# Bootstrap PP values of a cascade are evaluated for this many (k, resample,
+# platform) elements at a time, so memory stays O(n * resamples) for n platforms.
+BAND_BLOCK = 1 << 21
+
+
+def _band_block(recips, draws, ks):
+    # PP of the resamples of the first k platforms for every k in ks, as a (len(ks), resamples) array.
+    # recips are the reciprocal efficiencies of the cascade; resample i of the first k platforms
+    # is recips[(draws[i, :k] * k).astype(int)]
+    width = ks[-1]
+    idx = (draws[np.newaxis, :, :width] * ks[:, np.newaxis, np.newaxis]).astype(int)
+    sampled = np.where(np.arange(width) < ks[:, np.newaxis, np.newaxis], recips[idx], 0.0)
+    return ks[:, np.newaxis] / sampled.sum(axis=2)
+
+
+@pp_profile.timed("bootstrap")
+def cascade_bands(cascades, resamples=1000, confidence=0.95, seed=None, jobs=1):
+    """Bootstrap confidence bands of the PP line of every cascade in cascades (as returned by pp_cascades).
+    The PP over the k most efficient platforms is resampled from those k platforms; blocks of k (of at most BAND_BLOCK
+    elements) are evaluated in one array operation each, in jobs worker processes if jobs > 1.
+    Returns a dict of column name to (low, high) arrays, aligned with the pps of the cascade."""
+    rng = np.random.default_rng(seed)
+    alpha = (1.0 - confidence) / 2.0
+    tasks = []
+    for name, (effs, pps, plats) in cascades.items():
+        n = len(effs)
+        if n == 0:
+            continue
+        recips = 1.0 / np.asarray(effs, dtype=float)
+        draws = rng.random((resamples, n))
+        step = max(1, BAND_BLOCK // (resamples * n))
+        for start in range(0, n, step):
+            ks = np.arange(start + 1, min(start + step, n) + 1)
+            tasks.append((name, recips, draws[:, :ks[-1]], ks))
+    if jobs > 1 and len(tasks) > 1:
+        import concurrent.futures
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            blocks = list(pool.map(_band_block, *zip(*[t[1:] for t in tasks])))
+    else:
+        blocks = [_band_block(*t[1:]) for t in tasks]
+    pp_samples = {}
+    for (name, *_), block in zip(tasks, blocks):
+        pp_samples.setdefault(name, []).append(block)
+    res = {}
+    for name in cascades:
+        if name not in pp_samples:
+            res[name] = (np.empty(0), np.empty(0))
+            continue
+        low, high = np.quantile(np.concatenate(pp_samples[name]), [alpha, 1.0 - alpha], axis=1)
+        res[name] = (low, high)
     return res
 
 
-def plot_pdf(ax, app_eff_df, handles, plat_colors=None, symlog=True):
+@pp_profile.timed("densities")
+def estimate_densities(app_eff_df, names, method="exact", chunk_size=AKDE_CHUNK, report_deviation=False):
+    """Estimate the probability densities of columns names of dataframe app_eff_df as one batch. Return the grid and one density per name.
+    method selects exact (akde_batch) or approximate binned (akde_binned) estimation; chunk_size is passed on to akde_batch to bound memory use.
+    If report_deviation is true, print the maximum deviation of the binned estimate from the exact one."""
+    sample_sets = [sorted(app_eff_df[name][1:]) for name in names]
+    if method == "binned":
+        l_akde = akde_binned(np.linspace(0, 1, 1000), sample_sets, 0.05)
+        if report_deviation:
+            for name, dev in zip(names, l_akde.deviation(10)):
+                print(f"Binned AKDE of {name}: max deviation from exact is {dev}.")
+    elif method == "exact":
+        l_akde = akde_batch(np.linspace(0, 1, 1000), sample_sets, 0.05, chunk_size=chunk_size)
+    else:
+        raise ValueError(f"Unknown AKDE method {method}")
+    return l_akde.x, l_akde.pdf_refine(10)
+
+
+def plot_pdf(ax, app_eff_df, handles, plat_colors=None, symlog=True, chunk_size=AKDE_CHUNK, method="exact", report_deviation=False, densities=None):
     """Plot probability density estimation based on app_eff_df dataframe onto axis ax.
     Add plot handles (for legend purposes) to handles if they are not already present.
     Use order & colors found in list of (color, name) tuples if present, otherwise throw something together.
-    Use symlog y axis in if symlog is true; otherwise use linear."""
+    Use symlog y axis in if symlog is true; otherwise use linear.
+    Densities are computed by estimate_densities with chunk_size, method and report_deviation, unless densities (as returned by it, in plat_colors order) are passed in."""
+    import matplotlib.pyplot as plt
     ax.set_aspect(0.15)
     if plat_colors is None:
         plat_colors = []
         qual_colormap = plt.get_cmap("tab10")
         for i, name in enumerate(app_eff_df.columns[1:]):
             plat_colors.append((qual_colormap(i), name))
-    for color, name in plat_colors:
-        data = app_eff_df[name][1:]
-        d = sorted(data)
-        l_akde = akde(np.linspace(0, 1, 1000), d, 0.05)
-        fs = l_akde.pdf_refine(10)
-        extended_x = [-0.035] + list(l_akde.x) + [1.035]
+    if densities is None:
+        densities = estimate_densities(app_eff_df, [name for color, name in plat_colors],
+                                       method=method,
+                                       chunk_size=chunk_size,
+                                       report_deviation=report_deviation)
+    grid, all_fs = densities
+    for (color, name), fs in zip(plat_colors, all_fs):
+        extended_x = [-0.035] + list(grid) + [1.035]
         extended_y = [fs[0]] + list(fs) + [fs[-1]]
         h = ax.plot(extended_x,
                     extended_y,
@@ -200,45 +488,68 @@ def plot_pdf(ax, app_eff_df, handles, plat_colors=None, symlog=True):
         if name not in handles:
             handles[name] = h
     if symlog:
-        plt.yscale('symlog', subs=range(10))
+        ax.set_yscale('symlog', subs=range(10))
     else:
         ax.set_aspect(0.01)
-    plt.grid(True)
-    plt.xlim([0, 1])
+    ax.grid(True)
+    ax.set_xlim([0, 1])
     ax.yaxis.grid(True, which='minor')
     if symlog:
-        plt.ylabel("Density (symlog)")
+        ax.set_ylabel("Density (symlog)")
     else:
-        plt.ylabel("Density")
-    plt.xlabel("Efficiency")
+        ax.set_ylabel("Density")
+    ax.set_xlabel("Efficiency")
     return handles
 
 
 def histogram(bins, data):
     """Compute and return 1D histogram of samples in data into bins, where bins is a list of n boundaries for n+1 bins.
     Drop samples that fall outside bins. Each bin counts the values at its right endpoint inclusively, except bin 0 which has both."""
-    z = np.zeros(len(bins) - 1)
-    for d in data:
-        if d < bins[0]:
-            continue
-        for i, b in enumerate(bins[1:]):
-            if d <= b:
-                z[i] += 1.0
-                found = True
-                break
-    return z
+    return histogram_columns(bins, np.asarray(data, dtype=float)[:, np.newaxis])[:, 0]
+
+
+def histogram_columns(bins, data):
+    """Compute 1D histograms of every column of 2D array data at once, with the same bin semantics as histogram.
+    Returns an array with one row per bin and one column per column of data."""
+    bins = np.asarray(bins, dtype=float)
+    data = np.asarray(data, dtype=float)
+    nbins = len(bins) - 1
+    inside = (data >= bins[0]) & (data <= bins[-1])
+    # Right-inclusive bins; values equal to bins[0] land in bin 0.
+    which = np.maximum(np.searchsorted(bins, data, side='left') - 1, 0)
+    which = which + nbins * np.arange(data.shape[1])[np.newaxis, :]
+    counts = np.bincount(which[inside], minlength=nbins * data.shape[1])
+    return counts.reshape(data.shape[1], nbins).T.astype(float)
+
+
+def efficiency_bins():
+    """Bin boundaries used by binplot: a special "did not run" bin [0, eps], then (eps, 0.1], (0.1, 0.2], ..., (0.9, 1.0]."""
+    bins = np.arange(0, 1.1, 0.1, dtype=float)
+    bins[0] = np.finfo(float).eps
+    return np.append(np.zeros(1), bins)
+
+
+def bin_counts(app_effs, bins=None):
+    """Bin every column of dataframe app_effs (first column is platform names) in one call, using efficiency_bins by default.
+    Returns a dataframe of counts with one row per bin and one column per implementation.
+    Counts from parts of a dataset can be summed before being passed to binplot."""
+    import pandas
+    if bins is None:
+        bins = efficiency_bins()
+    return pandas.DataFrame(histogram_columns(bins, app_effs[app_effs.columns[1:]].to_numpy(dtype=float)),
+                            columns=app_effs.columns[1:])
 
 
-def binplot(ax, app_effs, colordict=None):
+def binplot(ax, app_effs, colordict=None, counts=None):
     """Compute and plot histogram of dataframe app_effs onto axis ax. Use colors for each column as specified in colordict or compute manually.
-    Bin 0 is handled specially and kept separate from others."""
-    bins = np.arange(0, 1.1, 0.1, dtype=np.float)
-    bins[0] = np.finfo(float).eps
-    bins = np.append(np.zeros(1), bins)
+    Bin 0 is handled specially and kept separate from others.
+    Pre-binned counts (as from bin_counts) may be passed in instead, in which case app_effs is not used."""
+    bins = efficiency_bins()
+    if counts is None:
+        counts = bin_counts(app_effs, bins)
     bar_data = {}
-    for name in app_effs.columns[1:]:
-        data = app_effs[name]
-        bar_data[name] = histogram(bins, data)
+    for name in counts.columns:
+        bar_data[name] = counts[name].to_numpy(dtype=float)
         bar_data[name] = bar_data[name] / bar_data[name].sum() * 100.0
 
     bin_offsets = 2 * np.array(range(len(bins) - 1))
@@ -256,23 +567,17 @@ def binplot(ax, app_effs, colordict=None):
             res = ax.bar(pbins, height=data, width=width)
         handles.append(res.patches[0])
         handles[-1].set_label(name)
-    plt.ylabel('Frequency in %')
-    plt.xlabel('Efficiency')
-    plt.grid(axis='y')
+    ax.set_ylabel('Frequency in %')
+    ax.set_xlabel('Efficiency')
+    ax.grid(axis='y')
 
     ax.set_ylim([0, 100.0])
 
     ax.set_xticks(bin_offsets + 0.5)
     # Rename the first bin
-    locs, labels = plt.xticks()
-    labels[0] = "Did not run"
-    for i, _ in enumerate(labels):
-        if i == 0:
-            continue
-        labels[i] = f"({round(bins[i],3)}, {round(bins[i+1],3)}]"
-    plt.xticks(locs, labels)
-
-    labels = ax.get_xticklabels()
+    labels = ["Did not run"]
+    for i in range(1, len(bin_offsets)):
+        labels.append(f"({round(bins[i],3)}, {round(bins[i+1],3)}]")
     ax.set_xticklabels(labels, rotation=45, ha="right", rotation_mode="anchor")
     return handles
 
@@ -283,11 +588,17 @@ def plot_cascade(fig,
                  app_eff_df,
                  handles,
                  app_colors=None,
-                 plat_colors=None):
+                 plat_colors=None,
+                 cascades=None,
+                 bands=None):
     """Plot efficiency cascade & platform chart on figure/gridspec fig/gs with gridspec index index.
     app_eff_df is input dataframe. Handles is a dict of column names to handles for legends, which is updated.
     app_colors is a dictionary of column names to colors; if not present, a heuristic is used.
-    plat_colors is a list of (color, platform_name) pairs to use in the platform chart. One is created if it is not passed in."""
+    plat_colors is a list of (color, platform_name) pairs to use in the platform chart. One is created if it is not passed in.
+    cascades are the pp_cascades of app_eff_df; they are computed if not passed in.
+    bands is an optional dict of column names to (low, high) confidence bands of the PP line (see cascade_bands), drawn as shaded regions."""
+    import matplotlib.pyplot as plt
+    import matplotlib.gridspec as gridspec
     subgrid = gridspec.GridSpecFromSubplotSpec(
         2, 1, subplot_spec=gs[index[0], index[1]], hspace=0, height_ratios=[5, 1])
     qual_colormap = plt.get_cmap("tab10")
@@ -303,18 +614,15 @@ def plot_cascade(fig,
     min_plat = None
     max_plat = None
     appinfo = {}
+    if cascades is None:
+        cascades = pp_cascades(app_eff_df)
     for i, name in enumerate(app_eff_df.columns[1:]):
-        in_effs = list(zip(app_eff_df[app_eff_df.columns[0]], app_eff_df[name]))
-        cascade = pp_cdf_raw_effs(in_effs)
-
-        effs, pps, plats = zip(*cascade)
+        effs, pps, plats = cascades[name]
 
-        ppl = list(enumerate(pps, 1))
-        ppl = ppl + [(ppl[-1][0], 0.0)]
-        data_pp = np.asarray(ppl)
-        effl = list(enumerate(effs, 1))
-        effl = effl + [(effl[-1][0], 0.0)]
-        data_eff = np.asarray(effl)
+        ranks = np.arange(1, len(effs) + 2, dtype=float)
+        ranks[-1] = len(effs)
+        data_pp = np.column_stack((ranks, np.append(pps, 0.0)))
+        data_eff = np.column_stack((ranks, np.append(effs, 0.0)))
 
         center = data_pp[:, 0]
 
@@ -330,8 +638,8 @@ def plot_cascade(fig,
         else:
             color = app_colors[name]
         appinfo[name] = (data_pp, data_eff, plats, center, i, color)
-    for name, (data_pp, data_eff, plats, center, i, color) in appinfo.items():
-        name = name.replace(r"\%", "%")
+    for col, (data_pp, data_eff, plats, center, i, color) in appinfo.items():
+        name = col.replace(r"\%", "%")
         eff_name = f"{name} eff."
         pp_name = f"{name} PP"
 
@@ -343,6 +651,9 @@ def plot_cascade(fig,
                        lw=3,
                        marker="s",
                        ls='dashed')[0]
+        if bands is not None and col in bands:
+            low, high = bands[col]
+            ax.fill_between(center[:-1], low, high, color=color, alpha=0.25, lw=0)
         eff_h = ax.plot(center,
                         data_eff[:,
                                  1],
@@ -387,6 +698,7 @@ def plot_cascade(fig,
 
 def boxplot(ax, effs_pd):
     """Plot a a box-and-whisker plot of the dataframe effs_pd onto ax."""
+    import matplotlib
     ax.boxplot(effs_pd[effs_pd.columns[1:]].to_numpy(),
                notch=False,
                whiskerprops=dict(color="#5799c6"),
@@ -399,24 +711,317 @@ def boxplot(ax, effs_pd):
     ax.set_xticklabels(labels, rotation=45, ha="right", rotation_mode="anchor")
     labels = ax.get_xticklabels()
     for i in range(len(labels)):
-        if not plt.rcParams['text.usetex']:
+        if not matplotlib.rcParams['text.usetex']:
             labels[i].set_text(labels[i].get_text().replace(r"\%", "%"))
 
 
 def save_and_report(filename, exts):
     """Save current figure to filename.exts for each extension in sequence exts. Also print progress."""
+    import matplotlib.pyplot as plt
     for x in exts:
         of = f"{filename}.{x}"
         plt.savefig(of, bbox_inches="tight")
         print(f"Wrote {of}.")
 
 
+def save_figure(fig, filename, exts):
+    """Save Figure fig to filename.exts for each extension in sequence exts. Also print progress.
+    PDF creation dates are omitted so that unchanged inputs produce identical files."""
+    for x in exts:
+        of = f"{filename}.{x}"
+        metadata = {'CreationDate': None} if x == 'pdf' else None
+        with pp_profile.stage(f"savefig {x}"):
+            fig.savefig(of, bbox_inches="tight", metadata=metadata)
+        print(f"Wrote {of}.")
+
+
+# Suffixes of the output files of each visualization type, in the order they are produced.
+output_suffixes = {'casc': "_eff_cascade",
+                   'epdf': "_estimated_density_chart",
+                   'box': "_box_chart",
+                   'bins': "_binned_chart"}
+
+
+def render_cascade(effs_df, output_base, exts, cascades=None, bands=None):
+    """Draw the efficiency cascade chart of effs_df on a new Figure and save it as output_base_eff_cascade.exts.
+    cascades and bands are passed on to plot_cascade."""
+    import matplotlib.pyplot as plt
+    import matplotlib.patches as mpatches
+    from matplotlib.figure import Figure
+    plats = effs_df[effs_df.columns[0]]
+    plat_colors = {}
+    plat_handles = []
+    plat_cmap = plt.get_cmap("summer")
+    for i, p in enumerate(plats):
+        plat_colors[p] = plat_cmap(float(i) / (len(plats) - 1))
+        plat_handles.append(mpatches.Patch(color=plat_colors[p],
+                                           label=p))
+
+    fig = Figure(figsize=(4, 4))
+    handles = {}
+    gs = fig.add_gridspec(1, 1)
+    plot_cascade(fig, gs, [0, 0], effs_df, handles,
+                 app_colors=None, plat_colors=plat_colors,
+                 cascades=cascades, bands=bands)
+
+    handle_names, handle_lists = zip(*handles.items())
+    fig.legend(handle_lists,
+               handle_names,
+               loc='upper left',
+               bbox_to_anchor=(1.0, 1.0),
+               ncol=1,
+               handlelength=2.0)
+    fig.legend(handles=plat_handles,
+               loc='lower left',
+               bbox_to_anchor=(1.0, 0.1),
+               ncol=3,
+               handlelength=1.0)
+    with pp_profile.stage("layout"):
+        fig.tight_layout(pad=0.4, w_pad=0.5, h_pad=1.0)
+    save_figure(fig, output_base + output_suffixes['casc'], exts)
+
+
+def render_epdf(effs_df, output_base, exts, method="exact", report_deviation=False, densities=None, chunk_size=AKDE_CHUNK):
+    """Draw the estimated density chart of effs_df on a new Figure and save it as output_base_estimated_density_chart.exts.
+    method, report_deviation, densities and chunk_size are passed on to plot_pdf."""
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(5, 4))
+    ax = fig.add_subplot(1, 1, 1)
+
+    handles = plot_pdf(ax, effs_df, {}, symlog=True,
+                       chunk_size=chunk_size,
+                       method=method,
+                       report_deviation=report_deviation,
+                       densities=densities)
+    with pp_profile.stage("layout"):
+        fig.tight_layout(pad=0.4, w_pad=1.5, h_pad=0.5)
+    ax.legend(loc="upper center", handlelength=0.5, labels=handles)
+    save_figure(fig, output_base + output_suffixes['epdf'], exts)
+
+
+def render_box(effs_df, output_base, exts):
+    """Draw the box plot of effs_df on a new Figure and save it as output_base_box_chart.exts."""
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(5, 4))
+    ax = fig.add_subplot(1, 1, 1)
+    boxplot(ax, effs_df)
+    with pp_profile.stage("layout"):
+        fig.tight_layout(pad=0.4, w_pad=1.5, h_pad=0.5)
+    save_figure(fig, output_base + output_suffixes['box'], exts)
+
+
+def render_bins(effs_df, output_base, exts):
+    """Draw the binned chart of effs_df on a new Figure and save it as output_base_binned_chart.exts."""
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(5, 4))
+    ax = fig.add_subplot(1, 1, 1)
+
+    binplot(ax, effs_df, False)
+    L = ax.legend()
+    texts = [m.get_text().replace(r"\%", "%") for m in L.get_texts()]
+    with pp_profile.stage("layout"):
+        fig.tight_layout(pad=0.4, w_pad=1.5, h_pad=0.5)
+    ax.legend(loc="upper center", handlelength=0.5, labels=texts)
+    save_figure(fig, output_base + output_suffixes['bins'], exts)
+
+
+# Renderers for each visualization type, in the order they are produced.
+renderers = {'casc': render_cascade,
+             'epdf': render_epdf,
+             'box': render_box,
+             'bins': render_bins}
+
+
+# Bump when cached intermediates must be recomputed for a reason that neither the
+# sources of ENGINE nor pp_data.py, pp_metrics.py and pp_store.py show.
+engine_version = 1
+
+# The functions and classes of this script that compute the cached efficiencies,
+# densities and cascades; their sources are part of engine_digest.
+ENGINE = ("count_zeros", "app_effs", "harmean", "gaussian", "gaussian_scaling", "gaussian_family", "simpson",
+          "bw_estimate", "akde_batch", "akde_binned", "pp_cascades", "estimate_densities")
+
+
+@functools.lru_cache(maxsize=None)
+def script_version():
+    """Digest of the sources of this script and the modules it uses; part of every cache key for rendered output."""
+    here = Path(__file__).resolve().parent
+    return pp_cache.sources_digest(__file__, here / "pp_data.py", here / "pp_metrics.py", here / "pp_store.py")
+
+
+# rcParams that do not affect saved figures, left out of style_digest
+_UNSTYLED_RC = ("backend", "interactive", "keymap.", "toolbar", "webagg.", "tk.", "macosx.")
+
+
+@functools.lru_cache(maxsize=None)
+def style_digest():
+    """Digest of the matplotlib version and rcParams (as set by matplotlibrc and styles); part of every cache key for rendered output."""
+    import matplotlib
+    rc = sorted((k, v) for k, v in matplotlib.rcParams.items() if not k.startswith(_UNSTYLED_RC))
+    return pp_cache.digest(matplotlib.__version__, rc)
+
+
+@functools.lru_cache(maxsize=None)
+def engine_digest():
+    """Digest of the computations behind cached intermediates (the sources of ENGINE and the modules they use), which unlike rendered output
+    do not depend on styling or the rest of this script."""
+    import inspect
+    here = Path(__file__).resolve().parent
+    return pp_cache.digest(engine_version,
+                           [inspect.getsource(globals()[name]) for name in ENGINE],
+                           pp_cache.sources_digest(here / "pp_data.py", here / "pp_metrics.py", here / "pp_store.py"))
+
+
+def effs_options(options):
+    """The options that determine the efficiencies computed by load_effs, for cache keys."""
+    arch = None
+    if options.arch_efficiency:
+        arch = (options.arch_efficiency, options.arch_scale, options.intensity, pp_cache.file_digest(options.spec))
+    return (options.raw_effs, options.throughput) if arch is None else (options.raw_effs, options.throughput, arch)
+
+
+def load_effs(filename, options, cache=None, input_hash=None):
+    """Compute app_effs of filename as requested by options, reusing a copy from cache (keyed by the input_hash of the file) if possible.
+    Returns the dataframe and its cache key."""
+    key = None
+    if cache is not None:
+        key = pp_cache.digest("effs", input_hash, *effs_options(options), engine_digest())
+        effs_df = cache.get_object(key)
+        if effs_df is not None:
+            return effs_df, key
+    effs_df = app_effs(filename,
+                       raw_effs=options.raw_effs,
+                       throughput=options.throughput,
+                       arch=options.arch_efficiency,
+                       spec=pp_data.read_spec(options.spec) if options.arch_efficiency else None,
+                       arch_scale=options.arch_scale,
+                       intensity=options.intensity)
+    if cache is not None:
+        cache.put_object(key, effs_df)
+    return effs_df, key
+
+
+def render(filename, vis_type, options, loaded=None):
+    """Produce visualization vis_type for filename with options (the parsed command-line arguments plus output_extensions and cache).
+    loaded is a dict of filename to (efficiency dataframe, cache key), to share a load between visualizations of the same file; it is updated.
+    With a cache, outputs are restored from it when the input, flags, format and script are unchanged, and files whose contents are unchanged are not rewritten.
+    The efficiency matrix, densities and cascades are also cached, so they are reused when only the styling changes."""
+    with pp_profile.context(file=filename, vis=vis_type), pp_profile.stage("render"):
+        _render(filename, vis_type, options, loaded)
+
+
+def _render(filename, vis_type, options, loaded):
+    if loaded is None:
+        loaded = {}
+    cache = options.cache
+    exts = options.output_extensions
+    output_base = options.oprefix + pp_data.results_name(filename)
+    if cache is None:
+        if filename not in loaded:
+            loaded[filename] = load_effs(filename, options)
+        render_effs(loaded[filename][0], filename, vis_type, options)
+        return
+
+    input_hash = pp_data.input_digest(filename)
+    # Deviation reports are only printed when densities are actually computed.
+    reporting = vis_type == 'epdf' and options.epdf_deviation
+    method = options.epdf_method if vis_type == 'epdf' else None
+    if vis_type == 'casc' and options.bootstrap > 0:
+        method = (options.bootstrap, options.confidence, options.seed)
+    outputs = [f"{output_base}{output_suffixes[vis_type]}.{x}" for x in exts]
+    keys = [pp_cache.digest("output", input_hash, *effs_options(options), vis_type, x, method, script_version(), style_digest())
+            for x in exts]
+    with pp_profile.stage("cache"):
+        cached = [cache.get(k) for k in keys]
+    if not reporting and all(data is not None for data in cached):
+        for of, data in zip(outputs, cached):
+            try:
+                unchanged = Path(of).read_bytes() == data
+            except OSError:
+                unchanged = False
+            if unchanged:
+                print(f"Unchanged {of}.")
+            else:
+                Path(of).write_bytes(data)
+                print(f"Wrote {of}.")
+        return
+
+    if filename not in loaded:
+        loaded[filename] = load_effs(filename, options, cache, input_hash)
+    effs_df, effs_key = loaded[filename]
+    extra = {}
+    if vis_type == 'epdf':
+        key = pp_cache.digest("densities", effs_key, method)
+        densities = None if reporting else cache.get_object(key)
+        if densities is None:
+            densities = estimate_densities(effs_df, effs_df.columns[1:],
+                                           method=method,
+                                           chunk_size=options.akde_chunk,
+                                           report_deviation=options.epdf_deviation)
+            cache.put_object(key, densities)
+        extra['densities'] = densities
+    elif vis_type == 'casc':
+        key = pp_cache.digest("cascades", effs_key)
+        cascades = cache.get_object(key)
+        if cascades is None:
+            cascades = pp_cascades(effs_df)
+            cache.put_object(key, cascades)
+        extra['cascades'] = cascades
+    render_effs(effs_df, filename, vis_type, options, **extra)
+    for of, k in zip(outputs, keys):
+        cache.put(k, Path(of).read_bytes())
+
+
+def render_effs(effs_df, filename, vis_type, options, **extra):
+    """Produce visualization vis_type for efficiency dataframe effs_df loaded from filename. extra arguments are passed on to the renderer."""
+    output_base = options.oprefix + pp_data.results_name(filename)
+    if vis_type == 'epdf':
+        render_epdf(effs_df, output_base, options.output_extensions,
+                    method=options.epdf_method,
+                    report_deviation=options.epdf_deviation,
+                    chunk_size=options.akde_chunk,
+                    **extra)
+    elif vis_type == 'casc' and options.bootstrap > 0:
+        if 'cascades' not in extra:
+            extra['cascades'] = pp_cascades(effs_df)
+        bands = cascade_bands(extra['cascades'], options.bootstrap, options.confidence, options.seed, options.bootstrap_jobs)
+        render_cascade(effs_df, output_base, options.output_extensions, bands=bands, **extra)
+    else:
+        renderers[vis_type](effs_df, output_base, options.output_extensions, **extra)
+
+
+def render_captured(filename, vis_type, options):
+    """Run render in a worker process, returning everything it printed so that the parent can report it in order,
+    and the stages it profiled if options ask for profiling."""
+    import io
+    import contextlib
+
+    out = io.StringIO()
+    profiler = pp_profile.enable(options.profile_memory) if pp_profile.requested(options) else None
+    with contextlib.redirect_stdout(out):
+        render(filename, vis_type, options)
+    if profiler is not None:
+        pp_profile.disable()
+    return out.getvalue(), profiler.records if profiler is not None else []
+
+
+def init_worker():
+    """Select the non-interactive Agg backend in worker processes."""
+    import matplotlib
+    matplotlib.use('Agg')
+
+
 if __name__ == '__main__':
+    import os
     import sys
     import argparse
 
+    # Output only goes to files, so default to the non-interactive Agg backend before matplotlib is loaded
+    os.environ.setdefault("MPLBACKEND", "Agg")
+
     legal_extensions = set(['png', 'pdf'])
     legal_vis = set(['box', 'bins', 'casc', 'epdf'])
+    legal_akde = ['exact', 'binned']
 
     desc = "Performance portability visualization demonstration"
     parser = argparse.ArgumentParser(description=desc)
@@ -432,6 +1037,29 @@ if __name__ == '__main__':
                         action='store_true',
                         default=False,
                         help='Interpret csv contents throughput numbers.')
+    parser.add_argument("--arch-efficiency",
+                        dest='arch_efficiency',
+                        choices=pp_data.ARCH_PEAKS,
+                        action='store',
+                        default=None,
+                        help='Interpret csv contents as throughput and compute architectural efficiencies against peak bandwidth, FLOPs or the roofline bound of each platform.')
+    parser.add_argument("--spec",
+                        dest='spec',
+                        action='store',
+                        default=str(pp_data.DEFAULT_SPEC),
+                        help='Hardware specification csv file with the peaks for architectural efficiencies.')
+    parser.add_argument("--arch-scale",
+                        dest='arch_scale',
+                        action='store',
+                        type=float,
+                        default=1.0,
+                        help='Multiply csv contents by this to convert them to the units of the peaks (GB/s or TFLOP/s), e.g. 1e-3 for MB/s.')
+    parser.add_argument("--intensity",
+                        dest='intensity',
+                        action='store',
+                        type=float,
+                        default=None,
+                        help='Arithmetic intensity (FLOPs per byte) of the application, for roofline architectural efficiencies.')
     parser.add_argument("-o",
                         "--output-prefix",
                         dest='oprefix',
@@ -452,6 +1080,71 @@ if __name__ == '__main__':
                         action='store',
                         default="box,bins,casc,epdf",
                         help='Visualizations to produce.')
+    parser.add_argument("--epdf-method",
+                        dest='epdf_method',
+                        choices=legal_akde,
+                        action='store',
+                        default="exact",
+                        help='Density estimation for epdf charts: exact, or binned (approximate, for large inputs).')
+    parser.add_argument("--epdf-deviation",
+                        dest='epdf_deviation',
+                        action='store_true',
+                        default=False,
+                        help='With binned density estimation, report max. deviation from the exact estimate.')
+    parser.add_argument("--akde-chunk",
+                        dest='akde_chunk',
+                        action='store',
+                        type=int,
+                        default=AKDE_CHUNK,
+                        help='With exact density estimation, evaluate this many samples per column at once, to bound memory use (0: all at once).')
+    parser.add_argument("--bootstrap",
+                        dest='bootstrap',
+                        action='store',
+                        type=int,
+                        default=0,
+                        help='Shade bootstrap confidence bands (from this many resamples) around the PP lines of cascade charts.')
+    parser.add_argument("--confidence",
+                        dest='confidence',
+                        action='store',
+                        type=float,
+                        default=0.95,
+                        help='Confidence level of the bootstrap bands.')
+    parser.add_argument("--seed",
+                        dest='seed',
+                        action='store',
+                        type=int,
+                        default=0,
+                        help='Random seed of the bootstrap resamples.')
+    parser.add_argument("--bootstrap-jobs",
+                        dest='bootstrap_jobs',
+                        action='store',
+                        type=int,
+                        default=1,
+                        help='Draw the bootstrap resamples of cascade charts in this many worker processes.')
+    parser.add_argument("-j",
+                        "--jobs",
+                        dest='jobs',
+                        action='store',
+                        type=int,
+                        default=1,
+                        help='Render (file, vis type) pairs in this many worker processes.')
+    parser.add_argument("--no-cache",
+                        dest='no_cache',
+                        action='store_true',
+                        default=False,
+                        help='Do not read or write the render cache.')
+    parser.add_argument("--cache-dir",
+                        dest='cache_dir',
+                        action='store',
+                        default=pp_cache.default_cache_dir(),
+                        help='Directory of the render cache.')
+    parser.add_argument("--cache-size",
+                        dest='cache_size',
+                        action='store',
+                        type=float,
+                        default=512.0,
+                        help='Size limit of the render cache in MB; least recently used entries are evicted beyond it.')
+    pp_profile.add_arguments(parser)
     parser.add_argument('csvfiles',
                         metavar='<CSV-FILE>+',
                         nargs=argparse.REMAINDER)
@@ -462,17 +1155,32 @@ if __name__ == '__main__':
         print("Asked to intrepret CSV as both raw eff. & throughput!")
         sys.exit(1)
 
+    if args.arch_efficiency and args.raw_effs:
+        print("Asked to intrepret CSV as both raw eff. & architectural efficiency!")
+        sys.exit(1)
+
+    if args.arch_efficiency == 'roofline' and args.intensity is None:
+        print("Roofline architectural efficiency needs --intensity.")
+        sys.exit(1)
+
     if len(args.csvfiles) == 0:
         print("No input files specified.")
         sys.exit(1)
+    for filename in args.csvfiles:
+        pp_data.check_input(filename)
 
-    output_extensions = set()
+    output_extensions = []
     for t in args.ofile_fmt.split(','):
         if t.lower() in legal_extensions:
-            if t in output_extensions:
-                printf("Warning: duplicate output extension found. Skipping.")
+            if t.lower() in output_extensions:
+                print("Warning: duplicate output extension found. Skipping.")
             else:
-                output_extensions.add(t)
+                output_extensions.append(t.lower())
+    args.output_extensions = output_extensions
+
+    args.cache = None
+    if not args.no_cache:
+        args.cache = pp_cache.Cache(args.cache_dir, int(args.cache_size * 1024 * 1024))
 
     if len(output_extensions) == 0:
         print("Warning: no output extensions found; no output will be written")
@@ -480,82 +1188,32 @@ if __name__ == '__main__':
     vis_types = set()
     for vt in args.vis_types.split(','):
         if vt.lower() in legal_vis:
-            if vt in vis_types:
+            if vt.lower() in vis_types:
                 print("Warning: duplicate vis type found. Skipping.")
             else:
-                vis_types.add(vt)
-
-    for filename in args.csvfiles:
-
-        effs_df = app_effs(filename,
-                           raw_effs=args.raw_effs,
-                           throughput=args.throughput)
-
-        plats = effs_df[effs_df.columns[0]]
-
-        output_base = args.oprefix + Path(filename).stem
-
-        if 'casc' in vis_types:
-
-            # Eff. cascade
-
-            plat_colors = {}
-            plat_handles = []
-            plat_cmap = plt.get_cmap("summer")
-            for i, p in enumerate(plats):
-                plat_colors[p] = plat_cmap(float(i) / (len(plats) - 1))
-                plat_handles.append(mpatches.Patch(color=plat_colors[p],
-                                                   label=p))
-
-            fig = plt.figure(figsize=(4, 4))
-            handles = {}
-            gs = fig.add_gridspec(1, 1)
-            plot_cascade(fig, gs, [0, 0], effs_df, handles,
-                         app_colors=None, plat_colors=plat_colors)
-
-            handle_names, handle_lists = zip(*handles.items())
-            fig.legend(handle_lists,
-                       handle_names,
-                       loc='upper left',
-                       bbox_to_anchor=(1.0, 1.0),
-                       ncol=1,
-                       handlelength=2.0)
-            fig.legend(handles=plat_handles,
-                       loc='lower left',
-                       bbox_to_anchor=(1.0, 0.1),
-                       ncol=3,
-                       handlelength=1.0)
-            plt.tight_layout(pad=0.4, w_pad=0.5, h_pad=1.0)
-            save_and_report(f"{output_base}_eff_cascade", output_extensions)
-
-        if 'epdf' in vis_types:
-            # PDF
-            fig = plt.figure(figsize=(5, 4))
-            ax = fig.add_subplot(1, 1, 1)
-
-            handles = plot_pdf(ax, effs_df, {}, symlog=True)
-            plt.tight_layout(pad=0.4, w_pad=1.5, h_pad=0.5)
-            plt.legend(loc="upper center", handlelength=0.5, labels=handles)
-            save_and_report(f"{output_base}_estimated_density_chart",
-                            output_extensions)
-
-        if 'box' in vis_types:
-            # Box plot
-            fig = plt.figure(figsize=(5, 4))
-            ax = fig.add_subplot(1, 1, 1)
-            boxplot(ax, effs_df)
-            plt.tight_layout(pad=0.4, w_pad=1.5, h_pad=0.5)
-            save_and_report(f"{output_base}_box_chart", output_extensions)
-
-        if 'bins' in vis_types:
-            # Bins
-
-            fig = plt.figure(figsize=(5, 4))
-            ax = fig.add_subplot(1, 1, 1)
-
-            binplot(ax, effs_df, False)
-            L = plt.legend()
-            texts = [m.get_text().replace(r"\%", "%") for m in L.get_texts()]
-            plt.tight_layout(pad=0.4, w_pad=1.5, h_pad=0.5)
-            plt.legend(loc="upper center", handlelength=0.5, labels=texts)
-            save_and_report(f"{output_base}_binned_chart", output_extensions)
+                vis_types.add(vt.lower())
+    vis_types = [vt for vt in renderers if vt in vis_types]
+
+    with pp_profile.session(args) as profiler:
+        if args.jobs > 1:
+            import concurrent.futures
+
+            # Render each (file, vis type) pair in a worker; report in submission order.
+            with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs, initializer=init_worker) as pool:
+                futures = [pool.submit(render_captured, filename, vt, args)
+                           for filename in args.csvfiles
+                           for vt in vis_types]
+                for future in futures:
+                    out, records = future.result()
+                    sys.stdout.write(out)
+                    if profiler is not None:
+                        profiler.records.extend(records)
+        else:
+            for filename in args.csvfiles:
+                loaded = {}
+                for vt in vis_types:
+                    render(filename, vt, args, loaded)
+
+        if args.cache is not None:
+            with pp_profile.stage("evict"):
+                args.cache.evict()
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# Copyright (c) 2020 Performance Portability authors
+# SPDX-License-Identifier: MIT
+
+import contextlib
+import fnmatch
+import io
+import os
+import signal
+import time
+from pathlib import Path
+
+import numpy as np
+
+import pp_data
+import pp_metrics
+import pp_vis
+
+
+# One long-running process polls the results files and keeps the efficiency
+# matrix of each in memory. When a file changes, its matrix is recomputed
+# here and its outputs are rendered by a fixed pool of worker processes,
+# which keep matplotlib and its font cache loaded between renders. A file
+# is picked up once it has not changed for the debounce interval, so a
+# burst of writes becomes one render; a file that changes while it is
+# being rendered is rendered again once that finishes.
+
+# Outputs besides the pp_vis visualization types, in the order they are produced
+EXTRA_OUTPUTS = ['heatmap', 'averages']
+
+
+def render_output(filename, kind, effs_df, options):
+    """Produce output kind (a pp_vis visualization type, or one of EXTRA_OUTPUTS) of efficiency dataframe effs_df loaded from filename.
+    Returns everything printed, for the watcher to report."""
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        output_base = options.oprefix + pp_data.results_name(filename)
+        if kind == 'heatmap':
+            import heatmap
+
+            # Percent, with unsupported platforms shown as missing rather than 0%
+            effs = effs_df[effs_df.columns[1:]].to_numpy(dtype=float)
+            values = np.where(effs > 0, 100.0 * effs, np.nan)
+            series = [str(s) for s in effs_df[effs_df.columns[0]]]
+            headings = [str(h) for h in effs_df.columns[1:]]
+            labels = heatmap.cell_labels(values, percent=True)
+            for x in options.output_extensions:
+                for of in heatmap.render(series, headings, values, f"{output_base}_heatmap.{x}", labels, True):
+                    print(f"Wrote {of}.")
+        elif kind == 'averages':
+            of = f"{output_base}_averages.tex"
+            results = pp_metrics.averages_table(effs_df[effs_df.columns[1:]] * 100.0)
+            results.to_latex(of, float_format="%.2f")
+            print(f"Wrote {of}.")
+        else:
+            pp_vis.render_effs(effs_df, filename, kind, options)
+    return out.getvalue()
+
+
+def init_worker():
+    """Set up a worker process: Ctrl-C is left to the watcher, which stops the pool."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    pp_vis.init_worker()
+
+
+class Watcher:
+    """Watches results files and renders their outputs when their contents change."""
+
+    def __init__(self, paths, options, pattern="*.csv", debounce=1.0, exclude=("spec.csv",)):
+        """paths are results files or directories, of which files matching pattern (except those in exclude) are watched.
+        options are those of pp_vis (see main) plus kinds, the outputs to produce, and throughput and raw_effs,
+        lists of file name patterns of throughput and raw efficiency results."""
+        self.paths = [Path(p) for p in paths]
+        self.options = options
+        self.pattern = pattern
+        self.debounce = debounce
+        self.exclude = set(exclude)
+        # Per file: last (mtime, size) seen, when it last changed (until picked up),
+        # digest and efficiency dataframe of the contents last loaded, and outputs being rendered
+        self.stats = {}
+        self.changed = {}
+        self.digests = {}
+        self.effs = {}
+        self.running = {}
+
+    def files(self):
+        """The results files currently watched."""
+        res = []
+        for p in self.paths:
+            if p.is_dir():
+                res += sorted(f for f in p.glob(self.pattern) if f.name not in self.exclude)
+            elif p.exists():
+                res.append(p)
+        return [str(f) for f in res]
+
+    def poll(self, now):
+        """Note the files that appeared or changed since the last poll, and forget those that are gone."""
+        present = set()
+        for f in self.files():
+            try:
+                st = os.stat(f)
+            except OSError:
+                continue
+            present.add(f)
+            stat = (st.st_mtime_ns, st.st_size)
+            if self.stats.get(f) != stat:
+                self.stats[f] = stat
+                self.changed[f] = now
+        for f in set(self.stats) - present:
+            for state in (self.stats, self.changed, self.digests, self.effs):
+                state.pop(f, None)
+
+    def ready(self, now):
+        """Files that have settled for the debounce interval and are not being rendered, oldest change first."""
+        return sorted((f for f, t in self.changed.items() if now - t >= self.debounce and f not in self.running),
+                      key=lambda f: self.changed[f])
+
+    def _matches(self, filename, patterns):
+        return any(fnmatch.fnmatch(Path(filename).name, p) for p in patterns)
+
+    def load(self, filename):
+        """Recompute the efficiency dataframe of filename if its contents changed. Returns it, or None if unchanged."""
+        digest = pp_data.input_digest(filename)
+        if self.digests.get(filename) == digest:
+            return None
+        effs_df = pp_vis.app_effs(filename,
+                                  raw_effs=self._matches(filename, self.options.raw_effs),
+                                  throughput=self._matches(filename, self.options.throughput))
+        self.digests[filename] = digest
+        self.effs[filename] = effs_df
+        return effs_df
+
+    def submit(self, pool, filename):
+        """Load filename and submit the rendering of its outputs to pool, if its contents changed."""
+        del self.changed[filename]
+        try:
+            effs_df = self.load(filename)
+        except Exception as e:
+            # Most likely a file caught half-written; the next write triggers another try
+            print(f"Could not load {filename}: {e}")
+            return
+        if effs_df is None:
+            return
+        self.running[filename] = [pool.submit(render_output, filename, kind, effs_df, self.options)
+                                  for kind in self.options.kinds]
+
+    def collect(self):
+        """Report the outputs of files whose rendering has finished, in order."""
+        for filename, futures in list(self.running.items()):
+            if not all(f.done() for f in futures):
+                continue
+            del self.running[filename]
+            for future in futures:
+                try:
+                    print(future.result(), end="")
+                except Exception as e:
+                    print(f"Could not render {filename}: {e}")
+                    # Render again on the next change, even if its contents are the same as now
+                    self.digests.pop(filename, None)
+
+    def step(self, pool, max_pending, now=None):
+        """Poll once, report finished renders, and submit settled files while fewer than max_pending files are being rendered."""
+        now = time.monotonic() if now is None else now
+        self.poll(now)
+        self.collect()
+        for filename in self.ready(now):
+            if len(self.running) >= max_pending:
+                break
+            self.submit(pool, filename)
+
+    def idle(self):
+        """Whether no file is waiting to be rendered or being rendered."""
+        return not self.changed and not self.running
+
+
+def main():
+    import sys
+    import argparse
+    import concurrent.futures
+
+    legal_extensions = ['png', 'pdf']
+    legal_kinds = list(pp_vis.renderers) + EXTRA_OUTPUTS
+
+    desc = "Watch results files and re-render their figures and tables when they change"
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument("-r",
+                        "--raw-effs",
+                        dest='raw_effs',
+                        action='append',
+                        default=[],
+                        metavar='PATTERN',
+                        help='Interpret the contents of files whose names match PATTERN (e.g. "synthetic*") as raw efficiencies; may be repeated.')
+    parser.add_argument("-t",
+                        "--throughput",
+                        dest='throughput',
+                        action='append',
+                        default=[],
+                        metavar='PATTERN',
+                        help='Interpret the contents of files whose names match PATTERN (e.g. "babelstream*") as throughput; may be repeated.')
+    parser.add_argument("-o",
+                        "--output-prefix",
+                        dest='oprefix',
+                        action='store',
+                        default="./",
+                        help='Write output files with a specific prefix')
+    parser.add_argument("-F",
+                        "--ofile-format",
+                        dest='ofile_fmt',
+                        metavar=f'[{"|".join(legal_extensions)}]+',
+                        action='store',
+                        default="pdf",
+                        help='Type of output files to produce.')
+    parser.add_argument("-V",
+                        "--outputs",
+                        dest='kinds',
+                        metavar=f'[{"|".join(legal_kinds)}]+',
+                        action='store',
+                        default=",".join(legal_kinds),
+                        help='Figures and tables to produce.')
+    parser.add_argument("--epdf-method",
+                        dest='epdf_method',
+                        choices=['exact', 'binned'],
+                        action='store',
+                        default="exact",
+                        help='Density estimation for epdf charts: exact, or binned (approximate, for large inputs).')
+    parser.add_argument("--bootstrap",
+                        dest='bootstrap',
+                        action='store',
+                        type=int,
+                        default=0,
+                        help='Shade bootstrap confidence bands (from this many resamples) around the PP lines of cascade charts.')
+    parser.add_argument("--confidence",
+                        dest='confidence',
+                        action='store',
+                        type=float,
+                        default=0.95,
+                        help='Confidence level of the bootstrap bands.')
+    parser.add_argument("--seed",
+                        dest='seed',
+                        action='store',
+                        type=int,
+                        default=0,
+                        help='Random seed of the bootstrap resamples.')
+    parser.add_argument("-j",
+                        "--jobs",
+                        dest='jobs',
+                        action='store',
+                        type=int,
+                        default=2,
+                        help='Render in this many worker processes.')
+    parser.add_argument("--pattern",
+                        dest='pattern',
+                        action='store',
+                        default="*.csv",
+                        help='Watch the files matching this pattern in directories.')
+    parser.add_argument("--interval",
+                        dest='interval',
+                        action='store',
+                        type=float,
+                        default=0.5,
+                        help='Poll the files every this many seconds.')
+    parser.add_argument("--debounce",
+                        dest='debounce',
+                        action='store',
+                        type=float,
+                        default=1.0,
+                        help='Render a file once it has not changed for this many seconds.')
+    parser.add_argument("--once",
+                        dest='once',
+                        action='store_true',
+                        default=False,
+                        help='Render every file once and exit, instead of watching.')
+    parser.add_argument('paths',
+                        metavar='<CSV-FILE-OR-DIRECTORY>+',
+                        nargs=argparse.REMAINDER)
+
+    args = parser.parse_args()
+
+    if len(args.paths) == 0:
+        print("No input files or directories specified.")
+        sys.exit(1)
+
+    args.output_extensions = [x for x in legal_extensions if x in args.ofile_fmt.lower().split(',')]
+    kinds = args.kinds.lower().split(',')
+    unknown = [k for k in kinds if k not in legal_kinds]
+    if unknown:
+        print(f"Unknown outputs: {', '.join(unknown)}")
+        sys.exit(1)
+    args.kinds = [k for k in legal_kinds if k in kinds]
+    args.epdf_deviation = False
+    args.bootstrap_jobs = 1
+    args.akde_chunk = pp_vis.AKDE_CHUNK
+
+    # Output only goes to files; workers inherit this before they load matplotlib
+    os.environ.setdefault("MPLBACKEND", "Agg")
+
+    watcher = Watcher(args.paths, args, args.pattern, 0.0 if args.once else args.debounce)
+    max_pending = 2 * max(args.jobs, 1)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max(args.jobs, 1), initializer=init_worker) as pool:
+        try:
+            if not args.once:
+                print(f"Watching {', '.join(args.paths)}; press Ctrl-C to stop.")
+            while True:
+                watcher.step(pool, max_pending)
+                if args.once and watcher.idle():
+                    break
+                time.sleep(0.05 if args.once else args.interval)
+        except KeyboardInterrupt:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# Copyright (c) 2020 Performance Portability authors
+# SPDX-License-Identifier: MIT
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import pp_data
+import pp_vis
+
+DATA = Path(__file__).resolve().parent.parent / "data"
+RESULTS = sorted(str(f) for f in DATA.glob("*.csv") if f.name != "spec.csv")
+
+
+# The regex-separated python-engine loaders of the original pp_vis.py and
+# averages.py, kept as the reference for pp_data.read_results and
+# pp_data.app_efficiencies
+
+
+def app_effs_reference(filename, raw_effs=False, raw_effs_scaling=1 / 100.0, throughput=False):
+    import pandas
+
+    df = pandas.read_csv(filename,
+                         sep=r"\s*[,]\s*",
+                         na_values=[r'x', r'X'],
+                         skipinitialspace=True,
+                         engine='python')
+    if not raw_effs:
+        if throughput:
+            df[df.columns[1:]] = df[df.columns[1:]].apply(
+                lambda r: r / r.max(), axis=1)
+        else:
+            df[df.columns[1:]] = df[df.columns[1:]].apply(
+                lambda r: r.min() / r, axis=1)
+    else:
+        # applymap in the original, which pandas 3 removed
+        df[df.columns[1:]] = df[df.columns[1:]].map(
+            lambda x: x * raw_effs_scaling)
+    df = df.fillna(0)
+    harmean_vals = df[df.columns[1:]].apply(pp_vis.harmean, axis=0)
+    zeros = df[df.columns[1:]].apply(pp_vis.count_zeros, axis=0)
+    vals = pandas.DataFrame([harmean_vals, zeros]).sort_values(
+        by=0, axis=1).sort_values(by=1, axis=1, ascending=False)
+    return df[df.columns.tolist()[:1] + vals.columns.tolist()]
+
+
+def read_results_reference(filename):
+    import pandas
+
+    data = pandas.read_csv(
+        filename,
+        skipinitialspace=True,
+        # The original also passed sep=r',\s+', which delimiter overrode and pandas 2 rejects
+        delimiter=',',
+        na_values='X')
+    data = data.replace(r'^X', np.nan, regex=True)
+    data[list(data.columns[1:])] = data[list(data.columns[1:])].apply(pandas.to_numeric)
+    return data
+
+
+@pytest.mark.parametrize("filename", RESULTS, ids=lambda f: Path(f).name)
+@pytest.mark.parametrize("raw_effs, throughput", [(True, False), (False, False), (False, True)],
+                         ids=["raw", "time", "throughput"])
+def test_app_effs(filename, raw_effs, throughput):
+    import pandas
+
+    expected = app_effs_reference(filename, raw_effs=raw_effs, throughput=throughput)
+    pandas.testing.assert_frame_equal(pp_vis.app_effs(filename, raw_effs=raw_effs, throughput=throughput), expected)
+
+
+@pytest.mark.parametrize("filename", RESULTS, ids=lambda f: Path(f).name)
+def test_read_results(filename):
+    import pandas
+
+    pandas.testing.assert_frame_equal(pp_data.read_results(filename), read_results_reference(filename))
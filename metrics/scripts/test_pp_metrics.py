@@ -0,0 +1,56 @@
+# Copyright (c) 2020 Performance Portability authors
+# SPDX-License-Identifier: MIT
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import pp_data
+import pp_metrics
+
+DATA = Path(__file__).resolve().parent.parent / "data"
+RESULTS = sorted(str(f) for f in DATA.glob("*.csv") if f.name != "spec.csv")
+
+
+# The O(n^2) Lam harmonic standard deviation of the original consistency.py,
+# kept as the reference for pp_metrics.harstdev_lam
+
+
+def hbar_reference(x, i):
+    s = sum((1.0 / v) for (c, v) in enumerate(x) if c != i)
+    return (len(x) - 1) / s
+
+
+def harvar_reference(x):
+    hbararr = np.array([hbar_reference(x, i) for i in range(len(x))])
+    hbarbar = sum(hbararr) / len(x)
+    return (len(x) - 1) * sum((hbararr - hbarbar)**2.0)
+
+
+def harstdev_lam_reference(n):
+    if 0 in n:
+        return np.nan
+    return harvar_reference(n)**0.5
+
+
+@pytest.mark.parametrize("filename", RESULTS, ids=lambda f: Path(f).name)
+@pytest.mark.parametrize("calc_efficiency, input_is_throughput",
+                         [(False, False), (True, False), (True, True)],
+                         ids=["raw", "time", "throughput"])
+def test_harstdev_lam(filename, calc_efficiency, input_is_throughput):
+    effs = pp_metrics.efficiencies(pp_data.read_results(filename), calc_efficiency, input_is_throughput)
+    effs = effs[effs.columns[1:]]
+    expected = [harstdev_lam_reference(list(effs[col])) for col in effs.columns]
+
+    # Every column at once, and one column at a time
+    assert np.allclose(pp_metrics.harstdev_lam(effs.to_numpy(dtype=float)), expected, equal_nan=True)
+    for col, e in zip(effs.columns, expected):
+        assert np.allclose(pp_metrics.harstdev_lam(effs[col].to_numpy(dtype=float)), e, equal_nan=True)
+
+    # Most columns have unsupported platforms, so also compare over the supported ones
+    for col in effs.columns:
+        supported = effs[col].to_numpy(dtype=float)
+        supported = supported[supported > 0]
+        if len(supported) > 1:
+            assert np.allclose(pp_metrics.harstdev_lam(supported), harstdev_lam_reference(list(supported)))
@@ -0,0 +1,70 @@
+# Copyright (c) 2020 Performance Portability authors
+# SPDX-License-Identifier: MIT
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import pp_data
+import pp_metrics
+import pp_online
+import pp_vis
+
+DATA = Path(__file__).resolve().parent.parent / "data"
+
+
+def batch(results, throughput):
+    # Efficiencies, PP and cascades of a results snapshot, computed from scratch
+    effs = pp_data.app_efficiencies(results, throughput=throughput)
+    pp = pp_metrics.pp(effs[effs.columns[1:]].fillna(0).to_numpy(dtype=float))
+    return effs, np.atleast_1d(pp), pp_vis.pp_cascades(effs.fillna(0))
+
+
+@pytest.mark.parametrize("throughput", [False, True], ids=["time", "throughput"])
+@pytest.mark.parametrize("resync", [1024, 3])
+def test_online_pp(throughput, resync):
+    import pandas
+
+    rng = np.random.default_rng(17)
+    platforms = [f"p{i}" for i in range(8)]
+    models = [f"m{i}" for i in range(5)]
+    acc = pp_online.OnlinePP(throughput=throughput, resync=resync)
+    for step in range(400):
+        platform = platforms[rng.integers(len(platforms))]
+        model = models[rng.integers(len(models))]
+        # Few distinct values, so that best results and cascade positions tie
+        value = float(rng.choice([1.0, 2.0, 2.5, 4.0, 8.0])) * float(rng.choice([1.0, 1.0, 1.1]))
+        action = rng.random()
+        if action < 0.15:
+            acc.set(platform, model, None)
+        elif action < 0.5:
+            acc.add(platform, model, value)
+        else:
+            acc.set(platform, model, value)
+
+        results = acc.results()
+        effs, pp, cascades = batch(results, throughput)
+        pandas.testing.assert_frame_equal(acc.efficiencies(), effs)
+        assert np.allclose(acc.pp().to_numpy(), pp, rtol=1e-12, atol=0)
+        online = acc.cascades()
+        assert list(online) == list(cascades)
+        for model in cascades:
+            o_effs, o_pps, o_plats = online[model]
+            e_effs, e_pps, e_plats = cascades[model]
+            assert list(o_effs) == list(e_effs)
+            assert list(o_plats) == list(e_plats)
+            assert np.allclose(o_pps, e_pps, rtol=1e-12, atol=0)
+
+
+def test_from_results():
+    import pandas
+
+    for filename in [DATA / "babelstream.csv", DATA / "minifmm.csv"]:
+        results = pp_data.read_results(filename)
+        for throughput in (False, True):
+            acc = pp_online.OnlinePP.from_results(results, throughput=throughput)
+            effs, pp, cascades = batch(acc.results(), throughput)
+            pandas.testing.assert_frame_equal(acc.results(), results, check_dtype=False)
+            pandas.testing.assert_frame_equal(acc.efficiencies(), effs)
+            assert np.allclose(acc.pp().to_numpy(), pp, rtol=1e-12, atol=0)
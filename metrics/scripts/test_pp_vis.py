@@ -0,0 +1,158 @@
+# Copyright (c) 2020 Performance Portability authors
+# SPDX-License-Identifier: MIT
+
+import importlib.util
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import pp_vis
+
+HERE = Path(__file__).resolve().parent
+
+
+def ragged_sets(seed):
+    # Sample sets of different lengths, including ties, the grid ends, a single sample and
+    # a narrow set whose density vanishes at the grid point that padding is placed on
+    rng = np.random.default_rng(seed)
+    sets = [rng.beta(2.0, 5.0, n) for n in (40, 3, 17, 100)]
+    sets.append(np.clip(rng.normal(0.9, 0.005, 20), 0, 1))
+    sets.append(np.array([0.0, 0.25, 0.25, 0.25, 1.0, 1.0]))
+    sets.append(np.array([0.5]))
+    return [sorted(s) for s in sets]
+
+
+@pytest.mark.parametrize("chunk_size", [None, 1, 7, 64, pp_vis.AKDE_CHUNK])
+def test_akde_batch(chunk_size):
+    x = np.linspace(0, 1, 200)
+    sets = ragged_sets(1)
+    batch = pp_vis.akde_batch(x, sets, 0.05, chunk_size=chunk_size).pdf_series(4)
+    for i, s in enumerate(sets):
+        expected = pp_vis.akde(x, s, 0.05).pdf_series(4)
+        for step, e in zip(batch, expected):
+            assert np.allclose(step[i], e, rtol=1e-10, atol=1e-12)
+
+
+# The O(n^2) efficiency cascade of the original pp_vis.py, kept as the
+# reference for pp_vis.pp_cascades
+
+
+def harmean_reference(vals):
+    try:
+        s = sum((1.0 / x for x in vals))
+    except ZeroDivisionError:
+        return 0.0
+    return len(vals) / s
+
+
+def pp_cdf_raw_effs_reference(theapp):
+    valid_effs = [x for x in theapp if x[1] > 0 and x[1] != float("inf")]
+    sorted_effs = sorted(valid_effs, key=lambda x: x[1], reverse=True)
+    res = []
+    for i in range(len(sorted_effs)):
+        res.append((sorted_effs[i][1], harmean_reference([x[1] for x in sorted_effs[:i + 1]]), sorted_effs[i][0]))
+    return res
+
+
+def test_pp_cascades():
+    import pandas
+
+    rng = np.random.default_rng(3)
+    n = 60
+    effs = {
+        "random": rng.random(n),
+        # Ties, in several groups, so that the order of equal efficiencies matters
+        "ties": rng.choice([0.2, 0.5, 0.5001, 1.0], n),
+        "unsupported": np.where(rng.random(n) < 0.3, 0.0, rng.random(n)),
+        "inf": np.where(rng.random(n) < 0.1, np.inf, rng.choice([0.3, 0.6, 0.9], n)),
+        "none": np.zeros(n),
+        "one": np.where(np.arange(n) == 7, 0.4, 0.0),
+    }
+    df = pandas.DataFrame({"Platform": [f"p{i}" for i in range(n)], **effs})
+    cascades = pp_vis.pp_cascades(df)
+    for name in effs:
+        expected = pp_cdf_raw_effs_reference(list(zip(df["Platform"], df[name])))
+        got_effs, got_pps, got_plats = cascades[name]
+        assert len(got_effs) == len(expected)
+        if expected:
+            e_effs, e_pps, e_plats = zip(*expected)
+            assert list(got_effs) == list(e_effs)
+            assert list(got_pps) == list(e_pps)
+            assert list(got_plats) == list(e_plats)
+        # The running-sum cascade of pp_cdf_raw_effs is the same
+        assert pp_vis.pp_cdf_raw_effs(list(zip(df["Platform"], df[name]))) == expected
+
+
+# The per-sample histogram of the original pp_vis.py, kept as the reference
+# for pp_vis.histogram_columns and pp_vis.bin_counts
+
+
+def histogram_reference(bins, data):
+    z = np.zeros(len(bins) - 1)
+    for d in data:
+        if d < bins[0]:
+            continue
+        for i, b in enumerate(bins[1:]):
+            if d <= b:
+                z[i] += 1.0
+                break
+    return z
+
+
+def test_bin_counts():
+    import pandas
+
+    bins = pp_vis.efficiency_bins()
+    rng = np.random.default_rng(8)
+    n = 200
+    # Values on every bin edge, just either side of them, unsupported (0), outside the bins and NaN
+    edges = np.concatenate([bins, np.nextafter(bins, -np.inf), np.nextafter(bins, np.inf)])
+    effs = {
+        "random": rng.random(n),
+        "edges": rng.choice(edges, n),
+        "unsupported": np.where(rng.random(n) < 0.3, 0.0, rng.random(n)),
+        "outside": rng.choice([-0.5, 1.5, np.inf, np.nan, 0.5], n),
+    }
+    df = pandas.DataFrame({"Platform": [f"p{i}" for i in range(n)], **effs})
+    counts = pp_vis.bin_counts(df)
+    for name, vals in effs.items():
+        expected = histogram_reference(bins, vals)
+        assert list(counts[name]) == list(expected)
+        assert list(pp_vis.histogram(bins, vals)) == list(expected)
+
+
+def load_copy(monkeypatch, directory, name, edit=None):
+    # Import a copy of pp_vis.py (and the modules engine_digest reads) from directory, with edit applied to its source
+    for module in ("pp_data.py", "pp_metrics.py", "pp_store.py"):
+        shutil.copy(HERE / module, directory / module)
+    source = (HERE / "pp_vis.py").read_text()
+    if edit is not None:
+        assert edit[0] in source
+        source = source.replace(*edit)
+    (directory / "pp_vis.py").write_text(source)
+    spec = importlib.util.spec_from_file_location(name, directory / "pp_vis.py")
+    module = importlib.util.module_from_spec(spec)
+    # inspect.getsource finds the source of classes through sys.modules
+    monkeypatch.setitem(sys.modules, name, module)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.mark.parametrize("edit, engine", [
+    (("        return pdf\n\n    def pdf(self):", "        return pdf + 0.0\n\n    def pdf(self):"), True),
+    (("order = np.argsort(", "order = np.argsort( "), True),
+    (("    return -2.0 / (erf(", "    return -2.00 / (erf("), True),
+    (("    ax.set(ylabel='Efficiency')", "    ax.set(ylabel='Efficiencies')"), False),
+], ids=["akde_batch", "pp_cascades", "gaussian_scaling", "boxplot"])
+def test_engine_digest(tmp_path, monkeypatch, edit, engine):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    original = load_copy(monkeypatch, tmp_path / "a", "pp_vis_original")
+    edited = load_copy(monkeypatch, tmp_path / "b", "pp_vis_edited", edit)
+    assert original.engine_digest() == pp_vis.engine_digest()
+    # Rendered output is keyed on the whole script, cached intermediates only on the engine
+    assert original.script_version() != edited.script_version()
+    assert (original.engine_digest() != edited.engine_digest()) == engine